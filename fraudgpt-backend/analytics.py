@@ -0,0 +1,180 @@
+import math
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+SEVERITIES = ("LOW", "MEDIUM", "HIGH", "CRITICAL")
+SCORE_HISTOGRAM_BINS = 10  # Equal-width fraud score bins over [0, 1]
+
+# (name, bucket width in seconds, number of buckets)
+DEFAULT_WINDOWS = (
+    ("1m", 1, 60),
+    ("1h", 60, 60),
+    ("24h", 3600, 24),
+)
+
+
+class QuantileSketch:
+    """Mergeable quantile sketch with bounded relative error (DDSketch-style log buckets).
+
+    Positive values are counted in buckets whose bounds grow geometrically by
+    ``gamma``, so any quantile is returned within ``relative_accuracy`` of the
+    true value. Values <= 0 share a single zero bucket, and NaN or infinite
+    values are skipped. Adding is O(1) and merging two sketches adds their
+    bucket counts.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value: float):
+        if not math.isfinite(value):
+            return
+        self.count += 1
+        if value <= 0:
+            self.zero_count += 1
+            return
+        key = math.ceil(math.log(value) / self.log_gamma)
+        self.buckets[key] = self.buckets.get(key, 0) + 1
+
+    def merge(self, other: "QuantileSketch"):
+        self.count += other.count
+        self.zero_count += other.zero_count
+        for key, n in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + n
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if rank < seen:
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+
+class AnalyticsBucket:
+    """Aggregates for the transactions scored during one time slot."""
+    __slots__ = ('epoch', 'count', 'flagged', 'score_histogram', 'severity_counts', 'hourly_fraud', 'amounts')
+
+    def __init__(self, epoch: int):
+        self.epoch = epoch
+        self.count = 0
+        self.flagged = 0
+        self.score_histogram = [0] * SCORE_HISTOGRAM_BINS
+        self.severity_counts = dict.fromkeys(SEVERITIES, 0)
+        self.hourly_fraud = [0] * 24
+        self.amounts = QuantileSketch()
+
+
+class RollingWindow:
+    """Ring buffer of time buckets covering the last ``width * n_buckets`` seconds."""
+
+    def __init__(self, width: int, n_buckets: int):
+        self.width = width
+        self.n_buckets = n_buckets
+        self.buckets: List[Optional[AnalyticsBucket]] = [None] * n_buckets
+
+    def bucket_for(self, now: float) -> AnalyticsBucket:
+        epoch = int(now // self.width)
+        slot = epoch % self.n_buckets
+        bucket = self.buckets[slot]
+        if bucket is None or bucket.epoch != epoch:
+            bucket = self.buckets[slot] = AnalyticsBucket(epoch)
+        return bucket
+
+    def live_buckets(self, now: float) -> List[AnalyticsBucket]:
+        oldest = int(now // self.width) - self.n_buckets
+        return [b for b in self.buckets if b is not None and b.epoch > oldest]
+
+
+class RollingAnalytics:
+    """Sliding-window fraud analytics with O(1) updates per scored transaction."""
+
+    def __init__(self, windows: Tuple[Tuple[str, int, int], ...] = DEFAULT_WINDOWS):
+        self.windows = {name: RollingWindow(width, n) for name, width, n in windows}
+
+    def record(self, fraud_score: float, is_flagged: bool, severity: str, hour_of_day: int, amount: float,
+               now: Optional[float] = None):
+        now = time.time() if now is None else now
+        score_bin = min(max(int(fraud_score * SCORE_HISTOGRAM_BINS), 0), SCORE_HISTOGRAM_BINS - 1)
+        for window in self.windows.values():
+            bucket = window.bucket_for(now)
+            bucket.count += 1
+            bucket.score_histogram[score_bin] += 1
+            bucket.amounts.add(amount)
+            if severity in bucket.severity_counts:
+                bucket.severity_counts[severity] += 1
+            if is_flagged:
+                bucket.flagged += 1
+                if 0 <= hour_of_day < 24:
+                    bucket.hourly_fraud[hour_of_day] += 1
+
+    def window_summary(self, name: str, now: Optional[float] = None) -> Dict[str, Any]:
+        now = time.time() if now is None else now
+        count = flagged = 0
+        score_histogram = [0] * SCORE_HISTOGRAM_BINS
+        severity_counts = dict.fromkeys(SEVERITIES, 0)
+        hourly_fraud = [0] * 24
+        amounts = QuantileSketch()
+        for bucket in self.windows[name].live_buckets(now):
+            count += bucket.count
+            flagged += bucket.flagged
+            for i, n in enumerate(bucket.score_histogram):
+                score_histogram[i] += n
+            for severity, n in bucket.severity_counts.items():
+                severity_counts[severity] += n
+            for hour, n in enumerate(bucket.hourly_fraud):
+                hourly_fraud[hour] += n
+            amounts.merge(bucket.amounts)
+
+        def percentile(q: float) -> Optional[float]:
+            value = amounts.quantile(q)
+            return round(value, 2) if value is not None else None
+
+        return {
+            "count": count,
+            "flagged": flagged,
+            "fraud_rate": round(flagged / count, 4) if count else 0.0,
+            "score_histogram": score_histogram,
+            "severity_counts": severity_counts,
+            "hourly_fraud": {str(hour): n for hour, n in enumerate(hourly_fraud)},
+            "amount_percentiles": {"p50": percentile(0.5), "p90": percentile(0.9), "p99": percentile(0.99)},
+        }
+
+    def snapshot(self, now: Optional[float] = None) -> Dict[str, Any]:
+        """Summaries for every window; the top-level hourly/severity counts cover the last 24h."""
+        now = time.time() if now is None else now
+        windows = {name: self.window_summary(name, now) for name in self.windows}
+        longest = windows[list(self.windows)[-1]]
+        return {
+            "hourly_fraud": longest["hourly_fraud"],
+            "severity_counts": longest["severity_counts"],
+            "windows": windows,
+        }
+
+
+def diff_snapshot(previous: Dict[str, Any], current: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the parts of ``current`` that differ from ``previous``, keeping the nesting.
+
+    Dicts are compared key by key; any other value (including lists) is a leaf
+    and is included whole when it changed.
+    """
+    changes = {}
+    for key, value in current.items():
+        old = previous.get(key)
+        if isinstance(value, dict) and isinstance(old, dict):
+            nested = diff_snapshot(old, value)
+            if nested:
+                changes[key] = nested
+        elif value != old:
+            changes[key] = value
+    return changes
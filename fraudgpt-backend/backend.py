@@ -1,20 +1,38 @@
 import asyncio
+import itertools
 import json
 import logging
+import math
+import time
 import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Deque, Optional, Tuple, Union
 import pandas as pd
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Body
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Body, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, ConfigDict
+import pytz
 from pytz import timezone
 import uvicorn
-import joblib
 import numpy as np
 from catboost import CatBoostClassifier  # Use the correct model class
 from sklearn.preprocessing import StandardScaler
-import random
+from model_registry import ModelBundle, ModelRegistry
+from shadow import ShadowScorer
+from broadcaster import Broadcaster, encode_message
+from analytics import RollingAnalytics, diff_snapshot
+from feature_store import OnlineFeatureStore, resolve_location
+from gazetteer import get_gazetteer
+from firewall import Firewall, FirewallMiddleware
+from txn_store import SEVERITY_CODES, TransactionStore
+from idempotency import IdempotencyCache
+# FRAUD_THRESHOLD, severities and explanations are shared with the offline backfill job
+from scoring import FEATURE_COLUMNS, FRAUD_THRESHOLD, FraudExplainer, explanation_fields, get_severity
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s IST - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
@@ -33,28 +51,88 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# IP filtering and rate limiting for every HTTP request and WebSocket handshake.
+# Added last so it is the outermost layer and rejects before anything else runs.
+FIREWALL_CONFIG = 'firewall_config.json'
+firewall = Firewall(FIREWALL_CONFIG)
+app.add_middleware(FirewallMiddleware, firewall=firewall)
+
 # Global configuration
-FRAUD_THRESHOLD = 0.5
 MODEL_FILE = 'model.joblib'
+SCORING_ENGINE = 'compiled'  # 'compiled' (border-bin lookup table) or 'catboost' (CatBoost runtime)
+MODEL_POLL_SECONDS = 5.0  # How often MODEL_FILE is checked for a new artifact; 0 disables hot reload
+
+# Challenger models scored in the background against the live model, e.g. {"challenger": "model_challenger.joblib"}
+SHADOW_MODEL_FILES: Dict[str, str] = {}
+SHADOW_QUEUE_SIZE = 1024  # Scored batches waiting for shadow models before new ones are shed
+MAX_BATCH_SIZE = 10000  # Upper bound on transactions accepted by /score/batch
+
+# Micro-batching of concurrent /score requests
+BATCH_MAX_WAIT_MS = 2.0  # Longest a request waits for others to join its batch
+BATCH_MAX_SIZE = 64  # Largest batch handed to the model in one call
+MODEL_WORKER_THREADS = 2  # Threads running model inference off the event loop
+LATENCY_SAMPLES_PER_SIZE = 2048  # Recent latency samples kept per batch size
+
+# WebSocket fan-out: per-client bounded send queues, so slow dashboards never stall /score
+BROADCAST_QUEUE_SIZE = 256  # Messages buffered per client before the overflow policy applies
+BROADCAST_OVERFLOW_POLICY = 'drop_oldest'  # 'drop_oldest', 'drop_newest', 'coalesce' or 'disconnect'
 
 # WebSocket connection pools
-all_connections: List[WebSocket] = []
-fraud_only_connections: List[WebSocket] = []
-analysis_connections: List[WebSocket] = []
+all_broadcaster = Broadcaster("all", BROADCAST_QUEUE_SIZE, BROADCAST_OVERFLOW_POLICY)
+fraud_broadcaster = Broadcaster("fraud-only", BROADCAST_QUEUE_SIZE, BROADCAST_OVERFLOW_POLICY)
+# Analysis clients get per-client deltas; a dropped delta triggers a full resync
+analysis_broadcaster = Broadcaster("analysis", 8, 'drop_newest')
+ANALYSIS_INTERVAL_SECONDS = 5
 
-# Global store for analysis data
-analysis_data = {
-    "hourly_fraud": {i: 0 for i in range(24)},  # Fraud counts by hour
-    "severity_counts": {"LOW": 0, "MEDIUM": 0, "HIGH": 0, "CRITICAL": 0}  # Fraud counts by severity
-}
+# Rolling analytics (last 1 min / 1 h / 24 h) for the analysis dashboard
+analytics = RollingAnalytics()
+
+# Per-user state for deriving velocity/geo_distance from raw events (/score/event)
+FEATURE_STORE_WINDOW_SECONDS = 3600
+FEATURE_STORE_TTL_SECONDS = 7 * 24 * 3600
+FEATURE_STORE_MAX_USERS = 500_000
+feature_store = OnlineFeatureStore(
+    window_seconds=FEATURE_STORE_WINDOW_SECONDS,
+    ttl_seconds=FEATURE_STORE_TTL_SECONDS,
+    max_users=FEATURE_STORE_MAX_USERS
+)
+
+# Duplicate suppression: a retried transaction carrying the same client id gets the
+# original result back instead of being rescored, stored and broadcast again
+IDEMPOTENCY_TTL_SECONDS = 600
+IDEMPOTENCY_MAX_ENTRIES = 100_000
+idempotency_cache = IdempotencyCache(IDEMPOTENCY_TTL_SECONDS, IDEMPOTENCY_MAX_ENTRIES)
 
 # Data Models
+# NaN and Infinity are valid JSON to Python's parser; reject them (422) before any stage sees them
 class Transaction(BaseModel):
+    model_config = ConfigDict(allow_inf_nan=False)
+    id: Optional[Union[str, int]] = None  # Client transaction id, used as the idempotency key
     amount: float
     hour_of_day: int
     velocity: float
     geo_distance: float
 
+class RawEvent(BaseModel):
+    model_config = ConfigDict(allow_inf_nan=False)
+    id: Optional[Union[str, int]] = None  # Client transaction id, used as the idempotency key
+    user_id: str
+    amount: float
+    timestamp: Optional[str] = None  # ISO 8601; defaults to the time of arrival (IST)
+    location: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+
+@app.exception_handler(RequestValidationError)
+async def validation_error_handler(request: Request, exc: RequestValidationError):
+    # FastAPI's default handler echoes each rejected input, and a NaN or Infinity one cannot be rendered as JSON
+    errors = [
+        {**error, "input": str(error["input"])}
+        if isinstance(error.get("input"), float) and not math.isfinite(error["input"]) else error
+        for error in exc.errors()
+    ]
+    return JSONResponse(status_code=422, content={"detail": jsonable_encoder(errors)})
+
 class TransactionPayload(BaseModel):
     id: int
     timestamp: str
@@ -69,275 +147,650 @@ class TransactionPayload(BaseModel):
     confidence: str
     factors_analyzed: Dict[str, Any]
     transaction: Dict[str, Any]
+    model_version: str = ""
+    client_id: Optional[str] = None
 
-# In-memory store for transaction history (optional, not currently used)
-transaction_history = []
+# Durable history of every scored payload: appends are buffered and fsynced in batches
+# by a background thread, so /score never waits on the disk
+TXN_STORE_DIR = 'txn_store'
+TXN_STORE_SEGMENT_BYTES = 64 * 1024 * 1024  # Segment files roll over at this size
+TXN_STORE_FLUSH_SECONDS = 0.05  # Longest a scored payload waits in the write-ahead buffer
+MAX_HISTORY_PAGE = 1000  # Upper bound on ?limit= for /transactions
+transaction_store = TransactionStore(TXN_STORE_DIR, TXN_STORE_SEGMENT_BYTES, TXN_STORE_FLUSH_SECONDS)
 
-# Load the trained model and scaler at startup
-model = None
-scaler = None
-try:
-    loaded_data = joblib.load(MODEL_FILE)
-    model = loaded_data.get('model')
-    scaler = loaded_data.get('scaler')
+# Server transaction ids: increasing, and continuing after the last stored one across restarts
+_last_stored = transaction_store.recent(1)
+transaction_ids = itertools.count(json.loads(_last_stored[0])["id"] + 1 if _last_stored else 1)
 
-    if model is None or scaler is None:
-        logger.error(f"❌ Model file '{MODEL_FILE}' is missing model or scaler objects. Please re-run the training script.")
-    else:
-        logger.info("✅ Successfully loaded machine learning model and scaler.")
-        if not hasattr(model, 'feature_names_'):
-            logger.warning("Model does not have feature_names_. Assuming feature order: ['amount', 'hour_of_day', 'velocity', 'geo_distance']")
-except FileNotFoundError:
-    logger.error(f"❌ Model file '{MODEL_FILE}' not found. Please ensure the model exists.")
-except Exception as e:
-    logger.error(f"❌ Error loading model: {e}")
-
-# Fraud Explainer Class (remains rule-based for explanations)
-class FraudExplainer:
-    def __init__(self):
-        self.risk_thresholds = {
-            'amount': {'low': 500, 'medium': 1500, 'high': 3000, 'extreme': 7000},
-            'velocity': {'low': 2, 'medium': 4, 'high': 7, 'extreme': 12},
-            'geo_distance': {'low': 50, 'medium': 150, 'high': 500, 'extreme': 1000},
-            'hour_risk': {
-                'safe': list(range(9, 18)), 'moderate': [8, 18, 19, 20],
-                'risky': [21, 22, 23, 6, 7], 'dangerous': [0, 1, 2, 3, 4, 5]
-            }
-        }
-    def analyze_risk_factors(self, txn: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
-        factors: Dict[str, Dict[str, Any]] = {}
-        amt = txn.get('amount', 0)
-        if amt >= self.risk_thresholds['amount']['extreme']:
-            factors['amount'] = {'level': 'EXTREME', 'score': 4, 'description': f'Extremely high amount (${amt:,.2f})', 'context': 'Amounts over $7,000 are high fraud risk'}
-        elif amt >= self.risk_thresholds['amount']['high']:
-            factors['amount'] = {'level': 'HIGH', 'score': 3, 'description': f'Large transaction (${amt:,.2f})', 'context': 'Large amounts may indicate fraud'}
-        elif amt >= self.risk_thresholds['amount']['medium']:
-            factors['amount'] = {'level': 'MEDIUM', 'score': 2, 'description': f'Elevated amount (${amt:,.2f})', 'context': 'Above-average amounts require review'}
-        elif amt >= self.risk_thresholds['amount']['low']:
-            factors['amount'] = {'level': 'LOW', 'score': 1, 'description': f'Moderately high amount (${amt:,.2f})', 'context': 'Slightly elevated amount'}
-
-        hr = txn.get('hour_of_day', -1)
-        if hr in self.risk_thresholds['hour_risk']['dangerous']:
-            factors['timing'] = {'level': 'EXTREME', 'score': 4, 'description': f'Transaction at {hr}:00', 'context': 'Midnight–6AM has very high fraud rates'}
-        elif hr in self.risk_thresholds['hour_risk']['risky']:
-            factors['timing'] = {'level': 'HIGH', 'score': 3, 'description': f'Late evening at {hr}:00', 'context': 'Evening transactions often flagged'}
-        elif hr in self.risk_thresholds['hour_risk']['moderate']:
-            factors['timing'] = {'level': 'MEDIUM', 'score': 2, 'description': f'Off-business hours at {hr}:00', 'context': 'Outside 9–5 needs scrutiny'}
-
-        vel = txn.get('velocity', 0)
-        if vel >= self.risk_thresholds['velocity']['extreme']:
-            factors['velocity'] = {'level': 'EXTREME', 'score': 4, 'description': f'Very high frequency ({int(vel)} txns)', 'context': 'Automated/bot activity likely'}
-        elif vel >= self.risk_thresholds['velocity']['high']:
-            factors['velocity'] = {'level': 'HIGH', 'score': 3, 'description': f'High frequency ({int(vel)} txns)', 'context': 'Clustering suggests fraud'}
-        elif vel >= self.risk_thresholds['velocity']['medium']:
-            factors['velocity'] = {'level': 'MEDIUM', 'score': 2, 'description': f'Elevated frequency ({int(vel)} txns)', 'context': 'Above normal pace'}
-        elif vel >= self.risk_thresholds['velocity']['low']:
-            factors['velocity'] = {'level': 'LOW', 'score': 1, 'description': f'Moderate frequency ({int(vel)} txns)', 'context': 'Slightly elevated'}
-
-        dist = txn.get('geo_distance', 0)
-        if dist >= self.risk_thresholds['geo_distance']['extreme']:
-            factors['geography'] = {'level': 'EXTREME', 'score': 4, 'description': f'Cross-country ({dist:.0f}km)', 'context': 'Stolen credentials likely'}
-        elif dist >= self.risk_thresholds['geo_distance']['high']:
-            factors['geography'] = {'level': 'HIGH', 'score': 3, 'description': f'Long distance ({dist:.0f}km)', 'context': 'Location anomaly'}
-        elif dist >= self.risk_thresholds['geo_distance']['medium']:
-            factors['geography'] = {'level': 'MEDIUM', 'score': 2, 'description': f'Unusual distance ({dist:.0f}km)', 'context': 'Outside typical range'}
-        elif dist >= self.risk_thresholds['geo_distance']['low']:
-            factors['geography'] = {'level': 'LOW', 'score': 1, 'description': f'Slight distance ({dist:.0f}km)', 'context': 'Slightly outside normal'}
-        return factors
-
-    def generate_comprehensive_explanation(self, txn: Dict[str, Any], score: float, is_flagged: bool) -> Dict[str, Any]:
-        factors = self.analyze_risk_factors(txn)
-        if not is_flagged:
-            return {
-                'explanation': 'Transaction appears legitimate.', 'risk_level': 'LOW',
-                'detailed_analysis': 'All parameters within normal ranges.',
-                'recommendation': 'Approve with standard monitoring.',
-                'confidence': f'{(1-score)*100:.1f}%', 'factors_analyzed': {}
-            }
-        
-        total_score = sum(f['score'] for f in factors.values())
-        primary = max(factors.items(), key=lambda x: x[1]['score'])[0] if factors else None
-        explanations = [f['description'] for f in factors.values()]
-        detailed = " & ".join(explanations)
-        
-        if total_score >= 12:
-            risk = 'CRITICAL'; action = 'BLOCK IMMEDIATELY'
-        elif total_score >= 9:
-            risk = 'HIGH'; action = 'MANUAL REVIEW REQUIRED'
-        elif total_score >= 6:
-            risk = 'MEDIUM'; action = 'ENHANCED MONITORING'
-        else:
-            risk = 'LOW-MEDIUM'; action = 'STANDARD MONITORING'
-        
-        return {
-            'explanation': explanations[0] if len(explanations) == 1 else detailed,
-            'risk_level': risk, 'detailed_analysis': detailed,
-            'primary_reason': factors[primary]['description'] if primary else None,
-            'recommendation': action, 'confidence': f'{score*100:.1f}%',
-            'factors_analyzed': factors
-        }
+# The newest stored payloads kept in memory for WebSocket replay, so a connecting dashboard
+# never waits on store reads; seeded from the store so history survives restarts
+replay_tail: Deque[str] = deque((m.decode('utf-8') for m in transaction_store.recent(BROADCAST_QUEUE_SIZE)),
+                                maxlen=BROADCAST_QUEUE_SIZE)
+replay_flagged_tail: Deque[str] = deque((m.decode('utf-8') for m in transaction_store.recent(BROADCAST_QUEUE_SIZE, True)),
+                                        maxlen=BROADCAST_QUEUE_SIZE)
+
+# Load the trained model and scaler at startup; newer artifacts are picked up,
+# compiled and warmed up in the background and swapped in atomically
+model_registry = ModelRegistry(MODEL_FILE, SCORING_ENGINE, poll_interval=MODEL_POLL_SECONDS)
+if model_registry.reload():
+    logger.info("✅ Successfully loaded machine learning model and scaler.")
+model_registry.start()
+
+# Shadow scoring runs on its own thread and is shed first under load
+shadow_scorer = ShadowScorer.from_files(SHADOW_MODEL_FILES, FRAUD_THRESHOLD, SCORING_ENGINE, max_queue=SHADOW_QUEUE_SIZE)
 
 explainer = FraudExplainer()
 
-# Helper function to get model prediction
-def predict_fraud_score(txn_data: Dict[str, Any]) -> float:
-    if model is None or scaler is None:
+# Helper functions to get model predictions
+def predict_fraud_scores(features: np.ndarray, bundle: Optional[ModelBundle] = None) -> np.ndarray:
+    """Score an (n, 4) feature matrix with a single scaler/model call.
+
+    Pass the bundle the caller read from the registry to know which version
+    produced the scores; by default the live model is used.
+    """
+    bundle = bundle or model_registry.current
+    if bundle is None:
         logger.error("Model or scaler not loaded. Cannot predict.")
-        return 0.0
+        return np.zeros(len(features))
 
     try:
-        features = np.array([
-            txn_data['amount'],
-            txn_data['hour_of_day'],
-            txn_data['velocity'],
-            txn_data['geo_distance']
-        ]).reshape(1, -1)
-        
-        # Scale the features before prediction!
-        scaled_features = scaler.transform(features)
+        return bundle.predict(features)
 
-        # Predict the probability of the transaction being fraudulent
-        fraud_prob = model.predict_proba(scaled_features)[:, 1]
-        return float(fraud_prob)
+    except Exception as e:
+        logger.error(f"❌ Error during model prediction: {e}")
+        return np.zeros(len(features))
 
+def predict_fraud_score(txn_data: Dict[str, Any]) -> float:
+    try:
+        features = np.array([txn_data[col] for col in FEATURE_COLUMNS], dtype=float).reshape(1, -1)
     except KeyError as e:
         logger.error(f"❌ Missing data key in transaction payload: {e}")
         return 0.0
 
-    except Exception as e:
-        logger.error(f"❌ Error during model prediction: {e}")
-        return 0.0
+    return float(predict_fraud_scores(features)[0])
 
-# Broadcast helpers
-async def broadcast_all(msg: Dict[str, Any]):
-    for conn in all_connections[:]:
+def build_payload(txn_dict: Dict[str, Any], fraud_score: float, details: Optional[Dict[str, Any]] = None,
+                  model_version: str = "", client_id: Optional[Union[str, int]] = None) -> TransactionPayload:
+    """Explain a scored transaction, record it for analysis and build its dashboard payload."""
+    is_flagged = fraud_score > FRAUD_THRESHOLD
+    severity = get_severity(fraud_score)
+
+    if details is None:
+        details = explainer.generate_comprehensive_explanation(txn_dict, fraud_score, is_flagged)
+
+    # Update analysis data
+    analytics.record(fraud_score, is_flagged, severity, txn_dict.get("hour_of_day", -1), txn_dict.get("amount", 0.0))
+
+    return TransactionPayload(
+        id=next(transaction_ids),
+        timestamp=ist.localize(datetime.utcnow()).isoformat(),
+        fraud_score=round(fraud_score, 3),
+        is_flagged=is_flagged,
+        severity=severity,
+        **explanation_fields(details),
+        transaction=txn_dict,
+        model_version=model_version,
+        client_id=None if client_id is None else str(client_id)
+    )
+
+async def score_once(client_id: Optional[Union[str, int]], score) -> Tuple[Dict[str, Any], bool]:
+    """Run ``score`` (returns the payload dict) once per client id; returns (payload, duplicate).
+
+    Concurrent duplicates wait for the first attempt. If that attempt fails the
+    id is released and the next waiter scores the transaction itself.
+    """
+    if client_id is None:
+        return await score(), False
+    key = str(client_id)
+    while True:
+        future, owner = idempotency_cache.claim(key)
+        if not owner:
+            payload = await asyncio.shield(future)
+            if payload is not None:
+                return payload, True
+            continue
         try:
-            await conn.send_json(msg)
-        except Exception:
-            all_connections.remove(conn)
+            payload = await score()
+        except BaseException:
+            idempotency_cache.release(key, future)
+            raise
+        idempotency_cache.resolve(future, payload)
+        return payload, False
+
+def parse_batch_body(body: bytes, content_type: str) -> List[Dict[str, Any]]:
+    """Decode a /score/batch body into row dicts.
+
+    Accepted shapes:
+      * NDJSON (``application/x-ndjson``): one transaction object per line
+      * JSON array of transaction objects, or ``{"transactions": [...]}``
+      * Columnar JSON: ``{"amount": [...], "hour_of_day": [...], ...}``
+    """
+    if 'ndjson' in content_type or 'jsonlines' in content_type:
+        return [json.loads(line) for line in body.splitlines() if line.strip()]
+
+    data = json.loads(body)
+    if isinstance(data, dict) and 'transactions' in data:
+        data = data['transactions']
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict):
+        columns = {col: data.get(col) for col in FEATURE_COLUMNS}
+        missing = [col for col, values in columns.items() if not isinstance(values, list)]
+        if missing:
+            raise ValueError(f"Columnar body is missing list columns: {missing}")
+        lengths = {len(values) for values in columns.values()}
+        if len(lengths) != 1:
+            raise ValueError("Columnar body columns must all have the same length")
+        return [dict(zip(FEATURE_COLUMNS, row)) for row in zip(*columns.values())]
+    raise ValueError("Expected a JSON array, a 'transactions' list, columnar JSON or NDJSON")
+
+# Worker threads for model inference so scoring never blocks the event loop
+model_executor = ThreadPoolExecutor(max_workers=MODEL_WORKER_THREADS, thread_name_prefix="model")
+
+class MicroBatcher:
+    """Coalesces concurrent single-transaction requests into vectorized model calls.
 
-async def broadcast_fraud(msg: Dict[str, Any]):
-    for conn in fraud_only_connections[:]:
+    Requests queue up while a batch is being scored. Once a batch closes, the
+    next one is formed from everything already waiting; if the last batch held
+    more than one request (i.e. there is concurrent load) the batcher also waits
+    up to ``max_wait_ms`` for more arrivals, capped at ``max_batch_size``. An
+    idle server therefore scores a lone request immediately.
+    """
+    def __init__(self, max_wait_ms: float = BATCH_MAX_WAIT_MS, max_batch_size: int = BATCH_MAX_SIZE):
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.queue: Optional[asyncio.Queue] = None
+        self.worker: Optional[asyncio.Task] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.last_batch_size = 0
+        # Per batch size: number of batches, request latencies and model call times (ms)
+        self.batch_counts: Dict[int, int] = {}
+        self.request_latencies: Dict[int, Deque[float]] = {}
+        self.inference_times: Dict[int, Deque[float]] = {}
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            # Requests queued on another event loop can only be answered there
+            if self.queue is not None and not self.queue.empty() and not self.loop.is_closed():
+                while not self.queue.empty():
+                    self.loop.call_soon_threadsafe(self.queue.get_nowait()[1].cancel)
+            self.loop = loop
+            self.queue = asyncio.Queue()
+            self.worker = None
+        if self.worker is None or self.worker.done():
+            # A restarted worker picks up whatever is still queued
+            self.worker = loop.create_task(self._run())
+
+    async def score(self, features: List[float]) -> Tuple[float, str]:
+        """Queue one feature row and wait for its fraud score and the model version that produced it."""
+        self._ensure_worker()
+        future = self.loop.create_future()
+        self.queue.put_nowait((features, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self, batch: List[Tuple[List[float], asyncio.Future, float]]):
+        """Fill ``batch`` in place, so requests already taken are known if collecting is interrupted."""
+        batch.append(await self.queue.get())
+        while len(batch) < self.max_batch_size and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+
+        if self.last_batch_size > 1 and self.max_wait > 0:
+            deadline = self.loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - self.loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+    async def _run(self):
+        while True:
+            batch: List[Tuple[List[float], asyncio.Future, float]] = []
+            try:
+                await self._collect(batch)
+                await self._score_batch(batch)
+            except asyncio.CancelledError:
+                for _, future, _ in batch:
+                    future.cancel()
+                raise
+            except Exception as e:
+                # Fail this batch's requests instead of leaving them waiting, and keep serving
+                logger.error(f"❌ Error while scoring a batch of {len(batch)}: {e}")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    async def _score_batch(self, batch: List[Tuple[List[float], asyncio.Future, float]]):
+        self.last_batch_size = size = len(batch)
+        features = np.array([item[0] for item in batch], dtype=float)
+
+        # One registry read per batch: every request in it is scored by the same version
+        bundle = model_registry.current
+        version = bundle.version if bundle else ""
+        started = time.perf_counter()
+        scored = True
         try:
-            await conn.send_json(msg)
-        except Exception:
-            fraud_only_connections.remove(conn)
+            scores = await self.loop.run_in_executor(model_executor, predict_fraud_scores, features, bundle)
+        except Exception as e:
+            logger.error(f"❌ Error during batched model prediction: {e}")
+            scores = np.zeros(size)
+            scored = False
+        finished = time.perf_counter()
+
+        for (_, future, _), score in zip(batch, scores):
+            if not future.done():
+                future.set_result((float(score), version))
+        if scored:
+            # Requests already waiting means we are under load: skip the shadow work
+            shadow_scorer.submit(features, scores, version, busy=not self.queue.empty())
+        self._record(size, [(finished - enqueued) * 1000 for _, _, enqueued in batch], (finished - started) * 1000)
+
+    def _record(self, size: int, latencies_ms: List[float], inference_ms: float):
+        if size not in self.batch_counts:
+            self.batch_counts[size] = 0
+            self.request_latencies[size] = deque(maxlen=LATENCY_SAMPLES_PER_SIZE)
+            self.inference_times[size] = deque(maxlen=LATENCY_SAMPLES_PER_SIZE)
+        self.batch_counts[size] += 1
+        self.request_latencies[size].extend(latencies_ms)
+        self.inference_times[size].append(inference_ms)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return request latency percentiles (ms) grouped by batch size."""
+        by_size = {}
+        for size in sorted(self.batch_counts):
+            p50, p95, p99 = np.percentile(self.request_latencies[size], [50, 95, 99])
+            by_size[size] = {
+                "batches": self.batch_counts[size],
+                "latency_p50_ms": round(float(p50), 3),
+                "latency_p95_ms": round(float(p95), 3),
+                "latency_p99_ms": round(float(p99), 3),
+                "latency_max_ms": round(max(self.request_latencies[size]), 3),
+                "inference_mean_ms": round(float(np.mean(self.inference_times[size])), 3),
+            }
+        return {
+            "max_wait_ms": self.max_wait * 1000,
+            "max_batch_size": self.max_batch_size,
+            "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+            "by_batch_size": by_size,
+        }
+
+scoring_batcher = MicroBatcher()
+
+# Broadcast helpers
+def broadcast_payload(payload: TransactionPayload, broadcast: bool = True):
+    """Encode a payload once, store it and queue it for every dashboard that should see it."""
+    message = encode_message(payload.dict())
+    transaction_store.append(message, payload.severity, payload.is_flagged)
+    replay_tail.append(message)
+    if payload.is_flagged:
+        replay_flagged_tail.append(message)
+    if not broadcast:
+        return
+    all_broadcaster.publish(message)
+    if payload.is_flagged:
+        fraud_broadcaster.publish(message)
+
+def replay_history(broadcaster: Broadcaster, ws: WebSocket, replay: int, flagged_only: bool = False):
+    """Queue the last ``replay`` stored payloads for a client that just registered.
+
+    Called right after register() with no await in between, so the history is
+    queued ahead of any live message. Served from the in-memory replay tails,
+    which also hold payloads still in the store's write-ahead buffer.
+    """
+    replay = min(max(replay, 0), BROADCAST_QUEUE_SIZE)
+    if replay:
+        tail = replay_flagged_tail if flagged_only else replay_tail
+        for message in itertools.islice(tail, max(len(tail) - replay, 0), None):
+            broadcaster.send(ws, message)
+
+# Last snapshot sent to each analysis client (None until its first full snapshot)
+analysis_client_state: Dict[WebSocket, Optional[Dict[str, Any]]] = {}
+analysis_task: Optional[asyncio.Task] = None
 
 async def broadcast_analysis():
     while True:
-        await asyncio.sleep(5)  # Broadcast every 5 seconds
-        for conn in analysis_connections[:]:
-            try:
-                await conn.send_json({
-                    "type": "analysis_update",
-                    "hourly_fraud": analysis_data["hourly_fraud"],
-                    "severity_counts": analysis_data["severity_counts"],
-                    "timestamp": ist.localize(datetime.utcnow()).isoformat()
-                })
-            except Exception:
-                analysis_connections.remove(conn)
+        await asyncio.sleep(ANALYSIS_INTERVAL_SECONDS)
+        if not analysis_client_state:
+            continue
+        snapshot = analytics.snapshot()
+        timestamp = ist.localize(datetime.utcnow()).isoformat()
+        # Clients that were sent the same previous snapshot share one encoded delta
+        encoded: Dict[int, Optional[str]] = {}
+        for conn, previous in list(analysis_client_state.items()):
+            key = id(previous)
+            if key not in encoded:
+                if previous is None:
+                    encoded[key] = encode_message({"type": "analysis_snapshot", "data": snapshot, "timestamp": timestamp})
+                else:
+                    changes = diff_snapshot(previous, snapshot)
+                    encoded[key] = encode_message({"type": "analysis_delta", "changes": changes, "timestamp": timestamp}) if changes else None
+            if encoded[key] is None:
+                continue
+            if conn not in analysis_broadcaster.clients:
+                analysis_client_state.pop(conn, None)
+            elif analysis_broadcaster.send(conn, encoded[key]):
+                analysis_client_state[conn] = snapshot
+            else:
+                analysis_client_state[conn] = None
+
+def ensure_analysis_task():
+    global analysis_task
+    if analysis_task is None or analysis_task.done():
+        analysis_task = asyncio.get_running_loop().create_task(broadcast_analysis())
 
 # WebSocket endpoints
 @app.websocket("/ws/all")
-async def websocket_all(ws: WebSocket):
+async def websocket_all(ws: WebSocket, replay: int = 0):
     await ws.accept()
-    all_connections.append(ws)
+    all_broadcaster.register(ws)
+    replay_history(all_broadcaster, ws, replay)
     logger.info(f"New WebSocket connection established for all alerts from IP {ws.client.host}")
     try:
         while True:
             await ws.receive_text()
     except WebSocketDisconnect:
-        all_connections.remove(ws)
         logger.info(f"WebSocket connection closed for all alerts from IP {ws.client.host}")
     except Exception as e:
         logger.error(f"WebSocket error for IP {ws.client.host}: {e}")
-        all_connections.remove(ws)
+    finally:
+        all_broadcaster.unregister(ws)
 
 @app.websocket("/ws/fraud-only")
-async def websocket_fraud(ws: WebSocket):
+async def websocket_fraud(ws: WebSocket, replay: int = 0):
     await ws.accept()
-    fraud_only_connections.append(ws)
+    fraud_broadcaster.register(ws)
+    replay_history(fraud_broadcaster, ws, replay, flagged_only=True)
     logger.info(f"New WebSocket connection established for fraud-only alerts from IP {ws.client.host}")
     try:
         while True:
             await ws.receive_text()
     except WebSocketDisconnect:
-        fraud_only_connections.remove(ws)
         logger.info(f"WebSocket connection closed for fraud-only alerts from IP {ws.client.host}")
     except Exception as e:
         logger.error(f"WebSocket error for IP {ws.client.host}: {e}")
-        fraud_only_connections.remove(ws)
+    finally:
+        fraud_broadcaster.unregister(ws)
 
 @app.websocket("/ws/analysis")
 async def websocket_analysis(ws: WebSocket):
     await ws.accept()
-    analysis_connections.append(ws)
+    analysis_broadcaster.register(ws)
+    # The full snapshot goes out immediately; later updates only carry what changed
+    snapshot = analytics.snapshot()
+    analysis_broadcaster.send(ws, encode_message({
+        "type": "analysis_snapshot", "data": snapshot,
+        "timestamp": ist.localize(datetime.utcnow()).isoformat()
+    }))
+    analysis_client_state[ws] = snapshot
+    ensure_analysis_task()
     logger.info(f"New WebSocket connection established for analysis from IP {ws.client.host}")
     try:
         while True:
             await ws.receive_text()
     except WebSocketDisconnect:
-        analysis_connections.remove(ws)
         logger.info(f"WebSocket connection closed for analysis from IP {ws.client.host}")
     except Exception as e:
         logger.error(f"WebSocket error for analysis from IP {ws.client.host}: {e}")
-        analysis_connections.remove(ws)
+    finally:
+        analysis_client_state.pop(ws, None)
+        analysis_broadcaster.unregister(ws)
 
 # New API endpoint to receive transactions from send_transactions.py
 @app.post("/score")
 async def score_transaction(txn: Transaction = Body(...)):
-    if model is None:
+    if model_registry.current is None:
         raise HTTPException(status_code=500, detail="Machine learning model not loaded.")
         
     # Convert incoming transaction to a dictionary
-    txn_dict = txn.dict()
-    
-    # Use the model to predict the fraud score
-    fraud_score = predict_fraud_score(txn_dict)
-    is_flagged = fraud_score > FRAUD_THRESHOLD
-    
-    if fraud_score >= 0.8: severity = "CRITICAL"
-    elif fraud_score >= 0.6: severity = "HIGH"
-    elif fraud_score >= 0.4: severity = "MEDIUM"
-    else: severity = "LOW"
-    
-    details = explainer.generate_comprehensive_explanation(txn_dict, fraud_score, is_flagged)
-    
-    # Update analysis data
-    hour = txn_dict.get("hour_of_day", 0)
-    if hour in analysis_data["hourly_fraud"]:
-        analysis_data["hourly_fraud"][hour] += 1
-    if severity in analysis_data["severity_counts"]:
-        analysis_data["severity_counts"][severity] += 1
-    
-    # Create the payload for the dashboard
-    payload = TransactionPayload(
-        id=random.randint(100000, 999999),
-        timestamp=ist.localize(datetime.utcnow()).isoformat(),
-        fraud_score=round(fraud_score, 3),
-        is_flagged=is_flagged,
-        severity=severity,
-        reason=details['explanation'],
-        detailed_explanation=details.get('detailed_analysis', ''),
-        risk_level=details.get('risk_level', 'LOW'),
-        primary_reason=details.get('primary_reason', ''),
-        recommendation=details.get('recommendation', 'Standard monitoring.'),
-        confidence=details.get('confidence', '100.0%'),
-        factors_analyzed=details.get('factors_analyzed', {}),
-        transaction=txn_dict
-    )
-    
-    # Broadcast the result to the connected clients
-    await broadcast_all(payload.dict())
-    if payload.is_flagged:
-        await broadcast_fraud(payload.dict())
-    
-    logger.info(f"Received and scored transaction. Score: {payload.fraud_score}")
-    
+    txn_dict = txn.dict(exclude={'id'})
+
+    async def score():
+        # Use the model to predict the fraud score (micro-batched with concurrent requests)
+        # and create the payload for the dashboard
+        fraud_score, model_version = await scoring_batcher.score([txn_dict[col] for col in FEATURE_COLUMNS])
+        payload = build_payload(txn_dict, fraud_score, model_version=model_version, client_id=txn.id)
+
+        # Broadcast the result to the connected clients
+        broadcast_payload(payload)
+        return payload.dict()
+
+    payload, duplicate = await score_once(txn.id, score)
+    if duplicate:
+        logger.info(f"Duplicate transaction {txn.id}; returning its original result.")
+        return {"message": "Duplicate transaction; original result returned", "fraud_score": payload["fraud_score"],
+                "id": payload["id"], "duplicate": True}
+
+    logger.info(f"Received and scored transaction. Score: {payload['fraud_score']}")
+
     # The endpoint returns a response, but the dashboard primarily listens to the WebSocket
-    return {"message": "Transaction scored and broadcasted", "fraud_score": payload.fraud_score}
+    return {"message": "Transaction scored and broadcasted", "fraud_score": payload["fraud_score"],
+            "id": payload["id"], "duplicate": False}
+
+# Raw event endpoint: the backend derives velocity and geo_distance from per-user state
+@app.post("/score/event")
+async def score_event(event: RawEvent = Body(...)):
+    if model_registry.current is None:
+        raise HTTPException(status_code=500, detail="Machine learning model not loaded.")
+
+    try:
+        event_time = datetime.fromisoformat(event.timestamp) if event.timestamp else datetime.now(ist)
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"Invalid timestamp: {event.timestamp}")
+    # Naive timestamps are taken as UTC for the clock; hour_of_day is the local hour as written
+    epoch = event_time.timestamp() if event_time.tzinfo else event_time.replace(tzinfo=pytz.utc).timestamp()
+
+    if event.latitude is not None and event.longitude is not None:
+        lat, lon = event.latitude, event.longitude
+    else:
+        lat, lon = resolve_location(event.location)
+
+    async def score():
+        # A retried event must not advance the user's state twice, so this runs once per id too
+        derived = feature_store.update(event.user_id, epoch, lat, lon)
+        txn_dict = {
+            "amount": event.amount,
+            "hour_of_day": event_time.hour,
+            "velocity": derived["velocity"],
+            "geo_distance": derived["geo_distance"],
+            "user_id": event.user_id,
+            "location": event.location,
+            "txn_count_window": derived["txn_count_window"],
+            "decayed_txn_count": derived["decayed_txn_count"],
+        }
+
+        fraud_score, model_version = await scoring_batcher.score([txn_dict[col] for col in FEATURE_COLUMNS])
+        payload = build_payload(txn_dict, fraud_score, model_version=model_version, client_id=event.id)
+        broadcast_payload(payload)
+        return payload.dict()
+
+    payload, duplicate = await score_once(event.id, score)
+    if duplicate:
+        logger.info(f"Duplicate event {event.id} for user {event.user_id}; returning its original result.")
+        return {"message": "Duplicate event; original result returned", "fraud_score": payload["fraud_score"],
+                "features": payload["transaction"], "id": payload["id"], "duplicate": True}
+
+    logger.info(f"Received and scored event for user {event.user_id}. Score: {payload['fraud_score']}")
+
+    return {"message": "Event scored and broadcasted", "fraud_score": payload["fraud_score"],
+            "features": payload["transaction"], "id": payload["id"], "duplicate": False}
+
+# Batch endpoint: scores N transactions with one vectorized scaler/model call
+@app.post("/score/batch")
+async def score_batch(request: Request, broadcast: bool = True):
+    if model_registry.current is None:
+        raise HTTPException(status_code=500, detail="Machine learning model not loaded.")
+
+    try:
+        rows = parse_batch_body(await request.body(), request.headers.get('content-type', ''))
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid batch body: {e}")
+
+    if len(rows) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {MAX_BATCH_SIZE} transactions.")
+
+    txns = []
+    for i, row in enumerate(rows):
+        try:
+            txns.append(Transaction(**row))
+        except Exception as e:
+            raise HTTPException(status_code=422, detail=f"Invalid transaction at index {i}: {e}")
+
+    if not txns:
+        return {"message": "No transactions to score", "count": 0, "results": []}
+
+    # Rows whose client id was already scored (or repeats within this batch) reuse that payload
+    results: List[Optional[Dict[str, Any]]] = [None] * len(txns)
+    owned: Dict[int, Tuple[str, asyncio.Future]] = {}
+    waiting: Dict[int, asyncio.Future] = {}
+    for i, txn in enumerate(txns):
+        if txn.id is not None:
+            future, owner = idempotency_cache.claim(str(txn.id))
+            if owner:
+                owned[i] = (str(txn.id), future)
+            else:
+                waiting[i] = future
+    to_score = [i for i in range(len(txns)) if i not in waiting]
+
+    try:
+        if to_score:
+            txn_dicts = [txns[i].dict(exclude={'id'}) for i in to_score]
+            features = np.array([[txn[col] for col in FEATURE_COLUMNS] for txn in txn_dicts], dtype=float)
+            bundle = model_registry.current
+            fraud_scores = await asyncio.get_running_loop().run_in_executor(model_executor, predict_fraud_scores, features, bundle)
+
+            shadow_scorer.submit(features, fraud_scores, bundle.version, busy=scoring_batcher.queue is not None and not scoring_batcher.queue.empty())
+            explanations = explainer.explain_batch(features, fraud_scores, fraud_scores > FRAUD_THRESHOLD)
+
+            for i, txn_dict, fraud_score, details in zip(to_score, txn_dicts, fraud_scores, explanations):
+                payload = build_payload(txn_dict, float(fraud_score), details, bundle.version, txns[i].id)
+                broadcast_payload(payload, broadcast)
+                results[i] = payload.dict()
+    except BaseException:
+        for key, future in owned.values():
+            idempotency_cache.release(key, future)
+        raise
+    for i, (key, future) in owned.items():
+        idempotency_cache.resolve(future, results[i])
+
+    for i, future in waiting.items():
+        results[i] = await asyncio.shield(future)
+        if results[i] is None:
+            raise HTTPException(status_code=409, detail=f"Concurrent attempt for transaction id {txns[i].id} failed; retry the batch")
+
+    logger.info(f"Scored batch of {len(to_score)} transactions ({len(waiting)} duplicates).")
+
+    return {"message": "Batch scored", "count": len(results), "duplicates": len(waiting), "results": results}
+
+@app.get("/stats/batching")
+async def batching_stats():
+    return scoring_batcher.get_stats()
+
+@app.get("/stats/broadcast")
+async def broadcast_stats():
+    return {
+        "all": all_broadcaster.get_stats(),
+        "fraud_only": fraud_broadcaster.get_stats(),
+        "analysis": analysis_broadcaster.get_stats()
+    }
+
+@app.get("/stats/features")
+async def feature_store_stats():
+    return {**feature_store.get_stats(), "gazetteer": get_gazetteer().get_stats()}
+
+@app.get("/stats/analysis")
+async def analysis_stats():
+    return analytics.snapshot()
+
+@app.get("/stats/shadow")
+async def shadow_stats():
+    return shadow_scorer.get_stats()
+
+@app.get("/stats/idempotency")
+async def idempotency_stats():
+    return idempotency_cache.get_stats()
+
+@app.get("/stats/store")
+async def store_stats():
+    return transaction_store.get_stats()
+
+def parse_time_filter(value: Optional[str], name: str) -> Optional[float]:
+    """ISO 8601 (naive means UTC) or epoch seconds, as epoch seconds."""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"Invalid {name}: {value}")
+    return parsed.timestamp() if parsed.tzinfo else parsed.replace(tzinfo=pytz.utc).timestamp()
+
+# Paged history of scored transactions, newest first; pass next_before back as ?before= for the next page
+@app.get("/transactions")
+async def transactions(flagged: Optional[bool] = None, severity: Optional[str] = None, since: Optional[str] = None,
+                       until: Optional[str] = None, before: Optional[int] = None, limit: int = 100):
+    if severity is not None:
+        severity = severity.upper()
+        if severity not in SEVERITY_CODES:
+            raise HTTPException(status_code=422, detail=f"Unknown severity '{severity}', expected one of {list(SEVERITY_CODES)}")
+    if not 1 <= limit <= MAX_HISTORY_PAGE:
+        raise HTTPException(status_code=422, detail=f"limit must be between 1 and {MAX_HISTORY_PAGE}")
+    since_ts, until_ts = parse_time_filter(since, "since"), parse_time_filter(until, "until")
+    rows, next_before = await asyncio.get_running_loop().run_in_executor(
+        None, lambda: transaction_store.query(flagged, severity, since_ts, until_ts, before, limit))
+    # Stored records are already encoded JSON objects, so the page is assembled without re-encoding
+    body = b''.join((
+        b'{"count":', str(len(rows)).encode(), b',"next_before":', json.dumps(next_before).encode(),
+        b',"transactions":[', b','.join(payload for _, payload in rows), b']}'))
+    return Response(content=body, media_type="application/json")
+
+def require_admin(request: Request):
+    """Admin endpoints are only served to whitelisted client IPs."""
+    if request.client is None or not firewall.is_whitelisted(request.client.host):
+        raise HTTPException(status_code=403, detail="Admin access requires a whitelisted IP")
+
+@app.get("/admin/firewall")
+async def firewall_stats(request: Request):
+    require_admin(request)
+    return firewall.get_stats()
+
+@app.post("/admin/firewall/reload")
+async def reload_firewall(request: Request):
+    require_admin(request)
+    # Large blacklist files take a while to parse, so keep it off the event loop
+    if not await asyncio.get_running_loop().run_in_executor(None, firewall.reload):
+        raise HTTPException(status_code=500, detail="Failed to reload firewall config; previous settings kept")
+    return firewall.get_stats()
+
+@app.get("/admin/model")
+async def model_info(request: Request):
+    require_admin(request)
+    return model_registry.get_stats()
+
+@app.post("/admin/model/reload")
+async def reload_model(request: Request):
+    require_admin(request)
+    # Load, compile and warm up in a worker thread; /score keeps using the live model meanwhile
+    swapped = await asyncio.get_running_loop().run_in_executor(None, model_registry.reload, True)
+    if not swapped and model_registry.last_error:
+        raise HTTPException(status_code=500, detail=f"Model reload failed: {model_registry.last_error}")
+    return {"swapped": swapped, **model_registry.get_stats()}
+
+@app.post("/admin/model/rollback")
+async def rollback_model(request: Request, version: Optional[str] = None):
+    require_admin(request)
+    try:
+        # rollback waits for the registry lock, which a concurrent reload holds for its whole load
+        await asyncio.get_running_loop().run_in_executor(None, model_registry.rollback, version)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return model_registry.get_stats()
 
 if __name__ == "__main__":
-    # Start the analysis broadcast task
-    asyncio.create_task(broadcast_analysis())
+    # The analysis broadcast task starts with the first /ws/analysis connection
     uvicorn.run(app, host="127.0.0.1", port=8080, reload=True)
\ No newline at end of file
@@ -0,0 +1,199 @@
+import argparse
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Deque, Dict, Optional, Tuple
+import pandas as pd
+from feature_store import OnlineFeatureStore, resolve_location
+from model_registry import ModelBundle, load_bundle
+from pipeline_io import build_fingerprint, iter_table, write_table
+from scoring import FEATURE_COLUMNS, FRAUD_THRESHOLD, FraudExplainer, explanation_fields, get_severity
+
+# Column names of other exports (e.g. output/transactions.json) mapped onto the backend's
+COLUMN_ALIASES = {'customer_id': 'user_id', 'transaction_date': 'timestamp', 'transaction_location': 'location'}
+# Input columns copied to the output next to the scores, when present
+PASSTHROUGH_COLUMNS = ['txn_id', 'transaction_id', 'user_id', 'timestamp', 'location', 'is_fraud', 'is_fraudulent']
+SERVER_FEATURE_COLUMNS = ['txn_count_window', 'decayed_txn_count']
+CHECKPOINT_FILE = 'checkpoint.json'
+
+# Per-worker state, loaded once by init_worker
+_bundle: Optional[ModelBundle] = None
+_explainer: Optional[FraudExplainer] = None
+
+
+def init_worker(model_path: str, engine: str):
+    global _bundle, _explainer
+    _bundle = load_bundle(model_path, engine)
+    _explainer = FraudExplainer()
+
+
+def derive_features(chunk: pd.DataFrame, store: OnlineFeatureStore) -> pd.DataFrame:
+    """Add the features /score/event would derive, replaying events through the same feature store.
+
+    Rows are applied in file order, so the input should be sorted by time for
+    the features to match what the live backend saw.
+    """
+    timestamps = pd.to_datetime(chunk['timestamp'])
+    # Naive timestamps are taken as UTC for the clock; hour_of_day is the local hour as written
+    if timestamps.dt.tz is None:
+        epochs = (timestamps - pd.Timestamp(0)) / pd.Timedelta(seconds=1)
+    else:
+        epochs = (timestamps - pd.Timestamp(0, tz='UTC')) / pd.Timedelta(seconds=1)
+    if 'latitude' in chunk.columns and 'longitude' in chunk.columns:
+        coords = zip(chunk['latitude'], chunk['longitude'])
+    else:
+        coords = map(resolve_location, chunk['location'] if 'location' in chunk.columns else [None] * len(chunk))
+
+    derived = [store.update(str(user_id), epoch, lat, lon)
+               for user_id, epoch, (lat, lon) in zip(chunk['user_id'], epochs.to_numpy(), coords)]
+    chunk = chunk.copy()
+    chunk['hour_of_day'] = timestamps.dt.hour.to_numpy()
+    for col in ['velocity', 'geo_distance'] + SERVER_FEATURE_COLUMNS:
+        chunk[col] = [d[col] for d in derived]
+    return chunk
+
+
+def score_chunk(chunk: pd.DataFrame, threshold: float) -> pd.DataFrame:
+    """Score, grade and explain one chunk like /score/batch does (runs in a worker process)."""
+    features = chunk[FEATURE_COLUMNS].to_numpy(dtype=float)
+    scores = _bundle.predict(features)
+    flagged = scores > threshold
+    fields = pd.DataFrame([explanation_fields(d) for d in _explainer.explain_batch(features, scores, flagged)],
+                          index=chunk.index)
+    fields['factors_analyzed'] = [json.dumps(f, separators=(",", ":")) for f in fields['factors_analyzed']]
+
+    kept = [col for col in PASSTHROUGH_COLUMNS + FEATURE_COLUMNS + SERVER_FEATURE_COLUMNS if col in chunk.columns]
+    out = chunk[kept].copy()
+    out['fraud_score'] = scores
+    out['is_flagged'] = flagged
+    out['severity'] = [get_severity(s) for s in scores.tolist()]
+    out = pd.concat([out, fields], axis=1)
+    out['model_version'] = _bundle.version
+    return out
+
+
+def part_path(output_dir: str, index: int, fmt: str) -> str:
+    return os.path.join(output_dir, f"part-{index:06d}.{fmt}")
+
+
+def load_checkpoint(output_dir: str, fingerprint: Dict[str, Any], restart: bool) -> Dict[str, Any]:
+    """Progress of an earlier run with the same input, model and settings (empty progress otherwise)."""
+    path = os.path.join(output_dir, CHECKPOINT_FILE)
+    fresh = {"fingerprint": fingerprint, "chunks": 0, "rows": 0, "flagged": 0}
+    if not os.path.exists(path):
+        return fresh
+    with open(path, 'r') as f:
+        checkpoint = json.load(f)
+    if restart:
+        for name in os.listdir(output_dir):
+            if name.startswith('part-'):
+                os.remove(os.path.join(output_dir, name))
+        return fresh
+    if checkpoint.get("fingerprint") != fingerprint:
+        raise SystemExit(f"{output_dir} holds a backfill of a different input, model or settings; "
+                         f"use --restart to discard it or pick another --output")
+    return checkpoint
+
+
+def save_checkpoint(output_dir: str, checkpoint: Dict[str, Any]):
+    tmp_path = os.path.join(output_dir, CHECKPOINT_FILE + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_path, os.path.join(output_dir, CHECKPOINT_FILE))
+
+
+def backfill(input_path: str, output_dir: str, model_path: str = 'model.joblib', engine: str = 'compiled',
+             chunksize: int = 100_000, workers: Optional[int] = None, features: str = 'auto', fmt: str = 'parquet',
+             threshold: float = FRAUD_THRESHOLD, restart: bool = False) -> Dict[str, Any]:
+    """Rescore a historical table into ``output_dir/part-NNNNNN.<fmt>``, one part per input chunk.
+
+    Chunks are read and featurized in this process, scored in a pool of
+    workers that each load the model once, and written in input order. The
+    checkpoint is updated after every part, so an interrupted run resumes at
+    the first unwritten chunk; earlier chunks are still read, and replayed
+    through the feature store, but not rescored.
+    """
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(output_dir, exist_ok=True)
+    version = load_bundle(model_path, engine).version  # Fail before starting workers if the model is unusable
+    fingerprint = build_fingerprint([input_path, model_path], {
+        "chunksize": chunksize, "features": features, "threshold": threshold, "engine": engine, "format": fmt})
+    checkpoint = load_checkpoint(output_dir, fingerprint, restart)
+    resume_at = checkpoint["chunks"]
+    if resume_at:
+        print(f"Resuming after {resume_at} chunks ({checkpoint['rows']} rows) already written to {output_dir}")
+
+    store = OnlineFeatureStore()
+    pending: Deque[Tuple[int, Any]] = deque()
+    started = time.perf_counter()
+    scored = 0
+
+    def write_next():
+        nonlocal scored
+        index, future = pending.popleft()
+        out = future.result()
+        # Write under a temporary name first so a part file is never seen half-written
+        path = part_path(output_dir, index, fmt)
+        tmp_path = os.path.join(output_dir, f".tmp-{index:06d}.{fmt}")
+        write_table(out, tmp_path)
+        os.replace(tmp_path, path)
+        scored += len(out)
+        checkpoint.update(chunks=index + 1, rows=checkpoint["rows"] + len(out),
+                          flagged=checkpoint["flagged"] + int(out['is_flagged'].sum()))
+        save_checkpoint(output_dir, checkpoint)
+        elapsed = time.perf_counter() - started
+        print(f"Chunk {index}: {checkpoint['rows']:,} rows written, {checkpoint['flagged']:,} flagged "
+              f"({scored / elapsed:,.0f} rows/s)")
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(model_path, engine)) as executor:
+        for index, chunk in enumerate(iter_table(input_path, chunksize)):
+            chunk = chunk.rename(columns={k: v for k, v in COLUMN_ALIASES.items() if v not in chunk.columns})
+            use_input = features == 'input' or (features == 'auto' and set(FEATURE_COLUMNS) <= set(chunk.columns))
+            if not use_input:
+                chunk = derive_features(chunk, store)
+            if index < resume_at:
+                continue
+            pending.append((index, executor.submit(score_chunk, chunk, threshold)))
+            # Keep every worker busy while bounding how many scored chunks wait in memory
+            while len(pending) > 2 * workers or (pending and pending[0][1].done()):
+                write_next()
+        while pending:
+            write_next()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "output": output_dir,
+        "model_version": version,
+        "chunks": checkpoint["chunks"],
+        "rows": checkpoint["rows"],
+        "flagged": checkpoint["flagged"],
+        "rows_scored_this_run": scored,
+        "seconds": round(elapsed, 2),
+        "rows_per_second": round(scored / elapsed) if elapsed else 0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rescore historical transactions offline with the backend's scoring code.")
+    parser.add_argument("--input", default="transactions.csv",
+                        help="CSV, NDJSON (.json/.ndjson/.jsonl), Parquet or Feather table. Sort raw events by time first.")
+    parser.add_argument("--output", default="backfill_scores", help="Directory for part files and the checkpoint.")
+    parser.add_argument("--format", choices=["parquet", "feather", "csv"], default="parquet", help="Part file format.")
+    parser.add_argument("--model", default="model.joblib")
+    parser.add_argument("--engine", choices=["compiled", "catboost"], default="compiled")
+    parser.add_argument("--features", choices=["auto", "input", "server"], default="auto",
+                        help="'input' scores the table's own feature columns, 'server' derives them like /score/event; "
+                             "'auto' uses the table's columns when all are present.")
+    parser.add_argument("--threshold", type=float, default=FRAUD_THRESHOLD)
+    parser.add_argument("--chunksize", type=int, default=100_000, help="Rows per chunk (and per part file).")
+    parser.add_argument("--workers", type=int, default=None, help="Scoring processes (default: all cores).")
+    parser.add_argument("--restart", action="store_true", help="Discard an existing checkpoint and part files.")
+    args = parser.parse_args()
+
+    summary = backfill(args.input, args.output, args.model, args.engine, args.chunksize, args.workers,
+                       args.features, args.format, args.threshold, args.restart)
+    print(f"Backfill complete: {summary['rows']:,} rows in {summary['chunks']} parts, {summary['flagged']:,} flagged, "
+          f"model {summary['model_version']}; {summary['rows_scored_this_run']:,} rows scored in "
+          f"{summary['seconds']}s ({summary['rows_per_second']:,} rows/s)")
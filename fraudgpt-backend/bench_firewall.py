@@ -0,0 +1,53 @@
+import argparse
+import ipaddress
+import random
+import time
+from firewall import CidrIndex
+
+# Benchmark Firewall blacklist lookups: compiled CidrIndex vs the old linear scan
+parser = argparse.ArgumentParser(description="Benchmark CIDR lookups at different blocklist sizes.")
+parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000], help="Numbers of prefixes to index.")
+parser.add_argument("--lookups", type=int, default=200_000, help="Lookups timed per size.")
+parser.add_argument("--linear-lookups", type=int, default=200, help="Lookups timed for the linear scan baseline.")
+parser.add_argument("--seed", type=int, default=42)
+args = parser.parse_args()
+
+rng = random.Random(args.seed)
+
+def random_networks(n):
+    """Random prefixes, ~90% IPv4 (/8-/32) and ~10% IPv6 (/32-/128)."""
+    networks = []
+    for _ in range(n):
+        if rng.random() < 0.9:
+            networks.append(ipaddress.IPv4Network((rng.getrandbits(32), rng.randint(8, 32)), strict=False))
+        else:
+            networks.append(ipaddress.IPv6Network((rng.getrandbits(128), rng.randint(32, 128)), strict=False))
+    return networks
+
+def random_addresses(n):
+    return [
+        ipaddress.IPv4Address(rng.getrandbits(32)) if rng.random() < 0.9 else ipaddress.IPv6Address(rng.getrandbits(128))
+        for _ in range(n)
+    ]
+
+print(f"{'prefixes':>10} {'build (s)':>10} {'index (ns/lookup)':>18} {'linear (ns/lookup)':>19} {'hit rate':>9}")
+for size in args.sizes:
+    networks = random_networks(size)
+
+    start = time.perf_counter()
+    index = CidrIndex(networks)
+    build_seconds = time.perf_counter() - start
+
+    addresses = random_addresses(args.lookups)
+    start = time.perf_counter()
+    hits = sum(1 for addr in addresses if addr in index)
+    index_ns = (time.perf_counter() - start) / len(addresses) * 1e9
+
+    linear_sample = addresses[:args.linear_lookups]
+    start = time.perf_counter()
+    linear_hits = sum(1 for addr in linear_sample if any(addr in net for net in networks))
+    linear_ns = (time.perf_counter() - start) / len(linear_sample) * 1e9
+
+    # Both strategies must agree on the sampled addresses
+    assert linear_hits == sum(1 for addr in linear_sample if addr in index)
+    print(f"{size:>10,} {build_seconds:>10.2f} {index_ns:>18,.0f} {linear_ns:>19,.0f} {hits / len(addresses):>9.1%}")
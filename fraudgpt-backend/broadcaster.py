@@ -0,0 +1,149 @@
+import asyncio
+import json
+import logging
+from typing import Any, Dict, Optional
+
+from fastapi import WebSocket
+
+logger = logging.getLogger(__name__)
+
+# What to do when a client's send queue is full
+OVERFLOW_POLICIES = (
+    'drop_oldest',  # discard the oldest queued message to make room
+    'drop_newest',  # discard the incoming message
+    'coalesce',     # discard everything queued and keep only the newest message
+    'disconnect',   # close the lagging client
+)
+
+
+def encode_message(msg: Dict[str, Any]) -> str:
+    """Encode a message exactly like WebSocket.send_json does, so it can be sent with send_text."""
+    return json.dumps(msg, separators=(",", ":"), ensure_ascii=False)
+
+
+class ClientChannel:
+    """A WebSocket client with its own bounded send queue drained by a writer task."""
+
+    def __init__(self, ws: WebSocket, queue_size: int):
+        self.ws = ws
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.writer: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+
+class Broadcaster:
+    """Fans pre-encoded messages out to WebSocket clients without waiting on any of them.
+
+    publish() only enqueues, so a slow or stalled client never delays the caller
+    or the other clients. Each client's queue is bounded; on overflow the
+    configured policy decides what is dropped.
+    """
+
+    def __init__(self, name: str, queue_size: int = 256, overflow_policy: str = 'drop_oldest'):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{overflow_policy}', expected one of {OVERFLOW_POLICIES}")
+        self.name = name
+        self.queue_size = queue_size
+        self.overflow_policy = overflow_policy
+        self.clients: Dict[WebSocket, ClientChannel] = {}
+        self.published = 0
+        self.disconnected_lagging = 0
+
+    def __len__(self) -> int:
+        return len(self.clients)
+
+    def register(self, ws: WebSocket) -> ClientChannel:
+        """Start a writer task for an accepted WebSocket."""
+        channel = ClientChannel(ws, self.queue_size)
+        channel.writer = asyncio.get_running_loop().create_task(self._write(channel))
+        self.clients[ws] = channel
+        return channel
+
+    def unregister(self, ws: WebSocket):
+        channel = self.clients.pop(ws, None)
+        if channel is not None and channel.writer is not None and channel.writer is not asyncio.current_task():
+            channel.writer.cancel()
+
+    async def _write(self, channel: ClientChannel):
+        try:
+            while True:
+                message = await channel.queue.get()
+                await channel.ws.send_text(message)
+                channel.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.info(f"Dropping {self.name} WebSocket client after send failure: {e}")
+            self.unregister(channel.ws)
+
+    def _enqueue(self, ws: WebSocket, channel: ClientChannel, message: str) -> bool:
+        queue = channel.queue
+        if queue.full():
+            channel.dropped += 1
+            if self.overflow_policy == 'drop_newest':
+                return False
+            if self.overflow_policy == 'disconnect':
+                self.disconnected_lagging += 1
+                self.unregister(ws)
+                asyncio.get_running_loop().create_task(self._close(ws))
+                return False
+            if self.overflow_policy == 'coalesce':
+                channel.dropped += queue.qsize() - 1
+                while not queue.empty():
+                    queue.get_nowait()
+            else:
+                queue.get_nowait()
+        queue.put_nowait(message)
+        if queue.qsize() > channel.max_depth:
+            channel.max_depth = queue.qsize()
+        return True
+
+    def publish(self, message: str):
+        """Queue an already-encoded message for every client."""
+        self.published += 1
+        for ws, channel in list(self.clients.items()):
+            self._enqueue(ws, channel, message)
+
+    def send(self, ws: WebSocket, message: str) -> bool:
+        """Queue an already-encoded message for one client.
+
+        Returns False if the message or an earlier queued one was dropped, or
+        the client is gone, so callers sending incremental updates can resync.
+        """
+        channel = self.clients.get(ws)
+        if channel is None:
+            return False
+        dropped = channel.dropped
+        return self._enqueue(ws, channel, message) and channel.dropped == dropped
+
+    @staticmethod
+    async def _close(ws: WebSocket):
+        try:
+            await ws.close(code=1013)  # Try again later
+        except Exception:
+            pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return per-client queue depth and drop counters."""
+        clients = []
+        for ws, channel in self.clients.items():
+            client = getattr(ws, 'client', None)
+            clients.append({
+                "client": f"{client.host}:{client.port}" if client else "unknown",
+                "queue_depth": channel.queue.qsize(),
+                "max_queue_depth": channel.max_depth,
+                "sent": channel.sent,
+                "dropped": channel.dropped,
+            })
+        return {
+            "connections": len(self.clients),
+            "queue_size": self.queue_size,
+            "overflow_policy": self.overflow_policy,
+            "published": self.published,
+            "disconnected_lagging": self.disconnected_lagging,
+            "total_queue_depth": sum(c["queue_depth"] for c in clients),
+            "total_dropped": sum(c["dropped"] for c in clients),
+            "clients": clients,
+        }
@@ -0,0 +1,117 @@
+import logging
+from typing import List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Largest number of border-bin cells (product of per-feature bin counts) that is
+# compiled into a lookup table. The trained depth-2 model has 11 * 4 * 2 * 3 = 264.
+MAX_TABLE_CELLS = 1 << 20
+
+
+def _scaled_float32(x: float, mean: float, scale: float) -> np.float32:
+    """Reproduce StandardScaler.transform followed by CatBoost's float32 cast."""
+    with np.errstate(over='ignore'):  # Bisection probes values far outside float32 range
+        return np.float32((np.float64(x) - mean) / scale)
+
+
+def _fold_border(border: np.float32, mean: float, scale: float) -> float:
+    """Return the smallest raw value x whose scaled value lies above the border.
+
+    The scaled value is monotone in x, so bisecting down to adjacent float64
+    values finds the exact raw cut point: ``x >= cut`` holds exactly when
+    CatBoost would see ``scaled(x) > border``.
+    """
+    lo, hi = -np.finfo(np.float64).max, np.finfo(np.float64).max
+    while True:
+        mid = lo / 2 + hi / 2
+        if mid <= lo or mid >= hi:
+            mid = np.nextafter(lo, hi)
+            if mid >= hi:
+                return float(hi)
+        if _scaled_float32(mid, mean, scale) > border:
+            hi = mid
+        else:
+            lo = mid
+
+
+def _bin_representatives(borders: np.ndarray) -> np.ndarray:
+    """One scaled value per border bin: bin k holds values above k borders and at or below the rest."""
+    if len(borders) == 0:
+        return np.zeros(1)
+    above_all = np.nextafter(borders[-1], np.float32(np.inf))
+    return np.append(borders, above_all).astype(np.float64)
+
+
+class CompiledModel:
+    """CatBoost oblivious-tree model compiled into raw-value cut points and a probability table.
+
+    An oblivious-tree ensemble over float features is constant between split
+    borders, so its output depends only on which border bin each feature falls
+    in. At load time the StandardScaler is folded into the borders and the model
+    is evaluated once per bin combination. Scoring is then ``np.searchsorted``
+    per feature plus one table lookup, and matches
+    ``model.predict_proba(scaler.transform(X))[:, 1]`` bit for bit, including
+    on missing (NaN) values and on rejecting infinite ones.
+    """
+
+    def __init__(self, cuts: List[np.ndarray], table: np.ndarray, nan_mode: str = 'Min'):
+        if nan_mode not in ('Min', 'Max', 'Forbidden'):
+            raise ValueError(f"Unknown nan_mode '{nan_mode}'")
+        self.cuts = cuts
+        self.nan_mode = nan_mode
+        self.bin_counts = np.array([len(c) + 1 for c in cuts], dtype=np.int64)
+        # Row-major strides turning a row of bin indices into a flat table index
+        self.strides = np.append(np.cumprod(self.bin_counts[::-1])[::-1][1:], 1).astype(np.int64)
+        self.table = table
+
+    @classmethod
+    def from_catboost(cls, model, scaler) -> "CompiledModel":
+        """Compile a fitted CatBoostClassifier and the StandardScaler it was trained behind."""
+        n_features = int(scaler.n_features_in_)
+        if getattr(model, 'get_cat_feature_indices', lambda: [])():
+            raise ValueError("Models with categorical features cannot be compiled")
+        if len(getattr(model, 'classes_', [0, 1])) != 2:
+            raise ValueError("Only binary classifiers can be compiled")
+
+        model_borders = model.get_borders()
+        borders = [np.asarray(model_borders.get(i, []), dtype=np.float32) for i in range(n_features)]
+
+        n_cells = int(np.prod([len(b) + 1 for b in borders]))
+        if n_cells > MAX_TABLE_CELLS:
+            raise ValueError(f"Model has {n_cells} border-bin cells; the limit is {MAX_TABLE_CELLS}")
+
+        mean = scaler.mean_ if getattr(scaler, 'mean_', None) is not None else np.zeros(n_features)
+        std = scaler.scale_ if getattr(scaler, 'scale_', None) is not None else np.ones(n_features)
+        cuts = [
+            np.array([_fold_border(b, float(mean[i]), float(std[i])) for b in borders[i]], dtype=np.float64)
+            for i in range(n_features)
+        ]
+
+        # Evaluate the model once per cell, in the same row-major order as the strides
+        representatives = [_bin_representatives(b) for b in borders]
+        grid = np.stack(np.meshgrid(*representatives, indexing='ij'), axis=-1).reshape(-1, n_features)
+        table = model.predict_proba(grid)[:, 1]
+        logger.info(f"Compiled model into {n_cells} border-bin cells")
+        return cls(cuts, table, model.get_all_params().get('nan_mode', 'Min'))
+
+    def bin_features(self, features: np.ndarray) -> np.ndarray:
+        """Map raw feature rows to per-feature border-bin indices."""
+        features = np.asarray(features, dtype=np.float64).reshape(-1, len(self.cuts))
+        # StandardScaler.transform rejects infinities, so the CatBoost path never scores them
+        if np.isinf(features).any():
+            raise ValueError("Input contains infinity")
+        missing = np.isnan(features)
+        if self.nan_mode == 'Forbidden' and missing.any():
+            raise ValueError("Input contains NaN and the model was trained with nan_mode=Forbidden")
+        bins = np.empty(features.shape, dtype=np.int64)
+        for i, cut in enumerate(self.cuts):
+            bins[:, i] = np.searchsorted(cut, features[:, i], side='right')
+            # nan_mode=Min treats a missing value as below every border, Max as above all of them
+            bins[missing[:, i], i] = 0 if self.nan_mode == 'Min' else len(cut)
+        return bins
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        """Return fraud probabilities for an (n, n_features) matrix of raw feature values."""
+        return self.table[self.bin_features(features) @ self.strides]
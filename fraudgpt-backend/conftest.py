@@ -0,0 +1,24 @@
+import importlib
+import shutil
+import pytest
+
+
+@pytest.fixture(scope="session")
+def backend_workdir(tmp_path_factory):
+    # The server keeps its logs, history and config relative to the working directory
+    workdir = tmp_path_factory.mktemp("backend")
+    for name in ["firewall_config.json", "model.joblib"]:
+        shutil.copy(name, workdir / name)
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.chdir(workdir)
+        module = importlib.import_module("backend")
+    module.model_registry.close()  # No hot reload: tests run from other directories too
+    yield workdir
+    module.transaction_store.close()
+
+
+@pytest.fixture
+def backend(backend_workdir, monkeypatch):
+    """The imported backend module, with the working directory set to its own temporary one."""
+    monkeypatch.chdir(backend_workdir)
+    return importlib.import_module("backend")
@@ -1,9 +1,149 @@
+import argparse
+import json
+from typing import Dict, List, Optional
+import numpy as np
 import pandas as pd
-from sklearn.metrics import precision_score, recall_score
-df = pd.read_csv("fraud_scores.csv")
-y_true = df['is_fraud']
-for threshold in [0.3, 0.5, 0.7]:
-    y_pred = df['fraud_score'] > threshold
-    print(f"\nThreshold: {threshold}")
-    print(f"Precision: {precision_score(y_true, y_pred):.2f}")
-    print(f"Recall: {recall_score(y_true, y_pred):.2f}")
\ No newline at end of file
+from pipeline_io import read_table
+
+SEVERITIES = ('MEDIUM', 'HIGH', 'CRITICAL')
+COUNT_COLUMNS = ('alerts', 'true_positives', 'false_positives')
+
+
+def threshold_curve(y_true: np.ndarray, scores: np.ndarray, beta: float = 1.0) -> pd.DataFrame:
+    """Precision/recall/F-beta at every distinct score, from one sort and cumulative sums.
+
+    Row i describes flagging every transaction with ``score >= min_score``.
+    ``threshold`` is the matching value for backend.py's ``score > FRAUD_THRESHOLD``
+    rule: the next lower distinct score. Rows are ordered by increasing alerts.
+    """
+    y_true = np.asarray(y_true, dtype=bool)
+    scores = np.asarray(scores, dtype=np.float64)
+    order = np.argsort(-scores, kind='stable')
+    sorted_scores = scores[order]
+    tp = np.cumsum(y_true[order], dtype=np.int64)
+    # Last position of each run of equal scores
+    ends = np.flatnonzero(np.append(sorted_scores[1:] != sorted_scores[:-1], True))
+    alerts = ends + 1
+    tp = tp[ends]
+    positives = tp[-1] if len(tp) else 0
+    min_score = sorted_scores[ends]
+    threshold = np.append(min_score[1:], np.nextafter(min_score[-1], -np.inf)) if len(ends) else min_score
+    precision = tp / alerts
+    recall = tp / positives if positives else np.zeros(len(tp))
+    b2 = beta * beta
+    with np.errstate(invalid='ignore', divide='ignore'):
+        f_beta = np.where(precision + recall > 0, (1 + b2) * precision * recall / (b2 * precision + recall), 0.0)
+    return pd.DataFrame({
+        'threshold': threshold,
+        'min_score': min_score,
+        'alerts': alerts,
+        'true_positives': tp,
+        'false_positives': alerts - tp,
+        'precision': precision,
+        'recall': recall,
+        'f_beta': f_beta,
+    })
+
+
+def add_workload(curve: pd.DataFrame, hours: Optional[float], review_minutes: float) -> pd.DataFrame:
+    """Alert rate and analyst time, given the time span the scores cover."""
+    if hours:
+        curve['alerts_per_hour'] = curve['alerts'] / hours
+        curve['review_hours_per_day'] = curve['alerts_per_hour'] * 24 * review_minutes / 60
+    return curve
+
+
+def operating_point(curve: pd.DataFrame, threshold: float) -> pd.Series:
+    """The curve row that ``score > threshold`` selects (all zeros if nothing is flagged)."""
+    # min_score decreases along the curve; find the last row whose scores all exceed the threshold
+    i = np.searchsorted(-curve['min_score'].to_numpy(), -threshold, side='left') - 1
+    if i < 0:
+        row = curve.iloc[0].copy()
+        row[:] = 0
+        row['threshold'] = threshold
+        return row
+    return curve.iloc[i]
+
+
+def best_row(curve: pd.DataFrame, mask: np.ndarray, column: str = 'recall') -> Optional[pd.Series]:
+    """Row maximizing ``column`` among ``mask`` (fewest alerts on ties)."""
+    if not mask.any():
+        return None
+    candidates = curve[mask]
+    return candidates.iloc[int(np.argmax(candidates[column].to_numpy()))]
+
+
+def recommend(curve: pd.DataFrame, target_precision: Optional[float], alert_budget: Optional[float],
+              severity_precisions: List[float]) -> Dict:
+    """Pick FRAUD_THRESHOLD and get_severity cutoffs from the curve."""
+    if target_precision is not None:
+        row = best_row(curve, curve['precision'].to_numpy() >= target_precision)
+        rule = f"max recall with precision >= {target_precision}"
+    elif alert_budget is not None:
+        if 'alerts_per_hour' not in curve:
+            raise SystemExit("--alert-budget needs --hours or a timestamp column")
+        row = best_row(curve, curve['alerts_per_hour'].to_numpy() <= alert_budget)
+        rule = f"max recall with <= {alert_budget} alerts/hour"
+    else:
+        row = best_row(curve, np.ones(len(curve), dtype=bool), 'f_beta')
+        rule = "max F-beta"
+    if row is None:
+        raise SystemExit(f"No threshold satisfies: {rule}")
+
+    # Severity cutoffs (get_severity uses score >=): the lowest score that keeps each precision tier
+    cutoffs = {}
+    for severity, min_precision in zip(SEVERITIES, severity_precisions):
+        tier = best_row(curve, curve['precision'].to_numpy() >= min_precision, 'alerts')
+        cutoffs[severity] = None if tier is None else float(tier['min_score'])
+    return {
+        "rule": rule,
+        "FRAUD_THRESHOLD": float(row['threshold']),
+        "operating_point": {k: int(v) if k in COUNT_COLUMNS else float(v) for k, v in row.items()},
+        "severity_cutoffs": cutoffs,
+        "severity_precisions": dict(zip(SEVERITIES, severity_precisions)),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Threshold sweep over scored transactions.")
+    parser.add_argument("--scores", default="fraud_scores.csv", help="Scored table (.csv, .parquet or .feather).")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.3, 0.5, 0.7],
+                        help="FRAUD_THRESHOLD values to report (flagged when score > threshold).")
+    parser.add_argument("--beta", type=float, default=1.0, help="Recall weight in F-beta.")
+    parser.add_argument("--target-precision", type=float, default=None, help="Recommend the max-recall threshold at this precision.")
+    parser.add_argument("--alert-budget", type=float, default=None, help="Recommend the max-recall threshold within this many alerts/hour.")
+    parser.add_argument("--hours", type=float, default=None,
+                        help="Hours of traffic the scores cover (default: span of the timestamp column, if any).")
+    parser.add_argument("--review-minutes", type=float, default=5.0, help="Analyst minutes per alert.")
+    parser.add_argument("--severity-precisions", type=float, nargs=3, default=[0.5, 0.8, 0.95],
+                        help="Precision each of MEDIUM, HIGH, CRITICAL must keep.")
+    parser.add_argument("--curve-output", default="threshold_curve.csv", help="Full curve, one row per distinct score.")
+    parser.add_argument("--recommend-output", default="threshold_recommendation.json")
+    args = parser.parse_args()
+
+    df = read_table(args.scores)
+    hours = args.hours
+    if hours is None and 'timestamp' in df.columns:
+        timestamps = pd.to_datetime(df['timestamp'])
+        hours = (timestamps.max() - timestamps.min()).total_seconds() / 3600 or None
+
+    curve = add_workload(threshold_curve(df['is_fraud'].to_numpy(), df['fraud_score'].to_numpy(), args.beta),
+                         hours, args.review_minutes)
+
+    for threshold in args.thresholds:
+        point = operating_point(curve, threshold)
+        print(f"\nThreshold: {threshold}")
+        print(f"Precision: {point['precision']:.2f}")
+        print(f"Recall: {point['recall']:.2f}")
+        print(f"F{args.beta:g}: {point['f_beta']:.2f}")
+        print(f"Alerts: {int(point['alerts'])}" + (f" ({point['alerts_per_hour']:.1f}/hour)" if hours else ""))
+
+    curve.to_csv(args.curve_output, index=False)
+    print(f"\nThreshold curve ({len(curve)} points) saved to {args.curve_output}")
+
+    recommendation = recommend(curve, args.target_precision, args.alert_budget, args.severity_precisions)
+    with open(args.recommend_output, 'w') as f:
+        json.dump(recommendation, f, indent=2)
+    print(f"Recommended FRAUD_THRESHOLD ({recommendation['rule']}): {recommendation['FRAUD_THRESHOLD']:.6f}")
+    print(f"Recommended severity cutoffs (score >=): {recommendation['severity_cutoffs']}")
+    print(f"Recommendation saved to {args.recommend_output}")
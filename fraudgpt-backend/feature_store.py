@@ -0,0 +1,152 @@
+import heapq
+import math
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from gazetteer import get_gazetteer
+
+# Locations the gazetteer cannot place fall back to Boston, as in training
+DEFAULT_LOCATION = "Boston, MA"
+MAX_GEO_DISTANCE_KM = 1200  # Distances are capped, as in training
+EARTH_RADIUS_KM = 6371.0088
+
+# Velocity follows the training definition: 1 / hours since the user's previous
+# transaction, with the gap clipped to [MIN_GAP_HOURS, MAX_GAP_HOURS]
+MIN_GAP_HOURS = 0.01
+MAX_GAP_HOURS = 15
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance in kilometres."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def resolve_location(location: Optional[str]) -> Tuple[float, float]:
+    """Map a location string to coordinates the same way preprocessing does."""
+    gazetteer = get_gazetteer()
+    return gazetteer.lookup(location) or gazetteer.lookup(DEFAULT_LOCATION)
+
+
+class UserState:
+    """Per-user rolling state; every field is updated in O(1) per event."""
+    __slots__ = ('last_ts', 'lat', 'lon', 'recent', 'decayed_count')
+
+    def __init__(self):
+        self.last_ts: Optional[float] = None
+        self.lat = 0.0
+        self.lon = 0.0
+        self.recent: Deque[float] = deque()  # Event timestamps inside the velocity window
+        self.decayed_count = 0.0  # Exponentially time-decayed event count as of last_ts
+
+
+class OnlineFeatureStore:
+    """In-memory per-user feature state for deriving velocity and geo_distance at serving time.
+
+    Users are kept in an OrderedDict in least-recently-seen order, and a min-heap
+    of (latest event time, user) tracks idleness in event time, since events may
+    arrive out of order. States whose latest event is more than ``ttl_seconds``
+    behind the newest event seen are evicted as new events arrive, and the least
+    recently seen user is evicted once ``max_users`` is reached, so memory stays
+    bounded however many users appear.
+    """
+
+    def __init__(self, window_seconds: float = 3600, half_life_seconds: float = 3600,
+                 ttl_seconds: float = 7 * 86400, max_users: int = 500_000):
+        self.window_seconds = window_seconds
+        self.decay_rate = math.log(2) / half_life_seconds
+        self.ttl_seconds = ttl_seconds
+        self.max_users = max_users
+        self.users: "OrderedDict[str, UserState]" = OrderedDict()
+        # One entry per change of a user's last_ts; entries no longer matching it are skipped
+        self.expiry: List[Tuple[float, str]] = []
+        self.watermark = float('-inf')  # Latest event time seen
+        self.events = 0
+        self.evicted_ttl = 0
+        self.evicted_capacity = 0
+
+    def __len__(self) -> int:
+        return len(self.users)
+
+    def _evict(self):
+        horizon = self.watermark - self.ttl_seconds
+        expiry = self.expiry
+        while expiry and expiry[0][0] < horizon:
+            last_ts, user_id = heapq.heappop(expiry)
+            state = self.users.get(user_id)
+            if state is not None and state.last_ts == last_ts:
+                del self.users[user_id]
+                self.evicted_ttl += 1
+        while len(self.users) > self.max_users:
+            self.users.popitem(last=False)
+            self.evicted_capacity += 1
+        # Stale entries of active users pile up in the heap; rebuild it once they dominate
+        if len(expiry) > 2 * len(self.users) + 1024:
+            self.expiry = [(state.last_ts, user_id) for user_id, state in self.users.items()]
+            heapq.heapify(self.expiry)
+
+    def update(self, user_id: str, timestamp: float, lat: float, lon: float) -> Dict[str, float]:
+        """Record an event and return the features derived from the user's previous state.
+
+        ``timestamp`` is in seconds. Events older than the user's latest event
+        get velocity 0 and do not move the user's clock back.
+        """
+        self.events += 1
+        if timestamp > self.watermark:
+            self.watermark = timestamp
+
+        state = self.users.get(user_id)
+        if state is None:
+            state = self.users[user_id] = UserState()
+        else:
+            self.users.move_to_end(user_id)
+
+        velocity = 0.0
+        geo_distance = 0.0
+        if state.last_ts is not None:
+            gap_hours = (timestamp - state.last_ts) / 3600
+            if gap_hours > 0:
+                velocity = 1 / min(max(gap_hours, MIN_GAP_HOURS), MAX_GAP_HOURS)
+            geo_distance = min(haversine_km(state.lat, state.lon, lat, lon), MAX_GEO_DISTANCE_KM)
+
+        # Windowed event count and decayed count, advanced to this event
+        recent = state.recent
+        while recent and recent[0] <= timestamp - self.window_seconds:
+            recent.popleft()
+        window_count = len(recent)
+        if state.last_ts is None:
+            state.decayed_count = 1.0
+            state.last_ts = timestamp
+            heapq.heappush(self.expiry, (timestamp, user_id))
+        elif timestamp >= state.last_ts:
+            state.decayed_count = state.decayed_count * math.exp(-self.decay_rate * (timestamp - state.last_ts)) + 1
+            if timestamp > state.last_ts:
+                heapq.heappush(self.expiry, (timestamp, user_id))
+            state.last_ts = timestamp
+        else:
+            state.decayed_count += math.exp(-self.decay_rate * (state.last_ts - timestamp))
+        if not recent or timestamp >= recent[-1]:
+            recent.append(timestamp)
+        if state.last_ts == timestamp:
+            state.lat, state.lon = lat, lon
+
+        self._evict()
+        return {
+            "velocity": velocity,
+            "geo_distance": geo_distance,
+            "txn_count_window": window_count,
+            "decayed_txn_count": round(state.decayed_count, 4),
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "users": len(self.users),
+            "max_users": self.max_users,
+            "events": self.events,
+            "evicted_ttl": self.evicted_ttl,
+            "evicted_capacity": self.evicted_capacity,
+            "window_seconds": self.window_seconds,
+            "ttl_seconds": self.ttl_seconds,
+        }
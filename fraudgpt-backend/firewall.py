@@ -1,97 +1,503 @@
-import json
+import atexit
 import csv
-from datetime import datetime, timedelta
-from typing import Dict, List
+import gzip
+import json
+import math
+import os
+import queue
+import time
+from bisect import bisect_right
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple, Union
 import ipaddress
 import logging
-from threading import Lock
+from threading import Event, Lock, Thread
 
 logger = logging.getLogger(__name__)
 
+IPNetwork = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+IPAddress = Union[ipaddress.IPv4Address, ipaddress.IPv6Address]
+
+# Firewall decisions, also used as the log status
+ALLOWED = 'ALLOWED'
+BLACKLISTED = 'BLACKLISTED'
+RATE_LIMITED = 'RATE_LIMITED'
+INVALID_IP = 'INVALID_IP'
+DECISIONS = (ALLOWED, BLACKLISTED, RATE_LIMITED, INVALID_IP)
+
+class CidrIndex:
+    """Compiled CIDR set answering membership with a binary search.
+
+    Networks are turned into integer address ranges per IP version, sorted and
+    merged so that ranges never overlap. A lookup bisects the range starts:
+    O(log n) integer comparisons, i.e. at most ~20 for a million prefixes.
+    """
+    def __init__(self, networks: Iterable[IPNetwork] = ()):
+        ranges: Dict[int, List[Tuple[int, int]]] = {4: [], 6: []}
+        self.prefix_count = 0
+        for net in networks:
+            start = int(net.network_address)
+            ranges[net.version].append((start, start | ((1 << (net.max_prefixlen - net.prefixlen)) - 1)))
+            self.prefix_count += 1
+        self.starts: Dict[int, List[int]] = {}
+        self.ends: Dict[int, List[int]] = {}
+        for version, spans in ranges.items():
+            spans.sort()
+            starts: List[int] = []
+            ends: List[int] = []
+            for start, end in spans:
+                if ends and start <= ends[-1] + 1:
+                    ends[-1] = max(ends[-1], end)
+                else:
+                    starts.append(start)
+                    ends.append(end)
+            self.starts[version] = starts
+            self.ends[version] = ends
+
+    def __len__(self) -> int:
+        return self.prefix_count
+
+    def __contains__(self, ip_addr: IPAddress) -> bool:
+        starts = self.starts[ip_addr.version]
+        value = int(ip_addr)
+        i = bisect_right(starts, value) - 1
+        return i >= 0 and value <= self.ends[ip_addr.version][i]
+
+def load_cidr_file(path: str) -> List[IPNetwork]:
+    """Read one CIDR or address per line; blank lines and '#' comments are ignored."""
+    networks = []
+    with open(path, 'r') as f:
+        for line in f:
+            entry = line.split('#', 1)[0].strip()
+            if entry:
+                networks.append(ipaddress.ip_network(entry, strict=False))
+    return networks
+
+class RateLimiter:
+    """Per-IP token bucket rate limiter with constant memory per IP.
+
+    Each IP holds a bucket of ``capacity`` tokens refilled at
+    ``capacity / window_seconds`` tokens per second, stored as two floats
+    (tokens, last refill time on the monotonic clock). Buckets are sharded by
+    IP hash, each shard with its own lock and LRU-ordered dict bounded to
+    ``max_entries / shards`` entries. A background thread evicts buckets that
+    have been idle long enough to be full again, since a full bucket is
+    equivalent to no entry at all.
+    """
+    def __init__(self, capacity: int = 100, window_seconds: float = 60, shards: int = 16,
+                 max_entries: int = 100_000, sweep_interval: Optional[float] = None):
+        self.shards = [OrderedDict() for _ in range(shards)]
+        self.locks = [Lock() for _ in range(shards)]
+        self.max_per_shard = max(1, max_entries // shards)
+        self.configure(capacity, window_seconds)
+        self.evicted_idle = 0
+        self.evicted_lru = 0
+        self._stop = Event()
+        self._sweeper = Thread(target=self._sweep_loop, args=(sweep_interval,), name="rate-limit-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def configure(self, capacity: int, window_seconds: float):
+        """Change the limit; existing buckets keep their current token counts."""
+        self.capacity = float(capacity)
+        self.window_seconds = float(window_seconds)
+        self.refill_rate = self.capacity / self.window_seconds if self.window_seconds > 0 else float('inf')
+        # Time for an empty bucket to refill completely; idle entries older than this are dropped
+        self.idle_seconds = self.window_seconds
+
+    def allow(self, ip: str) -> bool:
+        """Take one token for the IP; False if its bucket is empty."""
+        index = hash(ip) % len(self.shards)
+        shard = self.shards[index]
+        now = time.monotonic()
+        with self.locks[index]:
+            bucket = shard.get(ip)
+            if bucket is None:
+                if len(shard) >= self.max_per_shard:
+                    shard.popitem(last=False)
+                    self.evicted_lru += 1
+                shard[ip] = bucket = [self.capacity, now]
+            else:
+                shard.move_to_end(ip)
+                bucket[0] = min(self.capacity, bucket[0] + (now - bucket[1]) * self.refill_rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return True
+            return False
+
+    def sweep(self):
+        """Drop buckets idle for long enough to have refilled completely."""
+        horizon = time.monotonic() - self.idle_seconds
+        for shard, lock in zip(self.shards, self.locks):
+            with lock:
+                # Shards are in least-recently-used order, so idle entries are at the front
+                while shard:
+                    ip, bucket = next(iter(shard.items()))
+                    if bucket[1] > horizon:
+                        break
+                    shard.popitem(last=False)
+                    self.evicted_idle += 1
+
+    def _sweep_loop(self, interval: Optional[float]):
+        while not self._stop.wait(interval or max(1.0, min(self.window_seconds, 60.0))):
+            self.sweep()
+
+    def close(self):
+        self._stop.set()
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self.shards)
+
+LOG_HEADER = ['timestamp', 'ip_address', 'status', 'details']
+
+class AuditLogWriter:
+    """Buffered background writer for firewall audit records.
+
+    The request path only calls ``enqueue``, which puts a tuple on a bounded
+    queue (records are counted as dropped when it is full). A daemon thread
+    writes records in batches of up to ``batch_size``, at least every
+    ``flush_interval`` seconds, and rotates the file by size and/or age
+    (``path.1`` ... ``path.N``, newest first). With ``compress`` the file is
+    written as gzip text. Pending records are flushed by ``close()``, which also
+    runs at interpreter exit.
+    """
+    def __init__(self, path: str, max_queue: int = 100_000, batch_size: int = 1000, flush_interval: float = 1.0,
+                 max_bytes: int = 50 * 1024 * 1024, rotate_seconds: float = 0, backup_count: int = 5,
+                 compress: bool = False):
+        self.path = path + '.gz' if compress and not path.endswith('.gz') else path
+        self.queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.backup_count = backup_count
+        self.compress = compress
+        self.written = 0
+        self.dropped = 0
+        self.rotations = 0
+        self._file = None
+        self._writer = None
+        self._opened_at = 0.0
+        self._closed = False
+        self._thread = Thread(target=self._run, name="firewall-log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def enqueue(self, ip: str, status: str, details: str = "") -> bool:
+        """Queue one record without blocking; False if it was dropped."""
+        try:
+            self.queue.put_nowait((time.time(), ip, status, details))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _open(self):
+        if self.compress:
+            self._file = gzip.open(self.path, 'at', newline='')
+        else:
+            self._file = open(self.path, 'a', newline='')
+        self._writer = csv.writer(self._file)
+        self._opened_at = time.monotonic()
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            self._writer.writerow(LOG_HEADER)
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        if self.backup_count > 0:
+            for i in range(self.backup_count - 1, 0, -1):
+                src = f"{self.path}.{i}"
+                if os.path.exists(src):
+                    os.replace(src, f"{self.path}.{i + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.rotations += 1
+        self._open()
+
+    def _should_rotate(self) -> bool:
+        if self.rotate_seconds and time.monotonic() - self._opened_at >= self.rotate_seconds:
+            return True
+        return bool(self.max_bytes) and os.path.getsize(self.path) >= self.max_bytes
+
+    def _write_batch(self, batch: List[tuple]):
+        try:
+            if self._file is None:
+                self._open()
+            self._writer.writerows(
+                (datetime.fromtimestamp(ts, timezone.utc).replace(tzinfo=None).isoformat(), ip, status, details)
+                for ts, ip, status, details in batch
+            )
+            self._file.flush()
+            self.written += len(batch)
+            if self._should_rotate():
+                self._rotate()
+        except Exception as e:
+            logger.error(f"Error writing to {self.path}: {e}")
+
+    def _run(self):
+        while True:
+            try:
+                first = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                if self._closed:
+                    break
+                continue
+            if first is None:
+                break
+            batch = [first]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    record = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is None:
+                    stop = True
+                    break
+                batch.append(record)
+            self._write_batch(batch)
+            if stop:
+                break
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def close(self, timeout: float = 5.0):
+        """Flush queued records and stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+
+    def get_stats(self) -> Dict:
+        return {
+            "log_file": self.path,
+            "log_records_written": self.written,
+            "log_records_dropped": self.dropped,
+            "log_queue_depth": self.queue.qsize(),
+            "log_rotations": self.rotations
+        }
+
 class Firewall:
     def __init__(self, config_path: str):
         """Initialize firewall with configuration from JSON file."""
-        self.whitelist = []
-        self.blacklist = []
+        self.config_path = config_path
+        self.config_mtime: Optional[float] = None
+        self.config_reloads = 0
+        self.reload_interval = 5.0  # seconds between config file mtime checks; 0 disables
+        self.log_allowed = True  # Also log allowed requests, not only rejections
+        self.whitelist = CidrIndex()
+        self.blacklist = CidrIndex()
+        self.decision_cache: Dict[str, Tuple[str, bool]] = {}  # Recent IP -> (list decision, whitelisted)
+        self.decision_cache_size = 65536
         self.rate_limit_requests = 100
         self.rate_limit_window = 60  # seconds
+        self.rate_limit_whitelist = False  # Whether whitelisted IPs are rate limited too
         self.log_file = "firewall_logs.csv"
-        self.request_counts: Dict[str, List[datetime]] = {}
-        self.lock = Lock()  # Thread-safe access
+        self.rate_limit_max_ips = 100_000  # Bound on tracked IPs (LRU beyond that)
+        self.log_writer_config: Dict = {}
+        self.decision_counts = dict.fromkeys(DECISIONS, 0)
+        self.lock = Lock()  # Serializes config reloads
         self.load_config(config_path)
+        self.rate_limiter = RateLimiter(self.rate_limit_requests, self.rate_limit_window,
+                                        max_entries=self.rate_limit_max_ips)
         self.initialize_log_file()
+        self._stop = Event()
+        self._watcher = Thread(target=self._watch_config, name="firewall-config-watcher", daemon=True)
+        self._watcher.start()
 
-    def load_config(self, config_path: str):
-        """Load firewall configuration from JSON file."""
+    def load_config(self, config_path: str) -> bool:
+        """Load firewall configuration from JSON file; False (keeping current settings) on error."""
         try:
+            mtime = os.path.getmtime(config_path)
             with open(config_path, 'r') as f:
                 config = json.load(f)
-            self.whitelist = [ipaddress.ip_network(ip) for ip in config.get('whitelist', [])]
-            self.blacklist = [ipaddress.ip_network(ip) for ip in config.get('blacklist', [])]
+            whitelist = [ipaddress.ip_network(ip, strict=False) for ip in config.get('whitelist', [])]
+            blacklist = [ipaddress.ip_network(ip, strict=False) for ip in config.get('blacklist', [])]
+            # Threat-intel blocklists: files with one CIDR per line
+            for path in config.get('blacklist_files', []):
+                blacklist.extend(load_cidr_file(path))
+            self.whitelist = CidrIndex(whitelist)
+            self.blacklist = CidrIndex(blacklist)
+            self.decision_cache = {}
             self.rate_limit_requests = config.get('rate_limit', {}).get('requests', 100)
             self.rate_limit_window = config.get('rate_limit', {}).get('window_seconds', 60)
+            self.rate_limit_max_ips = config.get('rate_limit', {}).get('max_tracked_ips', 100_000)
+            self.rate_limit_whitelist = config.get('rate_limit', {}).get('apply_to_whitelist', False)
             self.log_file = config.get('log_file', 'firewall_logs.csv')
+            self.log_writer_config = config.get('log_writer', {})
+            self.log_allowed = config.get('log_allowed', True)
+            self.reload_interval = config.get('reload_interval_seconds', 5.0)
+            self.config_mtime = mtime
             logger.info(f"Firewall configured: {len(self.whitelist)} whitelisted, {len(self.blacklist)} blacklisted IPs")
+            return True
         except Exception as e:
             logger.error(f"Error loading firewall config: {e}")
             # Use defaults if config fails
+            return False
+
+    def reload(self) -> bool:
+        """Re-read the config file and apply it to the live firewall.
+
+        The log file and writer settings and ``max_tracked_ips`` only take effect on restart.
+        """
+        with self.lock:
+            if not self.load_config(self.config_path):
+                return False
+            self.rate_limiter.configure(self.rate_limit_requests, self.rate_limit_window)
+            self.config_reloads += 1
+        logger.info(f"✅ Firewall config reloaded from {self.config_path}")
+        return True
+
+    def _watch_config(self):
+        """Reload the config whenever the file's modification time changes."""
+        while not self._stop.wait(self.reload_interval or 5.0):
+            if not self.reload_interval:
+                continue
+            try:
+                mtime = os.path.getmtime(self.config_path)
+            except OSError:
+                continue
+            if mtime != self.config_mtime:
+                self.reload()
 
     def initialize_log_file(self):
-        """Initialize the firewall log file with headers."""
-        try:
-            with self.lock, open(self.log_file, 'a', newline='') as f:
-                writer = csv.writer(f)
-                if f.tell() == 0:
-                    writer.writerow(['timestamp', 'ip_address', 'status', 'details'])
-        except Exception as e:
-            logger.error(f"Error initializing log file {self.log_file}: {e}")
+        """Start the background writer for the firewall log file (headers are written on open)."""
+        options = self.log_writer_config
+        self.log_writer = AuditLogWriter(
+            self.log_file,
+            max_queue=options.get('queue_size', 100_000),
+            batch_size=options.get('batch_size', 1000),
+            flush_interval=options.get('flush_interval_seconds', 1.0),
+            max_bytes=options.get('max_bytes', 50 * 1024 * 1024),
+            rotate_seconds=options.get('rotate_interval_seconds', 0),
+            backup_count=options.get('backup_count', 5),
+            compress=options.get('compress', False)
+        )
 
-    def is_allowed_ip(self, ip: str) -> bool:
-        """Check if an IP is allowed based on whitelist and blacklist."""
+    def _classify(self, ip: str) -> Tuple[str, bool]:
+        """(ALLOWED, BLACKLISTED or INVALID_IP, whether the IP is whitelisted), cached per IP."""
+        cached = self.decision_cache.get(ip)
+        if cached is not None:
+            return cached
         try:
             ip_addr = ipaddress.ip_address(ip)
-            # Check whitelist first
-            if any(ip_addr in net for net in self.whitelist):
-                return True
-            # Check blacklist
-            if any(ip_addr in net for net in self.blacklist):
-                return False
-            return True
+            # Check whitelist first, then blacklist
+            whitelisted = ip_addr in self.whitelist
+            decision = ALLOWED if whitelisted or ip_addr not in self.blacklist else BLACKLISTED
         except ValueError:
             logger.error(f"Invalid IP address format: {ip}")
-            return False
+            decision, whitelisted = INVALID_IP, False
+        cache = self.decision_cache
+        if len(cache) >= self.decision_cache_size:
+            cache.clear()
+        cache[ip] = (decision, whitelisted)
+        return decision, whitelisted
+
+    def ip_decision(self, ip: str) -> str:
+        """Classify an IP as ALLOWED, BLACKLISTED or INVALID_IP (whitelist wins over blacklist)."""
+        return self._classify(ip)[0]
+
+    def is_allowed_ip(self, ip: str) -> bool:
+        """Check if an IP is allowed based on whitelist and blacklist."""
+        return self.ip_decision(ip) == ALLOWED
+
+    def is_whitelisted(self, ip: str) -> bool:
+        return self._classify(ip)[1]
+
+    def check(self, ip: str) -> str:
+        """Full per-request check: IP lists, then rate limit. Counts and logs the decision.
+
+        Whitelisted IPs (localhost by default) skip the rate limit unless
+        ``rate_limit.apply_to_whitelist`` is set, so local load tests and the
+        simulator are not throttled.
+        """
+        decision, whitelisted = self._classify(ip)
+        if (decision == ALLOWED and (self.rate_limit_whitelist or not whitelisted)
+                and not self.rate_limiter.allow(ip)):
+            decision = RATE_LIMITED
+        self.decision_counts[decision] += 1
+        if decision != ALLOWED or self.log_allowed:
+            self.log_request(ip, decision)
+        return decision
 
     def check_rate_limit(self, ip: str) -> bool:
-        """Check if the IP is within rate limits."""
-        with self.lock:
-            now = datetime.utcnow()
-            if ip not in self.request_counts:
-                self.request_counts[ip] = []
-            # Remove requests older than the window
-            self.request_counts[ip] = [
-                t for t in self.request_counts[ip]
-                if now - t < timedelta(seconds=self.rate_limit_window)
-            ]
-            # Add current request
-            self.request_counts[ip].append(now)
-            return len(self.request_counts[ip]) <= self.rate_limit_requests
-
-    def log_request(self, ip: str, status: str):
-        """Log a request to the firewall log file."""
-        try:
-            with self.lock, open(self.log_file, 'a', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow([datetime.utcnow().isoformat(), ip, status, ""])
-        except Exception as e:
-            logger.error(f"Error logging to {self.log_file}: {e}")
+        """Check if the IP is within rate limits (token bucket, O(1) per check)."""
+        return self.rate_limiter.allow(ip)
+
+    def log_request(self, ip: str, status: str, details: str = ""):
+        """Queue a request record for the firewall log file."""
+        self.log_writer.enqueue(ip, status, details)
 
     def get_stats(self) -> Dict:
         """Return firewall statistics."""
-        with self.lock:
-            return {
-                "whitelisted_ips": len(self.whitelist),
-                "blacklisted_ips": len(self.blacklist),
-                "active_ips": len(self.request_counts),
-                "rate_limit_requests": self.rate_limit_requests,
-                "rate_limit_window_seconds": self.rate_limit_window
-            }
\ No newline at end of file
+        return {
+            "whitelisted_ips": len(self.whitelist),
+            "blacklisted_ips": len(self.blacklist),
+            "active_ips": len(self.rate_limiter),
+            "rate_limit_requests": self.rate_limit_requests,
+            "rate_limit_window_seconds": self.rate_limit_window,
+            "rate_limit_whitelist": self.rate_limit_whitelist,
+            "rate_limit_evicted_idle": self.rate_limiter.evicted_idle,
+            "rate_limit_evicted_lru": self.rate_limiter.evicted_lru,
+            "decisions": dict(self.decision_counts),
+            "config_path": self.config_path,
+            "config_reloads": self.config_reloads,
+            **self.log_writer.get_stats()
+        }
+
+    def close(self):
+        """Stop background maintenance and flush the log."""
+        self._stop.set()
+        self.rate_limiter.close()
+        self.log_writer.close()
+
+# Pre-encoded HTTP rejections: (status, body)
+REJECTIONS = {
+    BLACKLISTED: (403, b'{"detail":"Forbidden"}'),
+    INVALID_IP: (403, b'{"detail":"Forbidden"}'),
+    RATE_LIMITED: (429, b'{"detail":"Too Many Requests"}'),
+}
+
+class FirewallMiddleware:
+    """Raw ASGI middleware applying Firewall.check to HTTP requests and WebSocket handshakes.
+
+    Rejected requests are answered here, before routing or body parsing: HTTP
+    gets a 403/429 JSON response and a WebSocket handshake is closed with code
+    1008 (policy violation), which servers send as HTTP 403. Other scope types
+    such as lifespan pass straight through.
+    """
+    def __init__(self, app, firewall: Firewall):
+        self.app = app
+        self.firewall = firewall
+
+    async def __call__(self, scope, receive, send):
+        scope_type = scope['type']
+        if scope_type == 'http' or scope_type == 'websocket':
+            client = scope.get('client')
+            decision = self.firewall.check(client[0] if client else '')
+            if decision != ALLOWED:
+                if scope_type == 'http':
+                    await self._reject_http(send, decision)
+                else:
+                    await receive()  # websocket.connect
+                    await send({'type': 'websocket.close', 'code': 1008})
+                return
+        await self.app(scope, receive, send)
+
+    async def _reject_http(self, send, decision: str):
+        status, body = REJECTIONS[decision]
+        headers = [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+        if decision == RATE_LIMITED:
+            limiter = self.firewall.rate_limiter
+            retry_after = max(1, math.ceil(1 / limiter.refill_rate)) if limiter.refill_rate > 0 else int(limiter.window_seconds)
+            headers.append((b'retry-after', str(retry_after).encode()))
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
\ No newline at end of file
@@ -0,0 +1,224 @@
+import atexit
+import csv
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, Optional, Tuple
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Bundled place list (checked in) and the lookup table compiled from it on first use
+GAZETTEER_SOURCE = os.path.join(BASE_DIR, 'gazetteer_places.csv')
+GAZETTEER_TABLE = os.path.join(BASE_DIR, 'gazetteer_places.npy')
+# Resolved location strings, kept across runs and preloaded at startup (misses are not saved)
+GAZETTEER_CACHE = os.path.join(BASE_DIR, 'gazetteer_cache.json')
+MAX_CACHE_ENTRIES = 200_000
+
+# One row per lookup key: 64-bit hash of the normalized name, then the coordinates
+TABLE_DTYPE = np.dtype([('key', '<u8'), ('lat', '<f8'), ('lon', '<f8')])
+
+_WHITESPACE = re.compile(r'\s+')
+_COMMA = re.compile(r'\s*,\s*')
+
+
+def normalize(name: str) -> str:
+    """Case-, accent- and spacing-insensitive form of a place name: 'São  Paulo , BR' -> 'sao paulo, br'."""
+    name = unicodedata.normalize('NFKD', name)
+    name = ''.join(ch for ch in name if not unicodedata.combining(ch))
+    name = _WHITESPACE.sub(' ', name.lower().replace('.', '')).strip()
+    return _COMMA.sub(', ', name)
+
+
+def key_hash(normalized: str) -> int:
+    return int.from_bytes(hashlib.blake2b(normalized.encode(), digest_size=8).digest(), 'little')
+
+
+def place_names(row: Dict[str, str], regions: Dict[Tuple[str, str], str], countries: Dict[str, str]) -> Iterator[str]:
+    """Every spelling a place row answers to, e.g. 'Boston, MA', 'Boston, Massachusetts', 'Boston, USA'."""
+    names = [row['name']] + [alias for alias in row['aliases'].split('|') if alias]
+    if row['kind'] == 'city':
+        qualifiers = []
+        if row['region']:
+            qualifiers += [row['region'], regions[(row['country'], row['region'])]]
+        qualifiers += [row['country'], countries[row['country']]]
+        if row['country'] == 'US':
+            qualifiers += ['USA']
+        for name in names:
+            yield name
+            for qualifier in qualifiers:
+                yield f"{name}, {qualifier}"
+            if row['region']:
+                yield f"{name}, {row['region']}, {row['country']}"
+    else:
+        yield from names
+        yield row['code']
+        if row['kind'] == 'region':
+            yield f"{row['name']}, {row['country']}"
+            yield f"{row['name']}, {countries[row['country']]}"
+
+
+def build_table(source: str, table_path: str) -> int:
+    """Compile the place list into a sorted key table at ``table_path``; returns the number of keys.
+
+    Rows are listed cities first, then countries, then regions, and the first
+    row to claim a name wins, so 'Washington' is the city and 'Georgia' the state.
+    """
+    with open(source, 'r', encoding='utf-8', newline='') as f:
+        rows = list(csv.DictReader(f))
+    regions = {(row['country'], row['code']): row['name'] for row in rows if row['kind'] == 'region'}
+    countries = {row['code']: row['name'] for row in rows if row['kind'] == 'country'}
+
+    entries: Dict[int, Tuple[str, float, float]] = {}
+    for row in rows:
+        lat, lon = float(row['lat']), float(row['lon'])
+        for name in place_names(row, regions, countries):
+            normalized = normalize(name)
+            key = key_hash(normalized)
+            if key in entries:
+                if entries[key][0] != normalized:
+                    raise ValueError(f"Hash collision between '{entries[key][0]}' and '{normalized}'")
+                continue
+            entries[key] = (normalized, lat, lon)
+
+    table = np.array([(key, lat, lon) for key, (_, lat, lon) in entries.items()], dtype=TABLE_DTYPE)
+    table.sort(order='key')
+    # Write under a temporary name so concurrent builders never expose a partial table
+    tmp_path = f"{table_path}.{os.getpid()}.tmp.npy"
+    np.save(tmp_path, table)
+    os.replace(tmp_path, table_path)
+    return len(table)
+
+
+def load_table(source: str = GAZETTEER_SOURCE, table_path: str = GAZETTEER_TABLE) -> np.ndarray:
+    """Memory-map the key table, rebuilding it first if it is missing or older than the place list."""
+    if not os.path.exists(table_path) or os.path.getmtime(table_path) < os.path.getmtime(source):
+        build_table(source, table_path)
+    return np.load(table_path, mmap_mode='r')
+
+
+class Gazetteer:
+    """Offline place-name to coordinates lookup.
+
+    Names are normalized, hashed and binary-searched in the memory-mapped key
+    table. Results (including misses) are memoized per raw string in an LRU of
+    at most ``max_cache_entries``. The resolved entries are saved to
+    ``cache_path`` so later runs start with the locations they have recently
+    seen resolved. Misses stay in memory only, so junk strings from clients
+    never fill the saved cache. The cache is discarded whenever the table
+    contents change.
+    """
+
+    def __init__(self, source: str = GAZETTEER_SOURCE, table_path: str = GAZETTEER_TABLE,
+                 cache_path: Optional[str] = GAZETTEER_CACHE, max_cache_entries: int = MAX_CACHE_ENTRIES):
+        self.table = load_table(source, table_path)
+        self.keys = self.table['key']
+        self.version = hashlib.blake2b(self.table.tobytes(), digest_size=8).hexdigest()
+        self.cache_path = cache_path
+        self.max_cache_entries = max_cache_entries
+        self.cache: "OrderedDict[str, Optional[Tuple[float, float]]]" = OrderedDict()  # Least recently used first
+        self.preloaded = 0
+        self.hits = 0
+        self.table_lookups = 0
+        self.evicted = 0
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._load_cache()
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def _load_cache(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        if saved.get("version") != self.version:
+            return
+        # Saved least recently used first; keep the most recent ones if the cap shrank
+        entries = list(saved["entries"].items())[-self.max_cache_entries:] if self.max_cache_entries else []
+        self.cache = OrderedDict((name, tuple(coords)) for name, coords in entries if coords)
+        self.preloaded = len(self.cache)
+
+    def _search(self, location: str) -> Optional[Tuple[float, float]]:
+        self.table_lookups += 1
+        key = key_hash(normalize(location))
+        i = int(np.searchsorted(self.keys, key))
+        if i < len(self.keys) and self.keys[i] == key:
+            row = self.table[i]
+            return float(row['lat']), float(row['lon'])
+        return None
+
+    def lookup(self, location: Optional[str]) -> Optional[Tuple[float, float]]:
+        """Coordinates for a place name, or None if it is not in the gazetteer."""
+        if not isinstance(location, str) or not location:
+            return None
+        try:
+            coords = self.cache[location]
+        except KeyError:
+            pass
+        else:
+            self.hits += 1
+            try:
+                self.cache.move_to_end(location)
+            except KeyError:
+                pass  # Evicted by another thread in the meantime
+            return coords
+        coords = self._search(location)
+        with self._lock:
+            if location not in self.cache and self.max_cache_entries:
+                self.cache[location] = coords
+                if coords is not None:
+                    self._dirty = True
+                if len(self.cache) > self.max_cache_entries:
+                    self.cache.popitem(last=False)
+                    self.evicted += 1
+        return coords
+
+    def save(self):
+        """Write the lookup cache to ``cache_path`` if it changed."""
+        if not self.cache_path or not self._dirty:
+            return
+        with self._lock:
+            entries = {name: list(coords) for name, coords in list(self.cache.items()) if coords}
+            self._dirty = False
+        tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": self.version, "entries": entries}, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, self.cache_path)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            unresolved = sum(1 for coords in list(self.cache.values()) if coords is None)
+        return {
+            "keys": len(self.table),
+            "version": self.version,
+            "cached": len(self.cache),
+            "preloaded": self.preloaded,
+            "hits": self.hits,
+            "table_lookups": self.table_lookups,
+            "evicted": self.evicted,
+            "unresolved": unresolved,
+        }
+
+
+_gazetteer: Optional[Gazetteer] = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer() -> Gazetteer:
+    """Process-wide gazetteer, opened on first use; its cache is saved at interpreter exit."""
+    global _gazetteer
+    if _gazetteer is None:
+        with _gazetteer_lock:
+            if _gazetteer is None:
+                _gazetteer = Gazetteer()
+                atexit.register(_gazetteer.save)
+    return _gazetteer
+
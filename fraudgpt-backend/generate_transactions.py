@@ -1,62 +1,263 @@
-import pandas as pd
-from faker import Faker
-import random
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
+from typing import Any, Deque, Dict, Optional, Tuple
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+from faker import Faker
+from pipeline_io import NDJSON_EXTENSIONS, TableWriter, compact_table, table_format
+
+COLUMNS = ['txn_id', 'user_id', 'name', 'card_number', 'merchant', 'timestamp', 'location', 'device_id', 'amount',
+           'is_fraud']
+FRAUD_HOTSPOTS = ["New York, NY", "London, UK", "Tokyo, JP"]
+POOL_SIZE = 5000  # Distinct Faker names, card numbers, merchants and locations to sample from
+BURST_SHARE = 0.25  # Share of frauds followed by a velocity burst
+MAX_BURST = 2  # Extra transactions per burst, one minute apart
+
+# Hex digits of every byte value, for formatting UUIDs without a Python loop
+_HEX = np.array([f"{i:02x}" for i in range(256)], dtype='S2').view(np.uint8).reshape(256, 2)
+_UUID_DIGITS = [i for i in range(36) if i not in (8, 13, 18, 23)]
+
+# Per-worker Faker pools, set once by init_worker
+_pools: Optional[Dict[str, pa.Array]] = None
+
+
+def random_uuids(rng: np.random.Generator, n: int) -> np.ndarray:
+    """``n`` version 4 UUIDs drawn from ``rng``, as an (n, 36) array of ASCII bytes."""
+    raw = rng.integers(0, 256, size=(n, 16), dtype=np.uint8)
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80
+    chars = np.full((n, 36), ord('-'), dtype=np.uint8)
+    chars[:, _UUID_DIGITS] = _HEX[raw].reshape(n, 32)
+    return chars
+
+
+def fixed_width_strings(chars: np.ndarray) -> pa.Array:
+    """Arrow strings over the rows of an (n, width) byte array, without creating Python strings."""
+    n, width = chars.shape
+    offsets = np.arange(0, (n + 1) * width, width, dtype=np.int64)
+    return pa.Array.from_buffers(pa.large_string(), n,
+                                 [None, pa.py_buffer(offsets), pa.py_buffer(np.ascontiguousarray(chars))])
+
+
+def build_pools(seed: int, users: int, pool_size: int = POOL_SIZE) -> Dict[str, pa.Array]:
+    """Draw every Faker value once; rows then sample these arrays by index.
+
+    The fraud hotspots are the last entries of the location pool.
+    """
+    fake = Faker()
+    fake.seed_instance(seed)
+    return {
+        "user_id": fixed_width_strings(random_uuids(np.random.default_rng(seed), users)),
+        "name": pa.array([fake.name() for _ in range(pool_size)]),
+        "card_number": pa.array([fake.credit_card_number() for _ in range(pool_size)]),
+        "merchant": pa.array([fake.company() for _ in range(pool_size)]),
+        "location": pa.array([f"{fake.city()}, {fake.state_abbr()}" for _ in range(pool_size)] + FRAUD_HOTSPOTS),
+    }
+
+
+def init_worker(pools: Dict[str, pa.Array]):
+    global _pools
+    _pools = pools
+
+
+def chunk_layout(rows: int, fraud_ratio: float, seed: np.random.SeedSequence) -> Tuple[np.ndarray, np.ndarray]:
+    """Which of a chunk's ``rows`` base transactions are fraud, and the source row of each burst transaction.
+
+    Drawn from its own stream so the main process can count a chunk's rows
+    (and so number its transactions) without generating it.
+    """
+    rng = np.random.default_rng(seed)
+    is_fraud = rng.random(rows) < fraud_ratio
+    sources = np.flatnonzero(is_fraud & (rng.random(rows) < BURST_SHARE))
+    return is_fraud, np.repeat(sources, rng.integers(1, MAX_BURST + 1, len(sources)))
+
+
+def generate_chunk(rows: int, first_id: int, fraud_ratio: float, start: int, span: int,
+                   layout_seed: np.random.SeedSequence, content_seed: np.random.SeedSequence) -> pa.Table:
+    """One chunk of transactions: ``rows`` base transactions, each burst placed right after its fraud.
 
-fake = Faker()
-n_transactions = 10000
-fraud_ratio = 0.15
-output_path = "transactions.csv"
-
-data = []
-user_ids = [fake.uuid4() for _ in range(1000)]
-for i in range(n_transactions):
-    user_id = random.choice(user_ids)
-    is_fraud = random.random() < fraud_ratio
-    timestamp = fake.date_time_between(start_date="-30d", end_date="now")
-    if is_fraud:
-        if random.random() < 0.7:
-            location = random.choice(["New York, NY", "London, UK", "Tokyo, JP"])
-        else:
-            location = fake.city() + ", " + fake.state_abbr()
-        amount = random.uniform(600, 6000) if random.random() < 0.8 else random.uniform(50, 600)
-        if random.random() < 0.75:
-            timestamp = timestamp.replace(hour=random.randint(0, 4), minute=random.randint(0, 59))
-    else:
-        location = fake.city() + ", " + fake.state_abbr()
-        amount = random.uniform(5, 1200)
-    data.append({
-        "txn_id": i,
-        "user_id": user_id,
-        "name": fake.name(),
-        "card_number": fake.credit_card_number(),
-        "merchant": fake.company(),
-        "timestamp": timestamp,
-        "location": location,
-        "device_id": fake.uuid4(),
-        "amount": round(amount, 2),
-        "is_fraud": int(is_fraud)
+    Every column is drawn as NumPy pool indices or values and only turned
+    into strings by Arrow at the end.
+    """
+    is_fraud, burst_source = chunk_layout(rows, fraud_ratio, layout_seed)
+    rng = np.random.default_rng(content_seed)
+    pools = _pools
+    n_frauds = int(is_fraud.sum())
+    n_places = len(pools["location"]) - len(FRAUD_HOTSPOTS)
+
+    def hotspots(n):
+        return n_places + rng.integers(0, len(FRAUD_HOTSPOTS), n)
+
+    # Base transactions: legitimate ones anywhere in the window, frauds skewed to
+    # hotspots, large amounts and the early hours
+    timestamps = start + rng.integers(0, span, rows)
+    locations = rng.integers(0, n_places, rows)
+    amounts = rng.uniform(5, 1200, rows)
+    fraud_locations = locations[is_fraud]
+    hotspot = rng.random(n_frauds) < 0.7
+    fraud_locations[hotspot] = hotspots(hotspot.sum())
+    locations[is_fraud] = fraud_locations
+    amounts[is_fraud] = np.where(rng.random(n_frauds) < 0.8, rng.uniform(600, 6000, n_frauds),
+                                 rng.uniform(50, 600, n_frauds))
+    fraud_times = timestamps[is_fraud]
+    night = rng.random(n_frauds) < 0.75
+    night_times = fraud_times[night]
+    fraud_times[night] = (night_times - night_times % 86400 + rng.integers(0, 5, night.sum()) * 3600
+                          + rng.integers(0, 60, night.sum()) * 60 + night_times % 60)
+    timestamps[is_fraud] = fraud_times
+    users = rng.integers(0, len(pools["user_id"]), rows)
+    names = rng.integers(0, len(pools["name"]), rows)
+    cards = rng.integers(0, len(pools["card_number"]), rows)
+    devices = random_uuids(rng, rows)
+
+    # Bursts repeat the fraud's user, card and device at one-minute steps, half of them from a hotspot
+    bursts = len(burst_source)
+    first_of_burst = np.flatnonzero(np.r_[True, burst_source[1:] != burst_source[:-1]]) if bursts else burst_source
+    step = np.arange(bursts) - np.repeat(first_of_burst, np.diff(np.r_[first_of_burst, bursts])) + 1
+    burst_locations = locations[burst_source]
+    moved = rng.random(bursts) < 0.5
+    burst_locations[moved] = hotspots(moved.sum())
+
+    # Output row order: each base row followed by its burst rows; ``source`` is the base row each copies
+    order = np.argsort(np.r_[np.arange(rows) * (MAX_BURST + 1), burst_source * (MAX_BURST + 1) + step], kind='stable')
+    source = np.r_[np.arange(rows), burst_source][order]
+    n = len(order)
+    return pa.table({
+        "txn_id": np.arange(first_id, first_id + n),
+        "user_id": pools["user_id"].take(users[source]),
+        "name": pools["name"].take(names[source]),
+        "card_number": pools["card_number"].take(cards[source]),
+        "merchant": pools["merchant"].take(rng.integers(0, len(pools["merchant"]), rows + bursts)[order]),
+        "timestamp": (timestamps[source] + np.r_[np.zeros(rows, dtype=np.int64), step * 60][order]).astype('datetime64[s]'),
+        "location": pools["location"].take(np.r_[locations, burst_locations][order]),
+        "device_id": fixed_width_strings(devices[source]),
+        "amount": np.round(np.r_[amounts, rng.uniform(600, 6000, bursts)][order], 2),
+        "is_fraud": np.r_[is_fraud, np.ones(bursts, dtype=bool)][order].astype(np.int8),
     })
 
-# Add velocity for 25% of frauds
-df = pd.DataFrame(data)
-fraud_indices = df[df['is_fraud'] == 1].index
-for idx in fraud_indices[:len(fraud_indices)//4]:
-    user_id = df.at[idx, 'user_id']
-    base_time = df.at[idx, 'timestamp']
-    for j in range(random.randint(1, 2)):
-        df = pd.concat([df, pd.DataFrame([{
-            "txn_id": len(df) + j,
-            "user_id": user_id,
-            "name": df.at[idx, 'name'],
-            "card_number": df.at[idx, 'card_number'],
-            "merchant": fake.company(),
-            "timestamp": base_time + timedelta(minutes=j+1),
-            "location": random.choice([df.at[idx, 'location'], random.choice(["New York, NY", "London, UK", "Tokyo, JP"])]),
-            "device_id": df.at[idx, 'device_id'],
-            "amount": round(random.uniform(600, 6000), 2),
-            "is_fraud": 1
-        }])], ignore_index=True)
-
-df.to_csv(output_path, index=False)
-print(f"Transactions saved to {output_path}")
\ No newline at end of file
+
+def ndjson_lines(table: pa.Table) -> pa.Buffer:
+    """One JSON object per row, built column-wise with Arrow kernels (timestamps as in the CSV output)."""
+    def text(value: str) -> pa.Scalar:
+        return pa.scalar(value, pa.large_string())
+
+    parts = []
+    for i, name in enumerate(table.column_names):
+        column = table.column(name)
+        parts.append(text(('{' if i == 0 else ',') + f'"{name}":'))
+        value = pc.cast(column, pa.large_string())
+        if pa.types.is_integer(column.type) or pa.types.is_floating(column.type):
+            parts.append(value)
+            continue
+        if not pa.types.is_timestamp(column.type):
+            # Faker values hold no control characters, so quotes and backslashes are all that need escaping
+            value = pc.replace_substring(pc.replace_substring(value, '\\', '\\\\'), '"', '\\"')
+        parts += [text('"'), value, text('"')]
+    lines = pc.binary_join_element_wise(*parts, text('}\n'), text('')).combine_chunks()
+    # The rows are contiguous in the data buffer, so the whole chunk is a single slice of it
+    offsets = np.frombuffer(lines.buffers()[1], dtype=np.int64)[lines.offset:lines.offset + len(lines) + 1]
+    return lines.buffers()[2][offsets[0]:offsets[-1]]
+
+
+def encode_chunk(fmt: str, rows: int, first_id: int, fraud_ratio: float, start: int, span: int,
+                 layout_seed: np.random.SeedSequence, content_seed: np.random.SeedSequence) -> Any:
+    """Generate a chunk in a worker and serialize it there, so the writer only copies bytes in order."""
+    table = generate_chunk(rows, first_id, fraud_ratio, start, span, layout_seed, content_seed)
+    if fmt == 'csv':
+        sink = pa.BufferOutputStream()
+        pa_csv.write_csv(table, sink, pa_csv.WriteOptions(include_header=False, quoting_style='needed'))
+        return sink.getvalue()
+    if fmt == 'ndjson':
+        return ndjson_lines(table)
+    return compact_table(table)
+
+
+def generate(output_path: str, rows: int = 10_000, users: int = 1000, fraud_ratio: float = 0.15, days: int = 30,
+             end: Optional[datetime] = None, seed: int = 42, chunksize: int = 1_000_000,
+             workers: Optional[int] = None) -> Dict[str, Any]:
+    """Write ``rows`` synthetic transactions plus their fraud bursts to ``output_path``.
+
+    The format follows the extension: CSV, NDJSON (.json/.ndjson/.jsonl),
+    Parquet or Feather. Each chunk of ``chunksize`` rows has its own seed,
+    is generated and serialized in a worker process, and is written in
+    order with txn_ids numbered consecutively across chunks, so the file
+    depends on the arguments (chunksize included) but not on the worker count.
+    """
+    workers = workers or os.cpu_count() or 1
+    ext = os.path.splitext(output_path)[1].lower()
+    fmt = 'ndjson' if ext in NDJSON_EXTENSIONS else table_format(output_path)
+    end = end or datetime.combine(datetime.now().date(), datetime.min.time())
+    span = days * 86400
+    start = int((end - timedelta(days=days) - datetime(1970, 1, 1)).total_seconds())
+    chunk_rows = [min(chunksize, rows - offset) for offset in range(0, rows, chunksize)]
+    seeds = [chunk_seed.spawn(2) for chunk_seed in np.random.SeedSequence(seed).spawn(len(chunk_rows))]
+
+    # Number transactions up front from each chunk's layout, so chunks can be generated in any order
+    first_ids = np.cumsum([0] + [n + len(chunk_layout(n, fraud_ratio, layout_seed)[1])
+                                 for n, (layout_seed, _) in zip(chunk_rows, seeds)]).tolist()
+    started = time.perf_counter()
+    pools = build_pools(seed, users)
+    pending: Deque[Tuple[int, Any]] = deque()
+    written = 0
+
+    out = TableWriter(output_path) if fmt in ('parquet', 'feather') else open(output_path, 'wb')
+    try:
+        if fmt == 'csv':
+            out.write((','.join(COLUMNS) + '\n').encode())
+
+        def write_next():
+            nonlocal written
+            index, future = pending.popleft()
+            out.write(future.result())
+            written = first_ids[index + 1]
+            elapsed = time.perf_counter() - started
+            print(f"Chunk {index}: {written:,} transactions written ({written / elapsed:,.0f} rows/s)")
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(pools,)) as executor:
+            for index, (n, (layout_seed, content_seed)) in enumerate(zip(chunk_rows, seeds)):
+                pending.append((index, executor.submit(encode_chunk, fmt, n, first_ids[index], fraud_ratio, start,
+                                                       span, layout_seed, content_seed)))
+                # Keep every worker busy while bounding how many finished chunks wait in memory
+                while len(pending) > 2 * workers or (pending and pending[0][1].done()):
+                    write_next()
+            while pending:
+                write_next()
+    finally:
+        out.close()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "output": output_path,
+        "rows": written,
+        "bursts": written - rows,
+        "chunks": len(chunk_rows),
+        "seconds": round(elapsed, 2),
+        "rows_per_second": round(written / elapsed) if elapsed else 0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic transactions with injected fraud bursts.")
+    parser.add_argument("--output", default="transactions.csv",
+                        help="CSV, NDJSON (.json/.ndjson/.jsonl), Parquet or Feather file.")
+    parser.add_argument("--rows", type=int, default=10_000, help="Base transactions; burst transactions come on top.")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--fraud-ratio", type=float, default=0.15)
+    parser.add_argument("--days", type=int, default=30, help="Length of the time window the transactions span.")
+    parser.add_argument("--end", type=datetime.fromisoformat, default=None,
+                        help="End of the window (ISO date/time; default: today at midnight). Fix it to reproduce a file.")
+    parser.add_argument("--seed", type=int, default=42, help="The same seed and arguments always give the same file.")
+    parser.add_argument("--chunksize", type=int, default=1_000_000, help="Base transactions per chunk (and per seed).")
+    parser.add_argument("--workers", type=int, default=None, help="Generator processes (default: all cores).")
+    args = parser.parse_args()
+
+    summary = generate(args.output, args.rows, args.users, args.fraud_ratio, args.days, args.end, args.seed,
+                       args.chunksize, args.workers)
+    print(f"Transactions saved to {summary['output']}: {summary['rows']:,} rows ({summary['bursts']:,} in fraud bursts) "
+          f"in {summary['seconds']}s ({summary['rows_per_second']:,} rows/s)")
@@ -0,0 +1,100 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Tuple
+
+
+class IdempotencyCache:
+    """Recent client transaction ids mapped to the payload they were scored into.
+
+    Each id holds a future: the first request to ``claim`` an id owns it and
+    must ``resolve`` (or ``release`` on failure) it; later requests for the same
+    id, including ones arriving while it is still being scored, get the same
+    future and reuse its payload instead of scoring again. Entries expire
+    ``ttl_seconds`` after they were scored, tracked in a queue in scoring order
+    so a recently touched id never holds older ones back. Once ``max_entries``
+    is reached the least recently used scored entry is dropped; ids still
+    being scored are never evicted, so a retry cannot score them twice.
+    Must be used from the event loop thread.
+    """
+
+    def __init__(self, ttl_seconds: float = 600, max_entries: int = 100_000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # id -> [time it was scored (None while in flight), future], least recently used first
+        self.entries: "OrderedDict[str, List[Any]]" = OrderedDict()
+        self.expiry: Deque[Tuple[float, str, asyncio.Future]] = deque()  # Scored entries, oldest first
+        self.in_flight: Dict[asyncio.Future, str] = {}
+        self.claims = 0
+        self.hits = 0
+        self.evicted_ttl = 0
+        self.evicted_capacity = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _evict(self, now: float):
+        horizon = now - self.ttl_seconds
+        while self.expiry and self.expiry[0][0] < horizon:
+            _, key, future = self.expiry.popleft()
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] is future:  # Otherwise the id was claimed again or dropped
+                del self.entries[key]
+                self.evicted_ttl += 1
+        excess = len(self.entries) - self.max_entries
+        if excess > 0:
+            victims = []
+            for key, (scored_at, _) in self.entries.items():
+                if scored_at is not None:
+                    victims.append(key)
+                    if len(victims) == excess:
+                        break
+            for key in victims:
+                del self.entries[key]
+                self.evicted_capacity += 1
+
+    def claim(self, key: str) -> Tuple[asyncio.Future, bool]:
+        """The future for ``key`` and whether the caller owns it (and must score the transaction)."""
+        now = time.monotonic()
+        entry = self.entries.get(key)
+        if entry is not None and (entry[0] is None or entry[0] >= now - self.ttl_seconds):
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], False
+        future = asyncio.get_running_loop().create_future()
+        self.entries[key] = [None, future]
+        self.entries.move_to_end(key)
+        self.in_flight[future] = key
+        self.claims += 1
+        self._evict(now)
+        return future, True
+
+    def resolve(self, future: asyncio.Future, payload: Dict[str, Any]):
+        key = self.in_flight.pop(future, None)
+        entry = self.entries.get(key) if key is not None else None
+        if entry is not None and entry[1] is future:
+            entry[0] = now = time.monotonic()
+            self.expiry.append((now, key, future))
+        if not future.done():
+            future.set_result(payload)
+
+    def release(self, key: str, future: asyncio.Future):
+        """Forget a claim whose scoring failed; waiters get None and may claim it again."""
+        self.in_flight.pop(future, None)
+        entry = self.entries.get(key)
+        if entry is not None and entry[1] is future:
+            del self.entries[key]
+        if not future.done():
+            future.set_result(None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self.entries),
+            "in_flight": len(self.in_flight),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "claims": self.claims,
+            "duplicates": self.hits,
+            "evicted_ttl": self.evicted_ttl,
+            "evicted_capacity": self.evicted_capacity,
+        }
@@ -1,5 +1,8 @@
-import pandas as pd
-df = pd.read_csv("fraud_scores.csv")
+import argparse
+from pipeline_io import read_table
+parser = argparse.ArgumentParser()
+parser.add_argument("--scores", default="fraud_scores.csv", help="Scored table (.csv, .parquet or .feather).")
+df = read_table(parser.parse_args().scores)
 print("Fraudulent Transactions (is_fraud=1):")
 print(df[df['is_fraud'] == 1][['amount', 'hour_of_day', 'velocity', 'geo_distance', 'fraud_score']].describe())
 print("\nNon-Fraudulent Transactions (is_fraud=0):")
@@ -0,0 +1,235 @@
+import hashlib
+import logging
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import time
+from collections import deque
+from threading import Event, Lock, Thread
+from typing import Any, Deque, Dict, List, NamedTuple, Optional, Tuple
+
+import joblib
+import numpy as np
+
+from compiled_model import CompiledModel
+
+logger = logging.getLogger(__name__)
+
+# Warm-up rows (amount, hour_of_day, velocity, geo_distance) scored before a model goes live
+WARMUP_FEATURES = np.array([
+    [50.0, 12, 0.0, 0.0],
+    [900.0, 3, 1.5, 300.0],
+    [7500.0, 2, 6.0, 1200.0],
+    [250.0, 20, 0.07, 15.0],
+])
+WARMUP_BATCH_SIZES = (1, 64)
+# A child loader still running after this long is killed and the load counts as failed,
+# so a hung load never holds the registry lock (and every later reload or rollback) forever
+LOAD_TIMEOUT_SECONDS = 120.0
+
+
+class ModelBundle(NamedTuple):
+    """Everything needed to score with one model version. Never mutated once built."""
+    model: Any
+    scaler: Any
+    compiled: Optional[CompiledModel]
+    version: str
+    path: str
+    loaded_at: float
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        # The compiled engine has the scaler folded into its borders and takes raw features
+        if self.compiled is not None:
+            return self.compiled.predict(features)
+        return self.model.predict_proba(self.scaler.transform(features))[:, 1]
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_bundle(path: str, engine: str = 'compiled') -> ModelBundle:
+    """Load, compile and warm up a model artifact; raises if it is unusable."""
+    loaded = joblib.load(path)
+    model, scaler = loaded.get('model'), loaded.get('scaler')
+    if model is None or scaler is None:
+        raise ValueError(f"Model file '{path}' is missing model or scaler objects")
+    if not hasattr(model, 'feature_names_'):
+        logger.warning("Model does not have feature_names_. Assuming feature order: ['amount', 'hour_of_day', 'velocity', 'geo_distance']")
+    version = str(loaded.get('version') or _file_digest(path)[:12])
+
+    compiled = None
+    if engine == 'compiled':
+        try:
+            compiled = CompiledModel.from_catboost(model, scaler)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not compile model {version}, falling back to CatBoost runtime: {e}")
+
+    bundle = ModelBundle(model, scaler, compiled, version, path, time.time())
+    # Warm-up: exercise the scoring path at the batch sizes /score uses before going live
+    for size in WARMUP_BATCH_SIZES:
+        scores = bundle.predict(np.resize(WARMUP_FEATURES, (size, WARMUP_FEATURES.shape[1])))
+        if scores.shape != (size,) or not np.all((scores >= 0) & (scores <= 1)):
+            raise ValueError(f"Model {version} produced invalid warm-up scores")
+    return bundle
+
+
+class ModelRegistry:
+    """Holds the live model behind one reference that is swapped atomically.
+
+    Scoring code reads ``current`` once per call and uses that bundle
+    throughout, so a swap never mixes two versions within a request. New
+    artifacts are loaded, compiled and warmed up on a background thread that
+    polls the model file, and only then swapped in. Once a model is live, that
+    work runs in a short-lived child process and only the finished bundle is
+    unpickled here, so the load never competes with scoring for the GIL. Replaced bundles are kept
+    for rollback. Rolling back pins the version so polling does not
+    immediately bring the newer file back; an explicit reload unpins.
+    """
+
+    def __init__(self, path: str, engine: str = 'compiled', poll_interval: float = 5.0, history_size: int = 5,
+                 isolate_loads: bool = True, load_timeout: float = LOAD_TIMEOUT_SECONDS):
+        self.path = path
+        self.isolate_loads = isolate_loads
+        self.load_timeout = load_timeout
+        self.engine = engine
+        self.poll_interval = poll_interval
+        self.current: Optional[ModelBundle] = None
+        self.history: Deque[ModelBundle] = deque(maxlen=history_size)
+        self.pinned = False
+        self.reloads = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self._file_state: Optional[Tuple[int, int]] = None
+        self._lock = Lock()  # Serializes loads and swaps; scoring never takes it
+        self._stop = Event()
+        self._poller: Optional[Thread] = None
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _swap(self, bundle: ModelBundle):
+        if self.current is not None:
+            self.history.append(self.current)
+        self.current = bundle  # Single reference assignment: readers see the old or the new bundle
+
+    def _load(self) -> ModelBundle:
+        if not self.isolate_loads or self.current is None:
+            return load_bundle(self.path, self.engine)
+        # A fresh interpreter running this module (not a fork of the threaded server)
+        fd, out_path = tempfile.mkstemp(suffix='.bundle')
+        os.close(fd)
+        try:
+            try:
+                result = subprocess.run([sys.executable, os.path.abspath(__file__), os.path.abspath(self.path),
+                                         self.engine, out_path], capture_output=True, text=True, timeout=self.load_timeout)
+            except subprocess.TimeoutExpired:
+                raise RuntimeError(f"loader timed out after {self.load_timeout:g}s")
+            if result.returncode != 0:
+                raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else
+                                   f"loader exited with {result.returncode}")
+            with open(out_path, 'rb') as f:
+                return pickle.load(f)
+        finally:
+            os.remove(out_path)
+
+    def reload(self, force: bool = False) -> bool:
+        """Load the artifact if it changed (or ``force``) and swap it in; False if nothing was swapped."""
+        with self._lock:
+            state = self._stat()
+            if state is None:
+                self.last_error = f"Model file '{self.path}' not found"
+                logger.error(f"❌ {self.last_error}")
+                self.failures += 1
+                return False
+            if not force and (self.pinned or state == self._file_state):
+                return False
+            try:
+                bundle = self._load()
+            except Exception as e:
+                self._file_state = state  # Don't retry a broken artifact until it changes again
+                self.failures += 1
+                self.last_error = str(e)
+                logger.error(f"❌ Error loading model from {self.path}: {e}")
+                return False
+            self._file_state = state
+            self.last_error = None
+            if force:
+                self.pinned = False
+            if self.current is not None and bundle.version == self.current.version:
+                return False
+            self._swap(bundle)
+            self.reloads += 1
+        logger.info(f"✅ Model {bundle.version} is live ({'compiled' if bundle.compiled is not None else 'catboost'} engine).")
+        return True
+
+    def rollback(self, version: Optional[str] = None) -> ModelBundle:
+        """Go back to the previous version (or a specific retained one) and pin it."""
+        with self._lock:
+            if not self.history:
+                raise ValueError("No previous model version to roll back to")
+            if version is None:
+                target = self.history.pop()
+            else:
+                matches = [b for b in self.history if b.version == version]
+                if not matches:
+                    raise ValueError(f"Model version '{version}' is not retained")
+                target = matches[-1]
+                self.history.remove(target)
+            # The abandoned version is not retained; a reload brings it back from disk
+            self.current = target
+            self.pinned = True
+        logger.info(f"⚠️ Rolled back to model {target.version}; automatic reloads paused until the next explicit reload.")
+        return target
+
+    def start(self):
+        """Start polling the model file for new artifacts."""
+        if self._poller is None and self.poll_interval > 0:
+            self._poller = Thread(target=self._poll, name="model-registry", daemon=True)
+            self._poller.start()
+
+    def _poll(self):
+        while not self._stop.wait(self.poll_interval):
+            if not self.pinned and self._stat() != self._file_state:
+                self.reload()
+
+    def close(self):
+        self._stop.set()
+
+    def versions(self) -> List[str]:
+        return [b.version for b in self.history]
+
+    def get_stats(self) -> Dict[str, Any]:
+        bundle = self.current
+        return {
+            "version": bundle.version if bundle else None,
+            "engine": (('compiled' if bundle.compiled is not None else 'catboost') if bundle else None),
+            "loaded_at": bundle.loaded_at if bundle else None,
+            "path": self.path,
+            "pinned": self.pinned,
+            "previous_versions": self.versions(),
+            "reloads": self.reloads,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "poll_interval_seconds": self.poll_interval,
+        }
+
+
+if __name__ == "__main__":
+    # Child side of ModelRegistry._load: python model_registry.py <model path> <engine> <output path>
+    if hasattr(os, 'nice'):
+        os.nice(10)  # Yield the CPU to the server's request threads
+    from model_registry import load_bundle as load  # So the pickled bundle refers to model_registry, not __main__
+    model_path, scoring_engine, output_path = sys.argv[1:4]
+    with open(output_path, 'wb') as out:
+        pickle.dump(load(model_path, scoring_engine), out, protocol=pickle.HIGHEST_PROTOCOL)
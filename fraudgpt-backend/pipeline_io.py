@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+except ImportError:  # Columnar formats are optional; CSV always works
+    pa = None
+
+# Compact on-disk schema for pipeline tables (CSV files keep their text values)
+TABLE_DTYPES = {
+    'amount': 'float32',
+    'hour_of_day': 'uint8',
+    'velocity': 'float32',
+    'geo_distance': 'float32',
+    'is_fraud': 'bool',
+    'fraud_score': 'float32',
+}
+COLUMNAR_FORMATS = ('parquet', 'feather')
+NDJSON_EXTENSIONS = ('.json', '.ndjson', '.jsonl')
+
+
+def table_format(path: str) -> str:
+    """Infer the table format from the file extension: csv, parquet or feather (.feather/.arrow)."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.parquet':
+        return 'parquet'
+    if ext in ('.feather', '.arrow'):
+        return 'feather'
+    return 'csv'
+
+
+def _require_pyarrow(path: str):
+    if pa is None:
+        raise ImportError(f"pyarrow is required to read or write {path}; install it or use a .csv path")
+
+
+def compact(df: pd.DataFrame) -> pd.DataFrame:
+    """Cast known pipeline columns to their compact dtypes."""
+    dtypes = {col: dtype for col, dtype in TABLE_DTYPES.items() if col in df.columns}
+    return df.astype(dtypes)
+
+
+def compact_table(table: "pa.Table") -> "pa.Table":
+    """Arrow counterpart of compact() for tables built without pandas."""
+    for col, dtype in TABLE_DTYPES.items():
+        if col in table.column_names:
+            table = table.set_column(table.column_names.index(col), col,
+                                     table.column(col).cast(pa.from_numpy_dtype(np.dtype(dtype))))
+    return table
+
+
+def read_table(path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Load a pipeline table; columnar files are memory-mapped instead of read into buffers."""
+    fmt = table_format(path)
+    if fmt == 'csv':
+        return pd.read_csv(path, usecols=columns)
+    _require_pyarrow(path)
+    if fmt == 'feather':
+        table = feather.read_table(path, columns=columns, memory_map=True)
+    else:
+        table = pq.read_table(path, columns=columns, memory_map=True)
+    return table.to_pandas()
+
+
+def write_table(df: pd.DataFrame, path: str):
+    """Write a pipeline table; columnar formats use the compact dtypes."""
+    fmt = table_format(path)
+    if fmt == 'csv':
+        df.to_csv(path, index=False)
+        return
+    _require_pyarrow(path)
+    table = pa.Table.from_pandas(compact(df), preserve_index=False)
+    if fmt == 'feather':
+        # Uncompressed so readers can memory-map it without copying
+        feather.write_feather(table, path, compression='uncompressed')
+    else:
+        pq.write_table(table, path)
+
+
+def iter_table(path: str, chunksize: int) -> Iterator[pd.DataFrame]:
+    """Read a table in chunks of ``chunksize`` rows; .json/.ndjson/.jsonl files are read as NDJSON."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in NDJSON_EXTENSIONS:
+        # Keep values as written (no date or dtype guessing), like the CSV reader
+        yield from pd.read_json(path, lines=True, chunksize=chunksize, convert_dates=False, dtype=False)
+        return
+    fmt = table_format(path)
+    if fmt == 'csv':
+        yield from pd.read_csv(path, chunksize=chunksize)
+        return
+    _require_pyarrow(path)
+    if fmt == 'parquet':
+        for batch in pq.ParquetFile(path, memory_map=True).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    else:
+        table = feather.read_table(path, memory_map=True)
+        for batch in table.to_batches(max_chunksize=chunksize):
+            yield batch.to_pandas()
+
+
+class TableWriter:
+    """Appends DataFrames to a table file one batch at a time."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.format = table_format(path)
+        self._writer = None
+        self._file = None
+        if self.format == 'csv':
+            self._file = open(path, 'w', newline='')
+        else:
+            _require_pyarrow(path)
+
+    def write(self, df: Any):
+        """Append a DataFrame, or (for columnar files) an Arrow table already in the compact schema."""
+        if self.format == 'csv':
+            df.to_csv(self._file, header=self._file.tell() == 0, index=False)
+            return
+        table = df if isinstance(df, pa.Table) else pa.Table.from_pandas(compact(df), preserve_index=False)
+        if self._writer is None:
+            if self.format == 'feather':
+                self._writer = ipc.new_file(self.path, table.schema)
+            else:
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+        self._writer.write_table(table)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+        if self._writer is not None:
+            self._writer.close()
+
+    def __enter__(self) -> "TableWriter":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def file_fingerprint(path: str, block_size: int = 1 << 20) -> str:
+    """SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _meta_path(output_path: str) -> str:
+    return output_path + '.meta.json'
+
+
+def build_fingerprint(inputs: Iterable[str], params: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "inputs": {os.path.basename(path): file_fingerprint(path) for path in inputs},
+        "params": params,
+    }
+
+
+def is_up_to_date(output_path: str, fingerprint: Dict[str, Any]) -> bool:
+    """True if ``output_path`` exists and was built from the same input contents and parameters."""
+    if not os.path.exists(output_path):
+        return False
+    try:
+        with open(_meta_path(output_path), 'r') as f:
+            return json.load(f) == fingerprint
+    except (OSError, ValueError):
+        return False
+
+
+def record_fingerprint(output_path: str, fingerprint: Dict[str, Any]):
+    """Store the fingerprint next to the output as ``<output>.meta.json``."""
+    with open(_meta_path(output_path), 'w') as f:
+        json.dump(fingerprint, f, indent=2)
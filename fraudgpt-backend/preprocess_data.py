@@ -1,52 +1,176 @@
+import argparse
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
 import pandas as pd
 import numpy as np
-from geopy.distance import geodesic
-
-input_path = "transactions.csv"
-output_path = "features.csv"
-df = pd.read_csv(input_path)
-
-# Feature engineering
-df['timestamp'] = pd.to_datetime(df['timestamp'])
-df['hour_of_day'] = df['timestamp'].dt.hour
-
-# Velocity
-df = df.sort_values(['user_id', 'timestamp'])
-df['time_diff'] = df.groupby('user_id')['timestamp'].diff().dt.total_seconds() / 3600
-df['velocity'] = 1 / df['time_diff'].replace(0, np.nan).clip(lower=0.01, upper=15)
-df['velocity'] = df['velocity'].fillna(0)
-
-# Geo-distance
-city_coords = {
-    "New York, NY": (40.7128, -74.0060),
-    "London, UK": (51.5074, -0.1278),
-    "Tokyo, JP": (35.6762, 139.6503),
-    "Los Angeles, CA": (34.0522, -118.2437),
-    "Chicago, IL": (41.8781, -87.6298),
-    "Miami, FL": (25.7617, -80.1918),
-    "Boston, MA": (42.3601, -71.0589),
-    "San Francisco, CA": (37.7749, -122.4194),
-    "Seattle, WA": (47.6062, -122.3321),
-    "Houston, TX": (29.7604, -95.3698)
-}
-def get_distance(row, prev_locations):
-    if row['user_id'] in prev_locations and prev_locations[row['user_id']]:
-        prev_loc = prev_locations[row['user_id']][-1]
-        curr_loc = city_coords.get(row['location'], city_coords["Boston, MA"])
-        prev_loc = city_coords.get(prev_loc, city_coords["Boston, MA"])
-        return min(geodesic(curr_loc, prev_loc).km, 1200)
-    return 0
-
-df['geo_distance'] = 0.0
-prev_locations = {}
-for idx, row in df.iterrows():
-    if row['user_id'] not in prev_locations:
-        prev_locations[row['user_id']] = []
-    df.at[idx, 'geo_distance'] = get_distance(row, prev_locations)
-    prev_locations[row['user_id']].append(row['location'])
-
-# Save features
-features = ['amount', 'hour_of_day', 'velocity', 'geo_distance']
-df_features = df[features + ['is_fraud']]
-df_features.to_csv(output_path, index=False)
-print(f"Features saved to {output_path}")
\ No newline at end of file
+from feature_store import DEFAULT_LOCATION, EARTH_RADIUS_KM, MAX_GEO_DISTANCE_KM, resolve_location
+from gazetteer import GAZETTEER_SOURCE, get_gazetteer
+from pipeline_io import (TableWriter, build_fingerprint, is_up_to_date, record_fingerprint, table_format,
+                         write_table)
+
+FEATURES = ['amount', 'hour_of_day', 'velocity', 'geo_distance']
+# Columns compute_features needs; streaming mode spills only these
+RAW_COLUMNS = ['user_id', 'timestamp', 'location', 'amount', 'is_fraud']
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in kilometres over whole coordinate arrays."""
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = np.radians(lon2 - lon1)
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+
+def geodesic_km(lat1, lon1, lat2, lon2):
+    """WGS-84 geodesic distance (geopy), computed once per distinct coordinate pair."""
+    from geopy.distance import geodesic
+    pairs = np.column_stack([lat1, lon1, lat2, lon2])
+    unique_pairs, inverse = np.unique(pairs, axis=0, return_inverse=True)
+    distances = np.array([geodesic((a, b), (c, d)).km for a, b, c, d in unique_pairs])
+    return distances[inverse.ravel()]
+
+
+def compute_features(df: pd.DataFrame, exact_geodesic: bool = False) -> pd.DataFrame:
+    """Add hour_of_day, velocity and geo_distance columns, sorted by user and time."""
+    df = df.copy()
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    df['hour_of_day'] = df['timestamp'].dt.hour
+
+    # Velocity
+    df = df.sort_values(['user_id', 'timestamp'])
+    df['time_diff'] = df.groupby('user_id')['timestamp'].diff().dt.total_seconds() / 3600
+    df['velocity'] = 1 / df['time_diff'].replace(0, np.nan).clip(lower=0.01, upper=15)
+    df['velocity'] = df['velocity'].fillna(0)
+
+    # Geo-distance between each transaction and the user's previous one; each distinct
+    # location is looked up in the gazetteer once, and unknown ones fall back to Boston
+    default_lat, default_lon = resolve_location(DEFAULT_LOCATION)
+    coords = {loc: resolve_location(loc) for loc in df['location'].dropna().unique()}
+    df['lat'] = df['location'].map({loc: lat for loc, (lat, _) in coords.items()}).fillna(default_lat)
+    df['lon'] = df['location'].map({loc: lon for loc, (_, lon) in coords.items()}).fillna(default_lon)
+    previous = df.groupby('user_id')[['lat', 'lon']].shift()
+    has_previous = previous['lat'].notna().to_numpy()
+    lat, lon = df['lat'].to_numpy()[has_previous], df['lon'].to_numpy()[has_previous]
+    prev_lat, prev_lon = previous['lat'].to_numpy()[has_previous], previous['lon'].to_numpy()[has_previous]
+    distance = geodesic_km if exact_geodesic else haversine_km
+    geo_distance = np.zeros(len(df))
+    geo_distance[has_previous] = np.minimum(distance(lat, lon, prev_lat, prev_lon), MAX_GEO_DISTANCE_KM)
+    df['geo_distance'] = geo_distance
+    return df
+
+
+def partition_transactions(input_path: str, spill_dir: str, partitions: int, chunksize: int) -> List[str]:
+    """Split the input into ``partitions`` CSV spill files by a stable hash of user_id.
+
+    Every transaction of a user lands in the same file, so each file can be
+    featurized on its own. Values are copied as text, untouched.
+    """
+    paths = [os.path.join(spill_dir, f"transactions-{i:04d}.csv") for i in range(partitions)]
+    for path in paths:
+        pd.DataFrame(columns=RAW_COLUMNS).to_csv(path, index=False)
+    for chunk in pd.read_csv(input_path, usecols=RAW_COLUMNS, dtype=str, chunksize=chunksize):
+        chunk = chunk[RAW_COLUMNS]
+        keys = pd.util.hash_pandas_object(chunk['user_id'], index=False).to_numpy() % partitions
+        for i, part in chunk.groupby(keys):
+            part.to_csv(paths[i], mode='a', header=False, index=False)
+    return paths
+
+
+def output_columns(with_timestamp: bool = False) -> List[str]:
+    return FEATURES + ['is_fraud'] + (['timestamp'] if with_timestamp else [])
+
+
+def featurize_partition(spill_path: str, output_path: str, exact_geodesic: bool, with_timestamp: bool = False) -> int:
+    """Compute features for one spill file and write them to ``output_path``."""
+    df = compute_features(pd.read_csv(spill_path), exact_geodesic=exact_geodesic)
+    df[output_columns(with_timestamp)].to_csv(output_path, index=False)
+    return len(df)
+
+
+def stream_features(input_path: str, output_path: str, partitions: int = 64, chunksize: int = 500_000,
+                    workers: Optional[int] = None, exact_geodesic: bool = False, spill_dir: Optional[str] = None,
+                    with_timestamp: bool = False) -> int:
+    """Out-of-core version of compute_features for inputs that do not fit in memory.
+
+    The input is read in chunks and spilled into per-user-hash partitions,
+    partitions are featurized in parallel worker processes, and their results
+    are appended to ``output_path`` (CSV, Parquet or Feather, by extension)
+    in partition order as they complete. Peak
+    memory is about one chunk plus one partition per worker. Rows are sorted
+    by user and time within each partition, not globally.
+    """
+    workdir = tempfile.mkdtemp(prefix="preprocess-", dir=spill_dir)
+    try:
+        spill_paths = partition_transactions(input_path, workdir, partitions, chunksize)
+        feature_paths = [path.replace("transactions-", "features-") for path in spill_paths]
+        rows = 0
+        columnar = table_format(output_path) != 'csv'
+        with ProcessPoolExecutor(max_workers=workers) as executor, \
+                (TableWriter(output_path) if columnar else open(output_path, 'w', newline='')) as out:
+            if not columnar:
+                out.write(','.join(output_columns(with_timestamp)) + '\n')
+            results = executor.map(featurize_partition, spill_paths, feature_paths, [exact_geodesic] * partitions,
+                                   [with_timestamp] * partitions)
+            for feature_path, count in zip(feature_paths, results):
+                if columnar:
+                    if count:
+                        out.write(pd.read_csv(feature_path, float_precision='round_trip',
+                                              parse_dates=['timestamp'] if with_timestamp else False))
+                else:
+                    with open(feature_path, 'r', newline='') as part:
+                        part.readline()  # header
+                        shutil.copyfileobj(part, out)
+                os.remove(feature_path)
+                rows += count
+        return rows
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Derive model features from raw transactions.")
+    parser.add_argument("--input", default="transactions.csv")
+    parser.add_argument("--output", default="features.csv",
+                        help="Output file; .parquet or .feather write a compact columnar table instead of CSV.")
+    parser.add_argument("--force", action="store_true", help="Rebuild even if the output is up to date with the input.")
+    parser.add_argument("--exact-geodesic", action="store_true",
+                        help="Use geopy's WGS-84 geodesic instead of haversine (matches older features.csv exports exactly).")
+    parser.add_argument("--with-timestamp", action="store_true",
+                        help="Also write each transaction's timestamp (lets train_model.py order its CV folds by time).")
+    parser.add_argument("--stream", action="store_true",
+                        help="Out-of-core mode: chunked reads, user-hash partitions spilled to disk, parallel featurization.")
+    parser.add_argument("--partitions", type=int, default=64, help="Spill partitions in --stream mode.")
+    parser.add_argument("--chunksize", type=int, default=500_000, help="Rows read per chunk in --stream mode.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes in --stream mode (default: all cores).")
+    parser.add_argument("--spill-dir", default=None, help="Directory for --stream spill files (default: system temp).")
+    args = parser.parse_args()
+
+    # Skip the work when the output was already built from identical input contents
+    # (the gazetteer's place list counts as an input: editing it changes geo_distance)
+    fingerprint = build_fingerprint([args.input, GAZETTEER_SOURCE], {"exact_geodesic": args.exact_geodesic,
+                                                                     "with_timestamp": args.with_timestamp})
+    if not args.force and is_up_to_date(args.output, fingerprint):
+        print(f"{args.output} is up to date with {args.input}; nothing to do (use --force to rebuild)")
+        raise SystemExit(0)
+
+    if args.stream:
+        rows = stream_features(args.input, args.output, args.partitions, args.chunksize, args.workers,
+                               args.exact_geodesic, args.spill_dir, args.with_timestamp)
+        print(f"Features for {rows} transactions saved to {args.output}")
+    else:
+        df = compute_features(pd.read_csv(args.input), exact_geodesic=args.exact_geodesic)
+
+        # Save features
+        df_features = df[output_columns(args.with_timestamp)]
+        write_table(df_features, args.output)
+        print(f"Features saved to {args.output}")
+        locations = df['location'].dropna().unique()
+        unresolved = sum(get_gazetteer().lookup(loc) is None for loc in locations)
+        if unresolved:
+            print(f"⚠️ {unresolved} of {len(locations)} distinct locations are not in the gazetteer "
+                  f"and were placed at {DEFAULT_LOCATION}")
+    record_fingerprint(args.output, fingerprint)
@@ -1,14 +1,17 @@
+import asyncio
 import pandas as pd
 import requests
 import time
 import argparse
 import random
+from collections import deque
 from datetime import datetime
 from colorama import init, Fore, Style
-import geopy.geocoders
-import haversine as hs
 import sys
 import subprocess
+import math
+import uuid
+from bisect import bisect_right
 
 # --- Library Check and Installation ---
 # This block ensures all required libraries are installed before running.
@@ -32,8 +35,9 @@ init(autoreset=True)
 install_and_import('colorama')
 install_and_import('pandas')
 install_and_import('requests')
-install_and_import('geopy')
-install_and_import('haversine')
+install_and_import('httpx')
+import httpx
+from feature_store import MAX_GEO_DISTANCE_KM, haversine_km, resolve_location
 
 # CLI arguments
 parser = argparse.ArgumentParser(description="Simulate real-time transactions with enhanced fraud explanations.")
@@ -41,10 +45,29 @@ parser.add_argument("--speed", type=float, default=1.5, help="Delay (seconds) be
 parser.add_argument("--loop", action="store_true", help="Loop transactions indefinitely.")
 parser.add_argument("--detailed", action="store_true", help="Show detailed fraud analysis for flagged transactions.")
 parser.add_argument("--save-log", type=str, help="Save detailed logs to specified file.")
+parser.add_argument("--server-features", action="store_true", help="Send raw events to /score/event and let the backend compute velocity and geo_distance.")
+load = parser.add_argument_group("load test", "Open-loop load generation: requests start on schedule whether or not earlier ones have finished.")
+load.add_argument("--load", action="store_true", help="Run the async load generator instead of the one-at-a-time simulation.")
+load.add_argument("--rps", type=float, default=100.0, help="Target requests per second.")
+load.add_argument("--duration", type=float, default=30.0, help="Seconds to generate load for.")
+load.add_argument("--schedule", choices=["constant", "poisson", "burst"], default="constant",
+                  help="Arrival process: evenly spaced, Poisson (exponential gaps) or bursts every --burst-interval seconds.")
+load.add_argument("--burst-interval", type=float, default=1.0, help="Seconds between bursts for --schedule burst.")
+load.add_argument("--concurrency", type=int, default=64, help="Most requests in flight (and pooled keep-alive connections).")
+load.add_argument("--batch-size", type=int, default=1, help="Transactions per request; above 1 posts JSON arrays to /score/batch.")
+load.add_argument("--timeout", type=float, default=10.0, help="Per-request timeout in seconds.")
+load.add_argument("--seed", type=int, default=None, help="Seed for the arrival schedule and transaction sampling.")
+load.add_argument("--show-results", action="store_true", help="Print the colored per-transaction summary for every response.")
 args = parser.parse_args()
 
 # Backend API URL (ensure it matches the backend host)
 API_URL = "http://127.0.0.1:8080/score"
+EVENT_API_URL = "http://127.0.0.1:8080/score/event"
+BATCH_API_URL = "http://127.0.0.1:8080/score/batch"
+
+# Transaction ids are unique per run, so the backend can recognise retries
+# (and ignore them) without confusing them with an earlier run's transactions
+RUN_ID = uuid.uuid4().hex[:12]
 
 # Load transactions.csv and sort by timestamp to maintain logical history
 try:
@@ -59,47 +82,47 @@ except Exception as e:
     print(f"❌ Error loading transactions.csv: {e}")
     exit(1)
 
-# In-memory stores for feature engineering
-transaction_history = []
-location_cache = {}
-geolocator = geopy.geocoders.Nominatim(user_agent="fraud_simulation")
+# In-memory stores for feature engineering, kept per user so each event costs O(1)
+# however much history the simulation has built up
 VELOCITY_WINDOW_MINUTES = 60
+VELOCITY_WINDOW_NS = VELOCITY_WINDOW_MINUTES * 60 * 10**9
+user_windows = {}  # user_id -> deque of the user's transaction times (ns) inside the velocity window, in time order
+user_latest = {}  # user_id -> latest transaction time (ns) seen for the user
+last_location = {}  # user_id -> coordinates of the user's previous transaction
 
 # --- Helper Functions for Feature Engineering ---
-def get_coordinates(location_name: str):
-    """Fetches and caches geolocation coordinates for a location string."""
-    if location_name in location_cache:
-        return location_cache[location_name]
-    
-    try:
-        loc = geolocator.geocode(location_name, timeout=5)
-        if loc:
-            coords = (loc.latitude, loc.longitude)
-            location_cache[location_name] = coords
-            return coords
-    except Exception as e:
-        # Geolocation lookup is a best-effort feature.
-        # It's okay if it fails, we just log and continue.
-        # print(f"⚠️ Geolocation lookup for '{location_name}' failed: {e}")
-        pass # Suppress the warning to keep the output cleaner.
-    return None
-
 def calculate_geo_distance(current_coords, recent_coords):
-    """Calculates haversine distance between two sets of coordinates."""
-    if current_coords and recent_coords:
-        distance = hs.haversine(current_coords, recent_coords)
-        return distance
-    return 0.0
+    """Haversine distance between two sets of coordinates, capped like the training feature."""
+    return min(haversine_km(*current_coords, *recent_coords), MAX_GEO_DISTANCE_KM)
+
+def evict_window(window, horizon):
+    """Drop transaction times at or before ``horizon`` from the front of a user's window."""
+    while window and window[0] <= horizon:
+        window.popleft()
 
-def calculate_velocity(user_id, current_timestamp, transaction_history):
+def calculate_velocity(user_id, current_timestamp):
     """Calculates transaction velocity for a user within a time window."""
-    window_start = current_timestamp - pd.Timedelta(minutes=VELOCITY_WINDOW_MINUTES)
-    velocity_count = 0
-    # The history list is filtered for the current user and time window
-    for tx in transaction_history:
-        if tx.get('user_id') == user_id and tx.get('timestamp') > window_start:
-            velocity_count += 1
-    return velocity_count
+    window = user_windows.get(user_id)
+    if not window:
+        return 0
+    # Counts every kept time after the window start, like a scan of the user's history
+    return len(window) - bisect_right(window, current_timestamp.value - VELOCITY_WINDOW_NS)
+
+def record_transaction(user_id, current_timestamp, coords):
+    """Adds a transaction to the user's rolling state, evicting times that left the window."""
+    now = current_timestamp.value
+    window = user_windows.get(user_id)
+    if window is None:
+        window = user_windows[user_id] = deque()
+    if not window or now >= window[-1]:
+        window.append(now)
+    else:
+        # Rows are sampled at random, so an older transaction can arrive after newer ones
+        window.insert(bisect_right(window, now), now)
+    if now > user_latest.get(user_id, now - 1):
+        user_latest[user_id] = now
+    evict_window(window, user_latest[user_id] - VELOCITY_WINDOW_NS)
+    last_location[user_id] = coords
 
 # --- Printing and Logging Functions (Unchanged from your code) ---
 def get_color_for_severity(severity):
@@ -177,6 +200,175 @@ def log_transaction(transaction_id, txn, result, log_file):
     except Exception as e:
         print(f"❌ Error writing to log file: {e}")
 
+# --- Load Generator ---
+class LatencyHistogram:
+    """HDR-style histogram of latencies in microseconds.
+
+    Values keep their top 7 significant bits (under 1% relative error) in
+    log-linear buckets, so memory stays small at any request count while the
+    tail percentiles stay accurate.
+    """
+    SUB_BUCKET_BITS = 7
+
+    def __init__(self):
+        self.counts = {}
+        self.total = 0
+        self.min = None
+        self.max = 0
+        self.sum = 0
+
+    def record(self, seconds):
+        value = max(1, int(seconds * 1e6))
+        shift = max(0, value.bit_length() - self.SUB_BUCKET_BITS)
+        index = (shift << self.SUB_BUCKET_BITS) + (value >> shift)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.total += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = max(self.max, value)
+
+    def _upper_value(self, index):
+        shift = index >> self.SUB_BUCKET_BITS
+        return (((index & ((1 << self.SUB_BUCKET_BITS) - 1)) + 1) << shift) - 1
+
+    def percentile(self, pct):
+        """Latency in microseconds at or below which ``pct`` percent of requests completed."""
+        if not self.total:
+            return 0
+        target = max(1, math.ceil(self.total * pct / 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(self._upper_value(index), self.max)
+        return self.max
+
+
+def build_load_pool(server_features):
+    """Request bodies (without ids) built up front, so generating load costs no feature work."""
+    if server_features:
+        return [{
+            "user_id": row.user_id,
+            "amount": float(row.amount),
+            "timestamp": row.timestamp.isoformat(),
+            "location": row.location
+        } for row in df.itertuples()]
+    from preprocess_data import compute_features  # Vectorized training features; no geocoding calls
+    features = compute_features(df)
+    return [{
+        "amount": float(row.amount),
+        "hour_of_day": int(row.hour_of_day),
+        "velocity": float(row.velocity),
+        "geo_distance": float(row.geo_distance)
+    } for row in features.itertuples()]
+
+
+def arrival_offsets(schedule, rps, duration, burst_interval, rng):
+    """Seconds from the start at which each request is due."""
+    t = 0.0
+    if schedule == "burst":
+        per_burst = max(1, round(rps * burst_interval))
+        while t < duration:
+            for _ in range(per_burst):
+                yield t
+            t += burst_interval
+        return
+    while True:
+        t += rng.expovariate(rps) if schedule == "poisson" else 1.0 / rps
+        if t >= duration:
+            return
+        yield t
+
+
+async def run_load_test():
+    if args.server_features and args.batch_size > 1:
+        print("❌ --server-features sends single events to /score/event; it cannot be combined with --batch-size")
+        sys.exit(1)
+    # Separate streams, both drawn in the scheduling loop, so a seed reproduces the schedule
+    # and the payloads whatever order the requests complete in
+    schedule_rng = random.Random(args.seed)
+    payload_rng = random.Random(None if args.seed is None else args.seed + 1)
+    pool = build_load_pool(args.server_features)
+    url = EVENT_API_URL if args.server_features else (BATCH_API_URL if args.batch_size > 1 else API_URL)
+
+    histogram = LatencyHistogram()  # Successful requests
+    all_histogram = LatencyHistogram()  # Every request, failed and timed out ones included
+    errors = {}
+    sent = completed = transactions_done = fraud_count = 0
+    max_start_delay = 0.0
+    slots = asyncio.Semaphore(args.concurrency)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async def send(client, bodies, due):
+        nonlocal completed, transactions_done, fraud_count, max_start_delay
+        async with slots:
+            max_start_delay = max(max_start_delay, loop.time() - due)
+            try:
+                response = await client.post(url, json=bodies if args.batch_size > 1 else bodies[0])
+                response.raise_for_status()
+                result = response.json()
+            except Exception as e:
+                key = f"HTTP {e.response.status_code}" if isinstance(e, httpx.HTTPStatusError) else type(e).__name__
+                errors[key] = errors.get(key, 0) + 1
+                all_histogram.record(loop.time() - due)
+                return
+        # Latency is measured from when the request was due, not when it got a connection,
+        # so queueing behind a saturated server counts against it (no coordinated omission)
+        latency = loop.time() - due
+        histogram.record(latency)
+        all_histogram.record(latency)
+        completed += 1
+        results = result.get("results", []) if args.batch_size > 1 else [result]
+        transactions_done += len(results)
+        fraud_count += sum(1 for r in results if r.get("is_flagged") or r.get("fraud_score", 0) > 0.5)
+        if args.show_results:
+            for body, r in zip(bodies, results):
+                print_transaction_summary(body["id"], {**body, **r.get("features", {}), **r.get("transaction", {})}, r)
+
+    loop = asyncio.get_running_loop()
+    print(f"🚀 Load test: {args.schedule} arrivals at {args.rps:g} req/s for {args.duration:g}s, "
+          f"concurrency {args.concurrency}, {args.batch_size} txn/request -> {url}")
+    tasks = []
+    async with httpx.AsyncClient(limits=limits, timeout=args.timeout) as client:
+        start = loop.time()
+        for offset in arrival_offsets(args.schedule, args.rps, args.duration, args.burst_interval, schedule_rng):
+            sent += 1
+            # Unique ids, so the backend's duplicate suppression never short-circuits a load request
+            bodies = [dict(payload_rng.choice(pool), id=f"{RUN_ID}-{sent}-{i}") for i in range(args.batch_size)]
+            delay = start + offset - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(loop.create_task(send(client, bodies, start + offset)))
+        generated_in = loop.time() - start
+        await asyncio.gather(*tasks)
+        # Over the whole test window, so an early burst does not read as a higher sustained rate
+        elapsed = max(loop.time() - start, args.duration)
+
+    failed = sum(errors.values())
+    print(f"\n{Fore.CYAN}📊 Load Test Results:{Style.RESET_ALL}")
+    print(f"  • Requests: {sent} sent over {generated_in:.2f}s, {completed} succeeded, {failed} failed "
+          f"({failed / sent * 100 if sent else 0:.2f}% errors)")
+    for key, count in sorted(errors.items(), key=lambda item: -item[1]):
+        print(f"      {key}: {count}")
+    if errors.get("HTTP 429"):
+        print(f"{Fore.YELLOW}⚠️ The backend firewall rate limited {errors['HTTP 429']} requests. Whitelisted IPs "
+              f"(127.0.0.1 by default) are exempt; add this client's IP to the whitelist in firewall_config.json."
+              f"{Style.RESET_ALL}")
+    print(f"  • Throughput: {completed / elapsed:,.1f} req/s, {transactions_done / elapsed:,.1f} txn/s achieved "
+          f"(target {args.rps:g} req/s)")
+    print(f"  • Flagged: {fraud_count} of {transactions_done} transactions")
+    print(f"  • Worst start delay behind schedule: {max_start_delay * 1000:.1f} ms")
+    if all_histogram.total:
+        # Failed requests get their own column: dropping them would hide a saturated server's tail
+        print(f"\n  {'Percentile':>10}  {'Succeeded (ms)':>14}  {'All requests (ms)':>17}")
+        for pct in (50, 75, 90, 95, 99, 99.9, 99.99, 100):
+            print(f"  {pct:>10g}  {histogram.percentile(pct) / 1000:>14.3f}  {all_histogram.percentile(pct) / 1000:>17.3f}")
+        for label, h in (("succeeded", histogram), ("all", all_histogram)):
+            if h.total:
+                print(f"  {label}: mean {h.sum / h.total / 1000:.3f} ms, min {h.min / 1000:.3f} ms, "
+                      f"max {h.max / 1000:.3f} ms over {h.total} requests")
+
+
 # --- Main Simulation Loop ---
 def main():
     """Main transaction simulation loop."""
@@ -201,49 +393,49 @@ def main():
             
             # --- Feature Engineering ---
             current_timestamp = row['timestamp']
-            hour_of_day = current_timestamp.hour
+            if args.server_features:
+                # Send the raw event; the backend derives velocity and geo_distance itself
+                url = EVENT_API_URL
+                txn = {
+                    "id": f"{RUN_ID}-{transaction_count}",
+                    "user_id": row["user_id"],
+                    "amount": float(row["amount"]),
+                    "timestamp": current_timestamp.isoformat(),
+                    "location": row["location"]
+                }
+            else:
+                url = API_URL
+                hour_of_day = current_timestamp.hour
             
-            # Note: Because transactions are now sent randomly, the transaction_history
-            # will not be in strict chronological order. This will affect the accuracy of
-            # velocity and geo_distance calculations, but it's a trade-off for
-            # simulating a random stream of transactions.
-            velocity = calculate_velocity(row['user_id'], current_timestamp, transaction_history)
+                # Note: Because transactions are now sent randomly, a user's history
+                # will not be in strict chronological order. This will affect the accuracy of
+                # velocity and geo_distance calculations, but it's a trade-off for
+                # simulating a random stream of transactions.
+                velocity = calculate_velocity(row['user_id'], current_timestamp)
             
-            geo_distance = 0
-            current_coords = get_coordinates(row['location'])
-            if current_coords:
-                recent_txn_history = [t for t in transaction_history if t.get('user_id') == row['user_id']]
-                if recent_txn_history:
-                    last_location = recent_txn_history[-1].get('location')
-                    recent_coords = get_coordinates(last_location)
-                    if recent_coords:
-                        geo_distance = calculate_geo_distance(current_coords, recent_coords)
-
-            # Store the transaction in history for future calculations
-            transaction_history.append({
-                'user_id': row['user_id'],
-                'timestamp': current_timestamp,
-                'location': row['location']
-            })
-            
-            # Keep history from getting too large by trimming old entries
-            while len(transaction_history) > 1000:
-                transaction_history.pop(0)
-
-            # Prepare transaction data for the backend API
-            txn = {
-                "id": transaction_count, # This is the sequential ID fix
-                "amount": float(row["amount"]),
-                "hour_of_day": int(hour_of_day),
-                "velocity": float(velocity),
-                "geo_distance": float(geo_distance)
-            }
+                # Offline gazetteer lookup, with the same Boston fallback as training
+                geo_distance = 0
+                current_coords = resolve_location(row['location'])
+                if row['user_id'] in last_location:
+                    geo_distance = calculate_geo_distance(current_coords, last_location[row['user_id']])
+
+                # Store the transaction in the user's state for future calculations
+                record_transaction(row['user_id'], current_timestamp, current_coords)
+
+                # Prepare transaction data for the backend API
+                txn = {
+                    "id": f"{RUN_ID}-{transaction_count}",  # Same id on every retry of this transaction
+                    "amount": float(row["amount"]),
+                    "hour_of_day": int(hour_of_day),
+                    "velocity": float(velocity),
+                    "geo_distance": float(geo_distance)
+                }
             
             try:
                 # Send transaction to API with retry
                 for attempt in range(3):
                     try:
-                        response = requests.post(API_URL, json=txn, timeout=10)
+                        response = requests.post(url, json=txn, timeout=10)
                         response.raise_for_status()
                         break
                     except requests.exceptions.RequestException as e:
@@ -256,6 +448,10 @@ def main():
                 if result.get('error'):
                     print(f"❌ API Error: {result['error']}")
                     continue
+                if result.get('duplicate'):
+                    print(f"⚠️ Transaction {transaction_count} was already scored by an earlier attempt; using that result")
+                if args.server_features:
+                    txn.update(result.get('features', {}))
                 
                 # Count fraud cases
                 if result.get('is_flagged', False):
@@ -292,4 +488,10 @@ def main():
             print(f"  • Detailed logs saved to: {args.save_log}")
 
 if __name__ == "__main__":
-    main()
+    if args.load:
+        try:
+            asyncio.run(run_load_test())
+        except KeyboardInterrupt:
+            print(f"\n{Fore.YELLOW}🛑 Load test stopped by user{Style.RESET_ALL}")
+    else:
+        main()
@@ -0,0 +1,156 @@
+import logging
+import queue
+import time
+from collections import deque
+from threading import Thread
+from typing import Any, Deque, Dict, List, Optional
+
+import numpy as np
+
+from model_registry import ModelBundle, load_bundle
+
+logger = logging.getLogger(__name__)
+
+
+class ShadowModelStats:
+    """Comparison counters for one shadow model against the champion."""
+
+    def __init__(self, latency_samples: int):
+        self.rows = 0
+        self.batches = 0
+        self.flag_agreements = 0
+        self.abs_diff_sum = 0.0
+        self.max_abs_diff = 0.0
+        self.errors = 0
+        self.latencies_ms: Deque[float] = deque(maxlen=latency_samples)
+
+
+class ShadowScorer:
+    """Scores challenger models on live traffic off the request path.
+
+    ``submit`` only puts the champion's features and scores on a bounded
+    queue; a single background thread drains it, coalescing queued batches
+    into one call per shadow model, and compares the results. Shadow work is
+    the first thing shed: submissions are dropped when the queue is full or
+    when the caller reports that champion requests are waiting.
+    """
+
+    def __init__(self, models: Dict[str, ModelBundle], threshold: float, max_queue: int = 1024,
+                 max_rows_per_batch: int = 4096, latency_samples: int = 2048, recent_size: int = 20):
+        self.models = models
+        self.threshold = threshold
+        self.queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self.max_rows_per_batch = max_rows_per_batch
+        self.stats = {name: ShadowModelStats(latency_samples) for name in models}
+        self.recent: Deque[Dict[str, Any]] = deque(maxlen=recent_size)
+        self.submitted = 0
+        self.shed_full = 0
+        self.shed_busy = 0
+        self._thread: Optional[Thread] = None
+        if models:
+            self._thread = Thread(target=self._run, name="shadow-scorer", daemon=True)
+            self._thread.start()
+
+    @classmethod
+    def from_files(cls, paths: Dict[str, str], threshold: float, engine: str = 'compiled', **kwargs) -> "ShadowScorer":
+        """Load shadow models by name; ones that fail to load are skipped with an error."""
+        models = {}
+        for name, path in paths.items():
+            try:
+                models[name] = load_bundle(path, engine)
+                logger.info(f"✅ Shadow model '{name}' loaded (version {models[name].version}).")
+            except Exception as e:
+                logger.error(f"❌ Could not load shadow model '{name}' from {path}: {e}")
+        return cls(models, threshold, **kwargs)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.models)
+
+    def submit(self, features: np.ndarray, champion_scores: np.ndarray, champion_version: str = "",
+               busy: bool = False) -> bool:
+        """Queue a scored batch for shadow scoring without blocking; False if it was shed."""
+        if not self.models:
+            return False
+        if busy:
+            self.shed_busy += 1
+            return False
+        try:
+            self.queue.put_nowait((features, champion_scores, champion_version))
+        except queue.Full:
+            self.shed_full += 1
+            return False
+        self.submitted += 1
+        return True
+
+    def _collect(self) -> List[tuple]:
+        items = [self.queue.get()]
+        rows = len(items[0][0])
+        while rows < self.max_rows_per_batch:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            items.append(item)
+            rows += len(item[0])
+        return items
+
+    def _run(self):
+        while True:
+            items = self._collect()
+            features = np.concatenate([item[0] for item in items])
+            champion = np.concatenate([item[1] for item in items])
+            champion_flags = champion > self.threshold
+            shadow_scores = {}
+            for name, bundle in self.models.items():
+                stats = self.stats[name]
+                started = time.perf_counter()
+                try:
+                    scores = bundle.predict(features)
+                except Exception as e:
+                    stats.errors += 1
+                    logger.error(f"❌ Shadow model '{name}' failed: {e}")
+                    continue
+                stats.latencies_ms.append((time.perf_counter() - started) * 1000)
+                diff = np.abs(scores - champion)
+                stats.rows += len(scores)
+                stats.batches += 1
+                stats.flag_agreements += int(np.count_nonzero((scores > self.threshold) == champion_flags))
+                stats.abs_diff_sum += float(diff.sum())
+                stats.max_abs_diff = max(stats.max_abs_diff, float(diff.max()))
+                shadow_scores[name] = scores
+            # Keep the latest scored rows side by side with the champion's fraud_score
+            versions = [version for _, item_scores, version in items for _ in range(len(item_scores))]
+            for i in range(max(0, len(champion) - self.recent.maxlen), len(champion)):
+                self.recent.append({
+                    "fraud_score": round(float(champion[i]), 3),
+                    "champion_version": versions[i],
+                    "shadow_scores": {name: round(float(s[i]), 3) for name, s in shadow_scores.items()},
+                })
+
+    def get_stats(self) -> Dict[str, Any]:
+        models = {}
+        for name, bundle in self.models.items():
+            stats = self.stats[name]
+            latencies = list(stats.latencies_ms)
+            p50, p99 = np.percentile(latencies, [50, 99]) if latencies else (0.0, 0.0)
+            models[name] = {
+                "version": bundle.version,
+                "rows": stats.rows,
+                "batches": stats.batches,
+                "errors": stats.errors,
+                "flag_agreement": round(stats.flag_agreements / stats.rows, 4) if stats.rows else None,
+                "mean_abs_score_diff": round(stats.abs_diff_sum / stats.rows, 4) if stats.rows else None,
+                "max_abs_score_diff": round(stats.max_abs_diff, 4),
+                "batch_latency_p50_ms": round(float(p50), 3),
+                "batch_latency_p99_ms": round(float(p99), 3),
+            }
+        return {
+            "models": models,
+            "threshold": self.threshold,
+            "submitted": self.submitted,
+            "shed_queue_full": self.shed_full,
+            "shed_busy": self.shed_busy,
+            "queue_depth": self.queue.qsize(),
+            "recent": list(self.recent),
+        }
@@ -0,0 +1,41 @@
+import asyncio
+import time
+import pytest
+
+
+def test_a_failing_batch_fails_its_requests_and_the_worker_keeps_going(backend, monkeypatch):
+    async def run():
+        batcher = backend.MicroBatcher(max_wait_ms=0)
+        row = [120.0, 14, 0.5, 10.0]
+        # A ragged row breaks the whole batch's feature matrix
+        results = await asyncio.gather(batcher.score(row), batcher.score([1.0, 2.0]), return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+        assert 0 <= (await batcher.score(row))[0] <= 1
+
+        class BrokenShadow:
+            def submit(self, *args, **kwargs):
+                raise RuntimeError("shadow queue broken")
+        monkeypatch.setattr(backend, "shadow_scorer", BrokenShadow())
+        assert 0 <= (await batcher.score(row))[0] <= 1  # Already answered before the shadow step failed
+        assert 0 <= (await batcher.score(row))[0] <= 1
+        assert not batcher.worker.done()
+
+    asyncio.run(asyncio.wait_for(run(), 10))  # A hung request fails the test instead of blocking it
+
+
+def test_a_restarted_worker_keeps_the_queued_requests(backend):
+    async def run():
+        batcher = backend.MicroBatcher(max_wait_ms=0)
+        row = [120.0, 14, 0.5, 10.0]
+        await batcher.score(row)
+        batcher.worker.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await batcher.worker
+
+        # Queued while no worker was running
+        waiting = batcher.loop.create_future()
+        batcher.queue.put_nowait((row, waiting, time.perf_counter()))
+        score, _ = await batcher.score(row)
+        assert (await waiting)[0] == score
+
+    asyncio.run(asyncio.wait_for(run(), 10))
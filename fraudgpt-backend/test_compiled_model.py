@@ -0,0 +1,58 @@
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from compiled_model import CompiledModel
+
+FEATURES = ['amount', 'hour_of_day', 'velocity', 'geo_distance']
+
+
+def load_model():
+    model_dict = joblib.load("model.joblib")
+    return model_dict['model'], model_dict['scaler']
+
+
+def test_compiled_model_matches_predict_proba_on_features_csv():
+    model, scaler = load_model()
+    compiled = CompiledModel.from_catboost(model, scaler)
+    X = pd.read_csv("features.csv")[FEATURES].to_numpy(dtype=float)
+    expected = model.predict_proba(scaler.transform(X))[:, 1]
+    assert np.array_equal(compiled.predict(X), expected)
+
+
+def test_compiled_model_matches_predict_proba_at_cut_points():
+    model, scaler = load_model()
+    compiled = CompiledModel.from_catboost(model, scaler)
+    base = np.array([500.0, 12.0, 1.0, 100.0])
+    rows = []
+    for i, cuts in enumerate(compiled.cuts):
+        for cut in cuts:
+            for value in (np.nextafter(cut, -np.inf), cut, np.nextafter(cut, np.inf)):
+                row = base.copy()
+                row[i] = value
+                rows.append(row)
+    X = np.array(rows)
+    expected = model.predict_proba(scaler.transform(X))[:, 1]
+    assert np.array_equal(compiled.predict(X), expected)
+
+
+def test_compiled_model_matches_predict_proba_on_missing_and_infinite_values():
+    model, scaler = load_model()
+    compiled = CompiledModel.from_catboost(model, scaler)
+    base = np.array([500.0, 12.0, 1.0, 100.0])
+    rows = [np.full(4, np.nan)]
+    for i in range(4):
+        row = base.copy()
+        row[i] = np.nan
+        rows.append(row)
+    X = np.array(rows)
+    expected = model.predict_proba(scaler.transform(X))[:, 1]
+    assert np.array_equal(compiled.predict(X), expected)
+
+    for value in (np.inf, -np.inf):
+        row = base.copy()
+        row[0] = value
+        with pytest.raises(ValueError):
+            scaler.transform(row.reshape(1, -1))
+        with pytest.raises(ValueError):
+            compiled.predict(row)
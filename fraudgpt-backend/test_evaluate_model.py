@@ -0,0 +1,17 @@
+import numpy as np
+import pandas as pd
+from sklearn.metrics import precision_score, recall_score
+from evaluate_model import operating_point, threshold_curve
+
+
+def test_curve_matches_sklearn_at_every_threshold():
+    df = pd.read_csv("fraud_scores.csv")
+    y, scores = df['is_fraud'].to_numpy(), df['fraud_score'].to_numpy()
+    curve = threshold_curve(y, scores)
+    assert len(curve) == len(np.unique(scores))
+    for threshold in np.concatenate([curve['threshold'].to_numpy()[::7], [0.3, 0.5, 0.7]]):
+        point = operating_point(curve, threshold)
+        y_pred = scores > threshold
+        assert point['alerts'] == y_pred.sum()
+        assert np.isclose(point['precision'], precision_score(y, y_pred))
+        assert np.isclose(point['recall'], recall_score(y, y_pred))
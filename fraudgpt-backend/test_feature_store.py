@@ -0,0 +1,68 @@
+from datetime import datetime
+import pytest
+from fastapi.testclient import TestClient
+from feature_store import MAX_GEO_DISTANCE_KM, OnlineFeatureStore, haversine_km, resolve_location
+
+
+def test_velocity_and_distance_follow_the_previous_event():
+    store = OnlineFeatureStore(window_seconds=3600)
+    boston, new_york, tokyo = resolve_location("Boston, MA"), resolve_location("New York, NY"), resolve_location("Tokyo, JP")
+    assert store.update("u1", 0, *boston) == {"velocity": 0.0, "geo_distance": 0.0, "txn_count_window": 0, "decayed_txn_count": 1.0}
+
+    derived = store.update("u1", 1800, *new_york)
+    assert derived["velocity"] == 2.0 and derived["txn_count_window"] == 1
+    assert derived["geo_distance"] == pytest.approx(haversine_km(*boston, *new_york))
+    assert store.update("u1", 1801, *tokyo)["velocity"] == 100.0  # Gap clipped to MIN_GAP_HOURS
+    assert store.update("u1", 4000, *tokyo)["geo_distance"] == 0.0
+
+    # A late event gets velocity 0 and leaves the user's clock and position alone
+    late = store.update("u1", 100, *boston)
+    assert late["velocity"] == 0.0 and late["geo_distance"] == MAX_GEO_DISTANCE_KM
+    assert store.users["u1"].last_ts == 4000 and store.update("u1", 4000, *tokyo)["geo_distance"] == 0.0
+    assert store.update("u2", 50, *boston)["velocity"] == 0.0  # Users are independent
+
+
+def test_idle_users_are_evicted_by_event_time():
+    store = OnlineFeatureStore(ttl_seconds=100, max_users=3)
+    store.update("a", 100, 0.0, 0.0)
+    store.update("b", 150, 0.0, 0.0)
+    store.update("a", 120, 0.0, 0.0)  # Now most recently seen, though behind b in event time
+    store.update("c", 225, 0.0, 0.0)
+    assert list(store.users) == ["b", "c"] and store.evicted_ttl == 1
+
+    store.update("b", 140, 0.0, 0.0)  # Late for b: its last event is still at 150
+    store.update("d", 255, 0.0, 0.0)
+    assert list(store.users) == ["c", "d"]
+    for user in "efg":
+        store.update(user, 255, 0.0, 0.0)
+    assert list(store.users) == ["e", "f", "g"] and store.evicted_capacity == 2
+
+
+def test_score_event_derives_features_once_per_id(backend):
+    client = TestClient(backend.app, client=("127.0.0.1", 5000))
+    events = backend.feature_store.events
+
+    def post(**event):
+        response = client.post("/score/event", json={"user_id": "event-test", "amount": 120.0, **event})
+        assert response.status_code == 200
+        return response.json()
+
+    first = post(id="e1", timestamp="2025-07-20T10:00:00+05:30", location="Boston, MA")
+    assert first["features"]["velocity"] == 0.0 and first["features"]["hour_of_day"] == 10
+    second = post(id="e2", timestamp="2025-07-20T10:30:00+05:30", location="New York, NY")
+    assert second["features"]["velocity"] == 2.0
+    assert second["features"]["geo_distance"] == pytest.approx(haversine_km(*resolve_location("Boston, MA"), *resolve_location("New York, NY")))
+
+    retry = post(id="e2", timestamp="2025-07-20T10:30:00+05:30", location="New York, NY")
+    assert retry["duplicate"] and retry["id"] == second["id"] and retry["features"] == second["features"]
+    assert backend.feature_store.events == events + 2
+
+    lat, lon = resolve_location("New York, NY")
+    third = post(id="e3", timestamp="2025-07-20T11:00:00+05:30", latitude=lat, longitude=lon)
+    assert third["features"]["geo_distance"] == 0.0 and third["features"]["txn_count_window"] == 1
+
+    # Without a timestamp the event happens now, in IST
+    before = datetime.now(backend.ist).hour
+    now = post(id="e4")
+    assert now["features"]["hour_of_day"] in {before, datetime.now(backend.ist).hour}
+    assert client.post("/score/event", json={"user_id": "event-test", "amount": 1.0, "timestamp": "yesterday"}).status_code == 422
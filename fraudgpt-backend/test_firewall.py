@@ -0,0 +1,51 @@
+import json
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from firewall import Firewall, FirewallMiddleware
+
+
+def make_app(tmp_path, **rate_limit):
+    config = tmp_path / "firewall_config.json"
+    config.write_text(json.dumps({
+        "whitelist": ["127.0.0.1"],
+        "blacklist": ["203.0.113.0/24"],
+        "rate_limit": {"requests": 3, "window_seconds": 60, **rate_limit},
+        "log_file": str(tmp_path / "firewall_logs.csv"),
+        "reload_interval_seconds": 0,
+    }))
+    firewall = Firewall(str(config))
+    app = FastAPI()
+    app.add_middleware(FirewallMiddleware, firewall=firewall)
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    return app, firewall
+
+
+def statuses(app, host, n):
+    client = TestClient(app, client=(host, 5000))
+    return [client.get("/ping").status_code for _ in range(n)]
+
+
+def test_middleware_decisions(tmp_path):
+    app, firewall = make_app(tmp_path)
+    try:
+        assert statuses(app, "10.0.0.5", 5) == [200, 200, 200, 429, 429]
+        response = TestClient(app, client=("10.0.0.5", 5000)).get("/ping")
+        assert response.status_code == 429 and int(response.headers["retry-after"]) >= 1
+        assert statuses(app, "127.0.0.1", 10) == [200] * 10  # Whitelisted: not rate limited
+        assert statuses(app, "203.0.113.7", 1) == [403]
+        assert TestClient(app).get("/ping").status_code == 403  # TestClient's host "testclient" is not an IP
+        assert firewall.get_stats()["decisions"] == {"ALLOWED": 13, "BLACKLISTED": 1, "RATE_LIMITED": 3, "INVALID_IP": 1}
+    finally:
+        firewall.close()
+
+
+def test_whitelist_can_be_rate_limited(tmp_path):
+    app, firewall = make_app(tmp_path, apply_to_whitelist=True)
+    try:
+        assert statuses(app, "127.0.0.1", 4) == [200, 200, 200, 429]
+    finally:
+        firewall.close()
@@ -0,0 +1,48 @@
+import os
+from gazetteer import GAZETTEER_SOURCE, Gazetteer
+
+
+def test_names_are_normalized_and_unknown_places_miss(tmp_path):
+    gazetteer = Gazetteer(GAZETTEER_SOURCE, str(tmp_path / "places.npy"), cache_path=None)
+    assert gazetteer.lookup("Boston, MA") == (42.3601, -71.0589)
+    assert gazetteer.lookup("  boston ,  Massachusetts ") == (42.3601, -71.0589)
+    assert gazetteer.lookup("São Paulo, Brazil") == gazetteer.lookup("sao paulo") == (-23.5505, -46.6333)
+    assert gazetteer.lookup("Washington, D.C.") == gazetteer.lookup("Washington")
+    assert gazetteer.lookup("Georgia") == (33.0406, -83.6431)  # The state, no city of that name is listed
+    assert gazetteer.lookup("Lake Jennifer, NY") is None
+    assert gazetteer.lookup(None) is None
+
+
+def test_cache_is_preloaded_and_dropped_when_the_table_changes(tmp_path):
+    source = tmp_path / "places.csv"
+    with open(GAZETTEER_SOURCE, encoding="utf-8") as f:
+        source.write_text(f.read(), encoding="utf-8")
+    table, cache = str(tmp_path / "places.npy"), str(tmp_path / "cache.json")
+
+    first = Gazetteer(str(source), table, cache)
+    first.lookup("Tokyo, JP")
+    first.lookup("Lake Jennifer, NY")
+    first.save()
+
+    second = Gazetteer(str(source), table, cache)
+    assert second.preloaded == 1  # Misses are not saved
+    assert second.lookup("Tokyo, JP") == first.lookup("Tokyo, JP")
+    assert second.get_stats()["table_lookups"] == 0
+
+    with open(source, "a", encoding="utf-8") as f:
+        f.write("city,Lake Jennifer,,NY,US,,43.1,-75.2\n")
+    mtime = os.path.getmtime(table) + 1  # Newer than the built table, however coarse the clock
+    os.utime(source, (mtime, mtime))
+    third = Gazetteer(str(source), table, cache)
+    assert third.preloaded == 0
+    assert third.lookup("Lake Jennifer, NY") == (43.1, -75.2)
+
+
+def test_cache_evicts_the_least_recently_used(tmp_path):
+    gazetteer = Gazetteer(GAZETTEER_SOURCE, str(tmp_path / "places.npy"), str(tmp_path / "cache.json"), max_cache_entries=2)
+    for location in ["Boston, MA", "Tokyo, JP", "Boston, MA", "Lake Jennifer, NY", "Paris, France"]:
+        gazetteer.lookup(location)
+    assert list(gazetteer.cache) == ["Lake Jennifer, NY", "Paris, France"]
+    assert gazetteer.get_stats()["evicted"] == 2
+    gazetteer.save()
+    assert list(Gazetteer(GAZETTEER_SOURCE, str(tmp_path / "places.npy"), str(tmp_path / "cache.json")).cache) == ["Paris, France"]
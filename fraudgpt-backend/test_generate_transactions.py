@@ -0,0 +1,35 @@
+import json
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from generate_transactions import COLUMNS, generate
+
+
+def test_output_is_seeded_and_the_same_in_every_format(tmp_path):
+    end = datetime(2025, 7, 20)
+    paths = {name: str(tmp_path / name) for name in ["one.csv", "two.csv", "rows.ndjson", "rows.parquet"]}
+    summary = generate(paths["one.csv"], rows=5000, end=end, seed=7, chunksize=1500, workers=1)
+    generate(paths["two.csv"], rows=5000, end=end, seed=7, chunksize=1500, workers=2)
+    generate(paths["rows.ndjson"], rows=5000, end=end, seed=7, chunksize=1500, workers=2)
+    generate(paths["rows.parquet"], rows=5000, end=end, seed=7, chunksize=1500, workers=2)
+    with open(paths["one.csv"], "rb") as one, open(paths["two.csv"], "rb") as two:
+        assert one.read() == two.read()
+
+    df = pd.read_csv(paths["one.csv"], parse_dates=["timestamp"])
+    assert list(df.columns) == COLUMNS and len(df) == summary["rows"] > 5000
+    assert (df["txn_id"] == np.arange(len(df))).all()
+    with open(paths["rows.ndjson"]) as f:
+        ndjson = pd.DataFrame([json.loads(line) for line in f])
+    parquet = pd.read_parquet(paths["rows.parquet"])
+    for other in (ndjson, parquet):
+        assert (other["device_id"] == df["device_id"]).all()
+        assert np.allclose(other["amount"], df["amount"])
+    assert (pd.to_datetime(ndjson["timestamp"]) == df["timestamp"]).all()
+
+    # Every burst row follows its fraud (or the previous burst row) a minute later on the same user and device
+    burst = df["device_id"].eq(df["device_id"].shift()).to_numpy()
+    assert burst.sum() == summary["bursts"]
+    previous = df.shift()[burst]
+    assert (df[burst]["user_id"] == previous["user_id"]).all()
+    assert (df[burst]["timestamp"] - previous["timestamp"] == pd.Timedelta(minutes=1)).all()
+    assert df[burst]["is_fraud"].all() and (previous["is_fraud"] == 1).all()
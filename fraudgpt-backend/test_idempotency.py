@@ -0,0 +1,61 @@
+import asyncio
+import time
+from idempotency import IdempotencyCache
+
+
+def test_duplicates_share_the_first_result():
+    async def run():
+        cache = IdempotencyCache(ttl_seconds=600, max_entries=2)
+        future, owner = cache.claim("a")
+        duplicate, duplicate_owner = cache.claim("a")
+        assert owner and not duplicate_owner and duplicate is future
+        cache.resolve(future, {"id": 1})
+        assert await asyncio.shield(duplicate) == {"id": 1}
+
+        failed, _ = cache.claim("b")
+        waiter, _ = cache.claim("b")
+        cache.release("b", failed)
+        assert await waiter is None
+        assert cache.claim("b")[1]  # The next attempt scores again
+
+        cache.claim("c")
+        assert "a" not in cache.entries and len(cache) == 2
+
+    asyncio.run(run())
+
+
+def test_expired_ids_are_scored_again():
+    async def run():
+        cache = IdempotencyCache(ttl_seconds=0, max_entries=10)
+        future, _ = cache.claim("a")
+        assert not cache.claim("a")[1]  # Still in flight: never expires under its waiters
+        cache.resolve(future, {"id": 1})
+        assert cache.claim("a")[1]
+
+    asyncio.run(run())
+
+
+def test_expiry_ignores_recent_touches_and_capacity_spares_in_flight_ids(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(time, "monotonic", lambda: clock[0])
+
+    async def run():
+        cache = IdempotencyCache(ttl_seconds=10, max_entries=2)
+        for key, at in [("y", 0), ("x", 8)]:
+            clock[0] = at
+            cache.resolve(cache.claim(key)[0], {"id": key})
+        clock[0] = 9
+        assert not cache.claim("y")[1]  # A duplicate: "y" is now most recently used, behind the fresher "x"
+        clock[0] = 15
+        new, _ = cache.claim("new")
+        assert list(cache.entries) == ["x", "new"] and cache.evicted_ttl == 1
+        cache.resolve(new, {"id": "new"})
+
+        # Over capacity, only scored entries go: in-flight ids keep their single owner
+        in_flight = [cache.claim(key)[0] for key in ["a", "b", "c"]]
+        assert list(cache.entries) == ["a", "b", "c"] and not cache.claim("a")[1]
+        cache.resolve(in_flight[0], {"id": "a"})
+        cache.claim("d")
+        assert list(cache.entries) == ["b", "c", "d"] and cache.evicted_capacity == 3
+
+    asyncio.run(run())
@@ -0,0 +1,45 @@
+import joblib
+import pytest
+from fastapi.testclient import TestClient
+from model_registry import ModelRegistry
+
+
+def write_version(path, version):
+    artifact = joblib.load("model.joblib")
+    artifact['version'] = version
+    joblib.dump(artifact, path)
+
+
+def test_swap_rollback_and_failed_loads(tmp_path):
+    path = str(tmp_path / "model.joblib")
+    write_version(path, "v1")
+    registry = ModelRegistry(path, poll_interval=0)
+    assert registry.reload() and registry.current.version == "v1"
+
+    write_version(path, "v2")
+    assert registry.reload() and registry.current.version == "v2"  # Loaded in a child process
+    assert registry.versions() == ["v1"]
+
+    assert registry.rollback().version == "v1" and registry.pinned
+    write_version(path, "v3")
+    assert not registry.reload()  # Pinned: polling leaves the rollback in place
+    with pytest.raises(ValueError):
+        registry.rollback()
+
+    with open(path, "wb") as f:
+        f.write(b"not a model")
+    assert not registry.reload(force=True)
+    assert registry.current.version == "v1" and registry.failures == 1 and registry.last_error
+
+    write_version(path, "v4")
+    registry.load_timeout = 0.01
+    assert not registry.reload(force=True)
+    assert "timed out" in registry.last_error and registry.current.version == "v1"
+    registry.load_timeout = 120
+    assert registry.reload(force=True) and registry.current.version == "v4" and not registry.pinned
+
+
+def test_rollback_endpoint_without_history(backend):
+    client = TestClient(backend.app, client=("127.0.0.1", 5000))
+    response = client.post("/admin/model/rollback")
+    assert response.status_code == 409
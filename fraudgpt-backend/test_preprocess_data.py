@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+from preprocess_data import FEATURES, compute_features, stream_features
+
+
+def load_features(exact_geodesic):
+    df = compute_features(pd.read_csv("transactions.csv"), exact_geodesic=exact_geodesic)
+    return df[FEATURES + ['is_fraud']].reset_index(drop=True)
+
+
+def test_exact_geodesic_matches_features_csv():
+    with open("features.csv") as f:
+        expected = f.read()
+    assert load_features(exact_geodesic=True).to_csv(index=False) == expected
+
+
+def test_haversine_is_within_half_a_percent_of_geodesic():
+    expected = pd.read_csv("features.csv", float_precision="round_trip")
+    features = load_features(exact_geodesic=False)
+    pd.testing.assert_frame_equal(features.drop(columns='geo_distance'), expected.drop(columns='geo_distance'),
+                                  check_exact=True, check_dtype=False)
+    assert np.allclose(features['geo_distance'], expected['geo_distance'], rtol=0.005, atol=0)
+
+
+def test_stream_mode_produces_the_same_rows(tmp_path):
+    output = tmp_path / "features.csv"
+    stream_features("transactions.csv", str(output), partitions=8, chunksize=2000, workers=2,
+                    exact_geodesic=True, spill_dir=str(tmp_path))
+    columns = FEATURES + ['is_fraud']
+    actual = pd.read_csv(output, float_precision="round_trip").sort_values(columns).reset_index(drop=True)
+    expected = pd.read_csv("features.csv", float_precision="round_trip").sort_values(columns).reset_index(drop=True)
+    pd.testing.assert_frame_equal(actual, expected, check_exact=True)
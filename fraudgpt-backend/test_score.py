@@ -0,0 +1,62 @@
+import json
+from fastapi.testclient import TestClient
+from analytics import QuantileSketch
+
+ROW = '{"amount": %s, "hour_of_day": 14, "velocity": 0.5, "geo_distance": 10.0}'
+
+
+def post_json(client, path, body):
+    return client.post(path, content=body, headers={"content-type": "application/json"})
+
+
+def test_sketch_skips_non_finite_values():
+    sketch = QuantileSketch()
+    for value in [float("nan"), float("inf"), 10.0, -float("inf")]:
+        sketch.add(value)
+    assert sketch.count == 1 and abs(sketch.quantile(0.5) - 10.0) <= 0.1
+
+
+def test_non_finite_features_are_rejected(backend):
+    client = TestClient(backend.app, client=("127.0.0.1", 5000))
+    assert post_json(client, "/score", ROW % "120.0").status_code == 200
+    for value in ["NaN", "Infinity", "-Infinity", "1e999"]:
+        assert post_json(client, "/score", ROW % value).status_code == 422
+        event = '{"user_id": "nan-test", "amount": %s}' % value
+        assert post_json(client, "/score/event", event).status_code == 422
+
+
+def test_batch_formats_and_errors(backend, monkeypatch):
+    client = TestClient(backend.app, client=("127.0.0.1", 5000))
+    rows = [{"amount": 120.0, "hour_of_day": 14, "velocity": 0.5, "geo_distance": 10.0},
+            {"amount": 9000.0, "hour_of_day": 2, "velocity": 8.0, "geo_distance": 1200.0}]
+    by_rows = client.post("/score/batch?broadcast=false", json=rows).json()
+    columnar = {col: [row[col] for row in rows] for col in rows[0]}
+    by_columns = client.post("/score/batch?broadcast=false", json=columnar).json()
+    ndjson = "\n".join(json.dumps(row) for row in rows)
+    by_lines = client.post("/score/batch?broadcast=false", content=ndjson, headers={"content-type": "application/x-ndjson"}).json()
+    for response in (by_rows, by_columns, by_lines):
+        assert response["count"] == 2
+        assert [r["transaction"] for r in response["results"]] == rows
+        assert [r["fraud_score"] for r in response["results"]] == [r["fraud_score"] for r in by_rows["results"]]
+
+    assert client.post("/score/batch", json={"amount": [1.0]}).status_code == 400
+    assert post_json(client, "/score/batch", "not json").status_code == 400
+    assert client.post("/score/batch", json=[rows[0], {"amount": 1.0}]).status_code == 422
+    for value in ["NaN", "Infinity"]:
+        assert post_json(client, "/score/batch", "[%s]" % ROW % value).status_code == 422
+    monkeypatch.setattr(backend, "MAX_BATCH_SIZE", 1)
+    assert client.post("/score/batch", json=rows).status_code == 413
+
+
+def test_websockets_replay_the_latest_payloads(backend):
+    client = TestClient(backend.app, client=("127.0.0.1", 5000))
+    rows = [{"amount": 50.0 + i, "hour_of_day": 14, "velocity": 0.5, "geo_distance": 10.0} for i in range(3)]
+    rows.append({"amount": 9000.0, "hour_of_day": 2, "velocity": 8.0, "geo_distance": 1200.0})
+    responses = [client.post("/score", json=row).json() for row in rows]
+    ids = [r["id"] for r in responses]
+    assert responses[-1]["fraud_score"] > backend.FRAUD_THRESHOLD
+
+    with client.websocket_connect("/ws/all?replay=2") as ws:
+        assert [ws.receive_json()["id"] for _ in range(2)] == ids[-2:]
+    with client.websocket_connect("/ws/fraud-only?replay=1") as ws:
+        assert ws.receive_json()["id"] == ids[-1]
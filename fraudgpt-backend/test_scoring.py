@@ -0,0 +1,38 @@
+import itertools
+import math
+import numpy as np
+import pandas as pd
+from scoring import FEATURE_COLUMNS, FraudExplainer
+
+
+def test_explain_batch_matches_row_by_row():
+    explainer = FraudExplainer()
+    recorded = pd.read_csv("features.csv")[FEATURE_COLUMNS].to_numpy(dtype=float)
+
+    # Every threshold, just either side of it, NaN and out-of-range or fractional hours
+    def around(cuts):
+        return [0.0, np.nan] + [cut + delta for cut in cuts for delta in (-1e-9, 0, 1e-9)]
+    edges = np.array(list(itertools.product(
+        around(explainer.amount_cuts), [-1, 0, 5.5, 8, 12, 21, 23, 24, np.nan],
+        around(explainer.velocity_cuts), around(explainer.distance_cuts))))
+    features = np.vstack([recorded, edges])
+
+    rng = np.random.default_rng(0)
+    scores = rng.random(len(features))
+    flagged = rng.random(len(features)) < 0.7
+    batch = explainer.explain_batch(features, scores, flagged)
+
+    assert len(batch) == len(features) > 20_000
+    for (amt, hr, vel, dist), score, is_flagged, result in zip(features.tolist(), scores.tolist(), flagged.tolist(), batch):
+        hr = int(hr) if math.isfinite(hr) and hr == int(hr) else hr
+        txn = {'amount': amt, 'hour_of_day': hr, 'velocity': vel, 'geo_distance': dist}
+        assert result == explainer.generate_comprehensive_explanation(txn, score, is_flagged)
+
+
+def test_numpy_hours_are_classified_like_ints():
+    explainer = FraudExplainer()
+    txn = {'amount': 100.0, 'velocity': 0.0, 'geo_distance': 0.0}
+    expected = explainer.generate_comprehensive_explanation({**txn, 'hour_of_day': 2}, 0.9, True)
+    assert 'timing' in expected['factors_analyzed']
+    for hour in (np.int64(2), np.int32(2)):
+        assert explainer.generate_comprehensive_explanation({**txn, 'hour_of_day': hour}, 0.9, True) == expected
@@ -0,0 +1,48 @@
+import json
+import os
+from txn_store import TransactionStore
+
+SEVERITIES = ['LOW', 'MEDIUM', 'HIGH', 'CRITICAL']
+
+
+def fill(store: TransactionStore, n: int):
+    for i in range(n):
+        severity = SEVERITIES[i % 4]
+        store.append(json.dumps({"id": i, "severity": severity}), severity, severity != 'LOW')
+    store.close()
+
+
+def test_paged_queries_match_a_scan(tmp_path):
+    fill(TransactionStore(str(tmp_path), segment_bytes=512, flush_interval=0.01), 500)
+    store = TransactionStore(str(tmp_path), segment_bytes=512, flush_interval=0.01)
+    assert len(store.segments) > 1
+
+    ids, before = [], None
+    while True:
+        rows, before = store.query(flagged=True, before=before, limit=33)
+        ids += [json.loads(payload)["id"] for _, payload in rows]
+        if before is None:
+            break
+    assert ids == [i for i in reversed(range(500)) if i % 4]
+
+    rows, _ = store.query(severity='HIGH', flagged=True, limit=1000)
+    assert [json.loads(p)["id"] for _, p in rows] == [i for i in reversed(range(500)) if i % 4 == 2]
+    assert store.query(since=store.times[-1] + 1)[0] == []
+    store.close()
+
+
+def test_recovery_drops_torn_tail(tmp_path):
+    fill(TransactionStore(str(tmp_path), segment_bytes=512, flush_interval=0.01), 100)
+    last = sorted(name for name in os.listdir(tmp_path) if name.endswith('.ndjson'))[-1]
+    with open(tmp_path / last, 'ab') as f:
+        f.write(b'{"id": 100, "sev')
+    with open(tmp_path / last.replace('.ndjson', '.idx'), 'ab') as f:
+        f.write(b'\x00' * 5)
+
+    store = TransactionStore(str(tmp_path), segment_bytes=512, flush_interval=0.01)
+    assert store.count == 100
+    store.append(json.dumps({"id": 100}), 'LOW', False)
+    store.close()
+    reopened = TransactionStore(str(tmp_path), segment_bytes=512, flush_interval=0.01)
+    assert [json.loads(p)["id"] for p in reopened.recent(3)] == [98, 99, 100]
+    reopened.close()
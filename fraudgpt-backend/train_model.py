@@ -1,44 +1,251 @@
+import argparse
+import itertools
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
 import pandas as pd
 from catboost import CatBoostClassifier
+from sklearn.metrics import average_precision_score, precision_recall_curve
 from sklearn.preprocessing import StandardScaler
 import joblib
+from compiled_model import CompiledModel
+from pipeline_io import read_table, write_table
 
-# Load features
-input_path = "features.csv"
-output_model_path = "model.joblib"
-output_scores_path = "fraud_scores.csv"
-df = pd.read_csv(input_path)
-
-# Features and labels
-features = ['amount', 'hour_of_day', 'velocity', 'geo_distance']
-X = df[features]
-y = df['is_fraud']
-
-# Scale features
-scaler = StandardScaler()
-X_scaled = scaler.fit_transform(X)
-X_scaled = pd.DataFrame(X_scaled, columns=features)
-
-# Train CatBoost
-cat = CatBoostClassifier(
-    iterations=30,
-    depth=2,
-    learning_rate=0.05,
-    l2_leaf_reg=7.0,
-    auto_class_weights='Balanced',
-    random_seed=42,
-    verbose=0
-)
-cat.fit(X_scaled, y)
-
-# Predict fraud scores
-fraud_scores = cat.predict_proba(X_scaled)[:, 1]
-
-# Save results
-df['fraud_score'] = fraud_scores
-df.to_csv(output_scores_path, index=False)
-print(f"Fraud scores saved to {output_scores_path}")
-
-# Save model and scaler
-joblib.dump({'model': cat, 'scaler': scaler}, output_model_path)
-print(f"Model and scaler saved to {output_model_path}")
\ No newline at end of file
+FEATURES = ['amount', 'hour_of_day', 'velocity', 'geo_distance']
+
+# The production configuration, used when no search is requested
+DEFAULT_PARAMS = {'iterations': 30, 'depth': 2, 'learning_rate': 0.05, 'l2_leaf_reg': 7.0}
+
+# Candidate values for --search grid (every combination) and --search random (sampled)
+SEARCH_SPACE = {
+    'iterations': [30, 100, 300],
+    'depth': [2, 4, 6],
+    'learning_rate': [0.03, 0.05, 0.1],
+    'l2_leaf_reg': [3.0, 7.0, 15.0],
+}
+
+LATENCY_SAMPLES = 200  # Single-transaction predictions timed per fold
+
+
+def make_model(params: Dict[str, Any], thread_count: int = -1) -> CatBoostClassifier:
+    return CatBoostClassifier(
+        **params,
+        auto_class_weights='Balanced',
+        random_seed=42,
+        thread_count=thread_count,
+        allow_writing_files=False,
+        verbose=0
+    )
+
+
+def time_ordered_folds(n_rows: int, n_folds: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """Forward-chaining splits over rows already in time order.
+
+    The rows are cut into ``n_folds + 1`` consecutive blocks; fold k trains on
+    blocks 0..k and validates on block k + 1, so a model never sees the future.
+    """
+    bounds = np.linspace(0, n_rows, n_folds + 2).astype(int)
+    return [(np.arange(0, bounds[k + 1]), np.arange(bounds[k + 1], bounds[k + 2])) for k in range(n_folds)]
+
+
+def cache_folds(X: np.ndarray, y: np.ndarray, folds: List[Tuple[np.ndarray, np.ndarray]], cache_dir: str) -> List[str]:
+    """Scale each fold on its own training rows and save it once as .npz, so workers only load it."""
+    paths = []
+    for k, (train_idx, val_idx) in enumerate(folds):
+        scaler = StandardScaler().fit(X[train_idx])
+        path = os.path.join(cache_dir, f"fold-{k}.npz")
+        np.savez(path, X_train=scaler.transform(X[train_idx]), y_train=y[train_idx],
+                 X_val_raw=X[val_idx], y_val=y[val_idx],
+                 mean=scaler.mean_, scale=scaler.scale_, var=scaler.var_)
+        paths.append(path)
+    return paths
+
+
+def recall_at_precision(y_true: np.ndarray, scores: np.ndarray, min_precision: float) -> float:
+    precision, recall, _ = precision_recall_curve(y_true, scores)
+    reachable = recall[precision >= min_precision]
+    return float(reachable.max()) if len(reachable) else 0.0
+
+
+def serving_latency_us(model: CatBoostClassifier, scaler: StandardScaler, X_raw: np.ndarray) -> Tuple[str, float]:
+    """Median time to score one transaction the way backend.py serves it (compiled table if possible)."""
+    try:
+        compiled = CompiledModel.from_catboost(model, scaler)
+        engine = 'compiled'
+        predict = compiled.predict
+    except ValueError:
+        engine = 'catboost'
+
+        def predict(features):
+            return model.predict_proba(scaler.transform(features))[:, 1]
+    samples = []
+    for row in X_raw[:LATENCY_SAMPLES]:
+        features = row.reshape(1, -1)
+        start = time.perf_counter()
+        predict(features)
+        samples.append(time.perf_counter() - start)
+    return engine, float(np.median(samples) * 1e6)
+
+
+def evaluate_candidate(candidate: int, params: Dict[str, Any], fold: int, fold_path: str, thread_count: int,
+                       min_precision: float) -> Dict[str, Any]:
+    """Fit one candidate on one fold and score its validation block (runs in a worker process)."""
+    data = np.load(fold_path)
+    scaler = StandardScaler()
+    scaler.mean_, scaler.scale_, scaler.var_ = data['mean'], data['scale'], data['var']
+    scaler.n_features_in_ = len(FEATURES)
+    model = make_model(params, thread_count)
+    start = time.perf_counter()
+    model.fit(data['X_train'], data['y_train'])
+    fit_seconds = time.perf_counter() - start
+    y_val = data['y_val']
+    scores = model.predict_proba(scaler.transform(data['X_val_raw']))[:, 1]
+    engine, latency_us = serving_latency_us(model, scaler, data['X_val_raw'])
+    return {
+        "candidate": candidate,
+        "fold": fold,
+        "fit_seconds": fit_seconds,
+        "pr_auc": float(average_precision_score(y_val, scores)),
+        "recall_at_precision": recall_at_precision(y_val, scores, min_precision),
+        "latency_us": latency_us,
+        "engine": engine,
+        "scores": scores,
+    }
+
+
+def candidate_params(search: str, n_candidates: int, seed: int) -> List[Dict[str, Any]]:
+    names = list(SEARCH_SPACE)
+    grid = [dict(zip(names, values)) for values in itertools.product(*(SEARCH_SPACE[n] for n in names))]
+    if search == 'random' and n_candidates < len(grid):
+        grid = random.Random(seed).sample(grid, n_candidates)
+    if DEFAULT_PARAMS not in grid:
+        grid.insert(0, dict(DEFAULT_PARAMS))  # Always compare against production
+    return grid
+
+
+def run_search(X: np.ndarray, y: np.ndarray, candidates: List[Dict[str, Any]], n_folds: int, workers: int,
+               min_precision: float) -> Tuple[pd.DataFrame, Dict[int, np.ndarray], np.ndarray]:
+    """Cross-validate every candidate across a process pool.
+
+    Returns one summary row per candidate, each candidate's out-of-fold scores
+    and the row indices those scores belong to.
+    """
+    folds = time_ordered_folds(len(X), n_folds)
+    # Split the cores between concurrent fits instead of letting each CatBoost use all of them
+    thread_count = max(1, (os.cpu_count() or 1) // workers)
+    with tempfile.TemporaryDirectory(prefix="train-folds-") as cache_dir:
+        fold_paths = cache_folds(X, y, folds, cache_dir)
+        tasks = [(c, params, k, fold_paths[k], thread_count, min_precision)
+                 for c, params in enumerate(candidates) for k in range(n_folds)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(evaluate_candidate, *zip(*tasks)))
+
+    oof_index = np.concatenate([val_idx for _, val_idx in folds])
+    rows = []
+    oof_scores = {}
+    for c, params in enumerate(candidates):
+        runs = sorted((r for r in results if r["candidate"] == c), key=lambda r: r["fold"])
+        oof_scores[c] = np.concatenate([r["scores"] for r in runs])
+        rows.append({
+            "candidate": c,
+            **params,
+            "pr_auc": np.mean([r["pr_auc"] for r in runs]),
+            "recall_at_precision": np.mean([r["recall_at_precision"] for r in runs]),
+            "fit_seconds": sum(r["fit_seconds"] for r in runs),
+            "latency_us": float(np.median([r["latency_us"] for r in runs])),
+            "engine": runs[0]["engine"],
+        })
+    return pd.DataFrame(rows), oof_scores, oof_index
+
+
+def select_candidate(summary: pd.DataFrame, latency_budget_us: Optional[float]) -> Optional[int]:
+    """Best PR-AUC (then recall at precision) among candidates within the latency budget."""
+    eligible = summary if latency_budget_us is None else summary[summary["latency_us"] <= latency_budget_us]
+    if eligible.empty:
+        return None
+    best = eligible.sort_values(["pr_auc", "recall_at_precision", "latency_us"], ascending=[False, False, True])
+    return int(best.iloc[0]["candidate"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the CatBoost fraud model.")
+    parser.add_argument("--input", default="features.csv", help="Features table (.csv, .parquet or .feather).")
+    parser.add_argument("--model-output", default="model.joblib")
+    parser.add_argument("--scores-output", default="fraud_scores.csv",
+                        help="Scored table; .parquet or .feather store compact dtypes.")
+    parser.add_argument("--search", choices=["grid", "random"], default=None,
+                        help="Cross-validate candidates from SEARCH_SPACE and train the best one.")
+    parser.add_argument("--candidates", type=int, default=20, help="Candidates sampled by --search random.")
+    parser.add_argument("--folds", type=int, default=4, help="Time-ordered CV folds.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Concurrent CatBoost fits.")
+    parser.add_argument("--min-precision", type=float, default=0.5, help="Precision for the recall-at-precision metric.")
+    parser.add_argument("--latency-budget-us", type=float, default=None,
+                        help="Only select candidates whose median single-transaction serving latency fits this budget.")
+    parser.add_argument("--time-column", default="timestamp",
+                        help="Column giving event time for CV ordering; required by --search.")
+    parser.add_argument("--search-results", default="search_results.csv", help="Per-candidate CV metrics.")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    # Load features
+    input_path = args.input
+    output_model_path = args.model_output
+    output_scores_path = args.scores_output
+    df = read_table(input_path)
+
+    params = dict(DEFAULT_PARAMS)
+    oof = None
+    if args.search:
+        # preprocess_data.py writes rows grouped by user, so file order would leak each
+        # user's later transactions into the folds that validate their earlier ones
+        if args.time_column not in df.columns:
+            raise SystemExit(f"❌ --search needs a '{args.time_column}' column in {input_path} to order its CV folds by time; "
+                             f"rebuild it with `python preprocess_data.py --with-timestamp`")
+        df = df.sort_values(args.time_column, kind='stable').reset_index(drop=True)
+        candidates = candidate_params(args.search, args.candidates, args.seed)
+        print(f"Cross-validating {len(candidates)} candidates x {args.folds} folds on {args.workers} workers")
+        summary, oof_scores, oof_index = run_search(df[FEATURES].to_numpy(dtype=float), df['is_fraud'].to_numpy(),
+                                                    candidates, args.folds, args.workers, args.min_precision)
+        summary.to_csv(args.search_results, index=False)
+        print(summary.sort_values("pr_auc", ascending=False).to_string(index=False))
+        print(f"Search results saved to {args.search_results}")
+        best = select_candidate(summary, args.latency_budget_us)
+        if best is None:
+            raise SystemExit(f"No candidate meets the {args.latency_budget_us} us latency budget")
+        params = candidates[best]
+        oof = (oof_index, oof_scores[best])
+        print(f"Selected candidate {best}: {params}")
+
+    # Features and labels
+    X = df[FEATURES]
+    y = df['is_fraud']
+
+    # Scale features
+    scaler = StandardScaler()
+    X_scaled = scaler.fit_transform(X)
+    X_scaled = pd.DataFrame(X_scaled, columns=FEATURES)
+
+    # Train CatBoost
+    cat = make_model(params)
+    cat.fit(X_scaled, y)
+
+    if oof is None:
+        # Predict fraud scores (in-sample)
+        df['fraud_score'] = cat.predict_proba(X_scaled)[:, 1]
+    else:
+        # Out-of-fold scores; the first time block is only ever trained on, so it is left out
+        oof_index, scores = oof
+        df = df.iloc[oof_index].copy()
+        df['fraud_score'] = scores
+
+    # Save results
+    write_table(df, output_scores_path)
+    print(f"Fraud scores saved to {output_scores_path}")
+
+    # Save model and scaler
+    joblib.dump({'model': cat, 'scaler': scaler}, output_model_path)
+    print(f"Model and scaler saved to {output_model_path}")
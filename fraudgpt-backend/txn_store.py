@@ -0,0 +1,262 @@
+import atexit
+import logging
+import os
+import struct
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from threading import Condition, Lock, Thread
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SEVERITY_CODES = {"LOW": 0, "MEDIUM": 1, "HIGH": 2, "CRITICAL": 3}
+# Index entry per record: stored-at time, severity code, is_flagged, offset and length in the segment
+INDEX_RECORD = struct.Struct('<dBBII')
+
+
+class Segment:
+    """One data file of newline-delimited records plus its fixed-width index file."""
+
+    def __init__(self, directory: str, number: int):
+        self.number = number
+        self.data_path = os.path.join(directory, f"segment-{number:06d}.ndjson")
+        self.index_path = os.path.join(directory, f"segment-{number:06d}.idx")
+        self.data = open(self.data_path, 'ab')
+        self.index = open(self.index_path, 'ab')
+        self.size = self.data.tell()
+        self.reader = os.open(self.data_path, os.O_RDONLY)
+
+    def close(self):
+        self.data.close()
+        self.index.close()
+        os.close(self.reader)
+
+
+class TransactionStore:
+    """Embedded append-only store of scored transaction payloads.
+
+    ``append`` only adds the encoded payload to an in-memory write-ahead
+    buffer. A background thread drains the buffer every ``flush_interval``
+    seconds (or sooner once ``flush_records`` are waiting), appends the
+    records to the current segment, fsyncs once per batch and then publishes
+    them to the in-memory indexes, so queries only ever see durable records.
+    Segments roll over at ``segment_bytes``; their index files make startup
+    recovery a sequential read of fixed-width entries instead of a JSON scan.
+
+    Records are numbered in arrival order. Secondary indexes keep the record
+    numbers per severity and for flagged records; since every list is in
+    arrival order, time filters are binary searches over stored-at times.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = 64 * 1024 * 1024, flush_interval: float = 0.05,
+                 flush_records: int = 1024, fsync: bool = True):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.flush_interval = flush_interval
+        self.flush_records = flush_records
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+
+        # Per-record columns, indexed by record number
+        self.times = array('d')
+        self.severities = array('B')
+        self.flagged = array('B')
+        self.segment_numbers = array('I')
+        self.offsets = array('I')
+        self.lengths = array('I')
+        # Secondary indexes: record numbers in arrival order
+        self.flagged_index = array('Q')
+        self.severity_index: Dict[int, array] = {code: array('Q') for code in SEVERITY_CODES.values()}
+        self.segments: Dict[int, Segment] = {}
+        self.count = 0  # Records visible to queries
+
+        self._buffer: List[Tuple[bytes, float, int, int]] = []
+        self._cond = Condition(Lock())
+        self._index_lock = Lock()
+        self._closed = False
+        self.appended = 0
+        self.flushes = 0
+        self.fsync_ms_total = 0.0
+
+        self._recover()
+        self._thread = Thread(target=self._run, name="txn-store-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _recover(self):
+        numbers = sorted(int(name[8:14]) for name in os.listdir(self.directory)
+                         if name.startswith('segment-') and name.endswith('.ndjson'))
+        for number in numbers:
+            segment = Segment(self.directory, number)
+            self.segments[number] = segment
+            with open(segment.index_path, 'rb') as f:
+                entries = f.read()
+            valid = end = 0
+            for ts, severity, flagged, offset, length in INDEX_RECORD.iter_unpack(
+                    entries[:len(entries) - len(entries) % INDEX_RECORD.size]):
+                if offset + length > segment.size:
+                    break  # Torn write at the tail: data never made it to disk
+                self._index_record(ts, severity, flagged, number, offset, length)
+                valid += 1
+                end = offset + length
+            # Drop whatever a crash left past the last complete record
+            if valid * INDEX_RECORD.size != len(entries):
+                segment.index.truncate(valid * INDEX_RECORD.size)
+            if segment.size != end:
+                segment.data.truncate(end)
+                segment.size = end
+        if not self.segments:
+            self.segments[1] = Segment(self.directory, 1)
+        self.current = self.segments[max(self.segments)]
+        if self.count:
+            logger.info(f"✅ Recovered {self.count} stored transactions from {len(self.segments)} segments.")
+
+    def _index_record(self, ts: float, severity: int, flagged: int, segment: int, offset: int, length: int):
+        seq = self.count
+        self.times.append(ts)
+        self.severities.append(severity)
+        self.flagged.append(flagged)
+        self.segment_numbers.append(segment)
+        self.offsets.append(offset)
+        self.lengths.append(length)
+        if flagged:
+            self.flagged_index.append(seq)
+        self.severity_index[severity].append(seq)
+        self.count = seq + 1
+
+    def append(self, message: str, severity: str, is_flagged: bool):
+        """Buffer one encoded payload; never blocks on disk."""
+        record = (message.encode('utf-8') + b'\n', time.time(), SEVERITY_CODES.get(severity, 0), int(is_flagged))
+        with self._cond:
+            self._buffer.append(record)
+            self.appended += 1
+            if len(self._buffer) >= self.flush_records:
+                self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._buffer and not self._closed:
+                    self._cond.wait(self.flush_interval)
+                batch, self._buffer = self._buffer, []
+                closed = self._closed
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    logger.error(f"❌ Error writing transaction store segment: {e}")
+            if closed and not batch:
+                return
+
+    def _write(self, batch: List[Tuple[bytes, float, int, int]]):
+        entries = []
+        segment = self.current
+        data = []
+        for line, ts, severity, flagged in batch:
+            if segment.size and segment.size + len(line) > self.segment_bytes:
+                self._flush_segment(segment, data, entries)
+                segment = Segment(self.directory, segment.number + 1)
+                self.segments[segment.number] = self.current = segment
+                data, entries = [], []
+            # Keep stored-at times non-decreasing so time filters can bisect
+            if self.count or entries:
+                ts = max(ts, entries[-1][0] if entries else self.times[self.count - 1])
+            entries.append((ts, severity, flagged, segment.size, len(line)))
+            data.append(line)
+            segment.size += len(line)
+        self._flush_segment(segment, data, entries)
+
+    def _flush_segment(self, segment: Segment, data: List[bytes], entries: List[tuple]):
+        if not data:
+            return
+        segment.data.write(b''.join(data))
+        segment.data.flush()
+        segment.index.write(b''.join(INDEX_RECORD.pack(*entry) for entry in entries))
+        segment.index.flush()
+        if self.fsync:
+            started = time.perf_counter()
+            os.fsync(segment.data.fileno())
+            os.fsync(segment.index.fileno())
+            self.fsync_ms_total += (time.perf_counter() - started) * 1000
+        self.flushes += 1
+        with self._index_lock:
+            for entry in entries:
+                self._index_record(entry[0], entry[1], entry[2], segment.number, entry[3], entry[4])
+
+    def _read(self, seq: int) -> bytes:
+        segment = self.segments[self.segment_numbers[seq]]
+        return os.pread(segment.reader, self.lengths[seq] - 1, self.offsets[seq])
+
+    def query(self, flagged: Optional[bool] = None, severity: Optional[str] = None, since: Optional[float] = None,
+              until: Optional[float] = None, before: Optional[int] = None, limit: int = 100) -> Tuple[List[Tuple[int, bytes]], Optional[int]]:
+        """Newest-first page of (record number, encoded payload).
+
+        ``since``/``until`` are epoch seconds of when records were stored;
+        ``before`` is the cursor returned by the previous page. The second
+        return value is the cursor for the next page, or None at the end.
+        """
+        with self._index_lock:
+            count = self.count
+        if severity is not None:
+            candidates = self.severity_index[SEVERITY_CODES[severity]]
+        elif flagged:
+            candidates = self.flagged_index
+        else:
+            candidates = None  # Every record: record number == position
+
+        def position(seq_bound: int) -> int:
+            return seq_bound if candidates is None else bisect_left(candidates, seq_bound)
+
+        def time_position(ts: float, side) -> int:
+            if candidates is None:
+                return side(self.times, ts, 0, count)
+            return side(candidates, ts, 0, position(count), key=lambda seq: self.times[seq])
+
+        hi = position(count)
+        if before is not None:
+            hi = min(hi, position(before))
+        if until is not None:
+            hi = min(hi, time_position(until, bisect_right))
+        lo = time_position(since, bisect_left) if since is not None else 0
+
+        results = []
+        i = hi - 1
+        while i >= lo and len(results) < limit:
+            seq = i if candidates is None else candidates[i]
+            i -= 1
+            if flagged is not None and bool(self.flagged[seq]) != flagged:
+                continue
+            results.append((seq, self._read(seq)))
+        next_cursor = results[-1][0] if results and i >= lo else None
+        return results, next_cursor
+
+    def recent(self, n: int, flagged_only: bool = False) -> List[bytes]:
+        """The last ``n`` stored payloads, oldest first (for replay)."""
+        rows, _ = self.query(flagged=True if flagged_only else None, limit=n)
+        return [payload for _, payload in reversed(rows)]
+
+    def close(self):
+        """Flush buffered records and close the segments."""
+        if self._closed:
+            return
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(5.0)
+        for segment in self.segments.values():
+            segment.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            buffered = len(self._buffer)
+        return {
+            "records": self.count,
+            "buffered": buffered,
+            "appended": self.appended,
+            "flushes": self.flushes,
+            "fsync_ms_total": round(self.fsync_ms_total, 3),
+            "segments": len(self.segments),
+            "flagged": len(self.flagged_index),
+            "by_severity": {name: len(self.severity_index[code]) for name, code in SEVERITY_CODES.items()},
+        }